@@ -1,32 +1,63 @@
 import re
-from fastapi import FastAPI
+import json
+import time
+import secrets
+import asyncio
+from typing import Optional
+from contextlib import aclosing, asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import AIMessage
 from pathlib import Path
 
 
 from utils.prompt import SYSTEM_PROMPT
-from rag_handler import query_all_top3, load_vectordbs
-from web_search_handler import query_web
-from news_handler import query_news, is_news_queury
-from sensitive_handler import is_sensitive, send_admin_email
+from rag_handler import (
+    SCORE_THRESHOLD, answer_retrieved, retrieval_top_score, retrieve_for_answer, stream_query_all_top3,
+    vector_registry,
+)
+from web_search_handler import query_web_async, astream_web, web_response_cache
+from news_handler import query_news_async, astream_news, news_response_cache
+from sensitive_handler import get_admin_outbox, send_admin_email
+from router_handler import route_query_async
+from utils.llm import ainvoke_with_timeout, get_chat_llm
+from utils.history import prepare_history
+from utils.sessions import ChatEvent, ChatState, Session, SessionConflict, session_store
+from utils.metrics import MetricsMiddleware, registry as metrics_registry, route_total, span
+from utils.profiler import PROFILER_ENABLED, profiler
 import os
 
-application = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the vector stores once for the lifetime of the process
+    vector_registry.load()
+    get_admin_outbox().start()
+    if PROFILER_ENABLED:
+        profiler.start()
+    yield
+    profiler.stop()
+    get_admin_outbox().stop()
+
+
+application = FastAPI(lifespan=lifespan)
 application.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Session-Id"],
 )
+application.add_middleware(MetricsMiddleware)
 
 class UserQuery(BaseModel):
     query: str
+    # Conversation state is kept server-side under session_id; chat_history is only read from
+    # older clients that do not send one
+    session_id: Optional[str] = None
     chat_history: list = []
     user_name: str = None
     user_email: str = None
@@ -42,13 +73,76 @@ async def serve_frontend():
         return "<h1>Error: templates/index.html not found</h1>"
 
 
-llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0)  # or your preferred LLM
+@application.get("/health")
+async def health_endpoint():
+    return {
+        **vector_registry.health(),
+        "sessions": session_store.stats(),
+        "outbox": get_admin_outbox().stats(),
+        "response_caches": {"news": news_response_cache.stats(), "web": web_response_cache.stats()},
+    }
 
-def extract_name_email_llm(text: str):
-    """
-    Ask LLM to extract name and email from user text.
-    Returns (name, email) or (None, None)
-    """
+
+@application.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text format: per-stage latency histograms, routes, cache hits, LLM tokens and errors."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
+# The /debug and /vectorstores/reload endpoints expose stacks and control the process: they exist
+# only when ADMIN_TOKEN is set, and then require it in the X-Admin-Token header
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@application.post("/vectorstores/reload", dependencies=[Depends(require_admin_token)])
+async def reload_vectorstores_endpoint():
+    """Explicitly reopen the vector stores, e.g. after an out-of-band index rebuild."""
+    # Opening Chroma blocks; other requests keep being served from the current stores meanwhile
+    await asyncio.to_thread(vector_registry.reload)
+    return vector_registry.health()
+
+
+class ProfilerToggle(BaseModel):
+    enabled: bool
+    interval_seconds: float = None
+    reset: bool = False
+
+
+@application.get("/debug/profiler", dependencies=[Depends(require_admin_token)])
+async def profiler_report_endpoint(limit: int = 20):
+    return profiler.report(limit)
+
+
+@application.get(
+    "/debug/profiler/collapsed", response_class=PlainTextResponse, dependencies=[Depends(require_admin_token)]
+)
+async def profiler_collapsed_endpoint():
+    """Sampled stacks in collapsed format (flamegraph.pl, speedscope)."""
+    return profiler.collapsed()
+
+
+@application.post("/debug/profiler", dependencies=[Depends(require_admin_token)])
+async def profiler_toggle_endpoint(data: ProfilerToggle):
+    """Switch the sampling profiler on or off without a restart."""
+    if data.reset:
+        profiler.reset()
+    if data.enabled:
+        profiler.start(data.interval_seconds)
+    else:
+        profiler.stop()
+    return profiler.report(limit=0)
+
+
+llm = get_chat_llm(model="gpt-4o-mini", temperature=0)  # or your preferred LLM
+
+def name_email_prompt(text: str) -> str:
     prompt = f"""
     You are an assistant that extracts a person's name and email from text.
     
@@ -71,14 +165,16 @@ def extract_name_email_llm(text: str):
     4. If you cannot find name or email, use null.
     Text: "{text}"
     """
-    response = llm.invoke(prompt)
+    return prompt
+
+
+def parse_name_email(response):
     # LLM might return string or AIMessage
     if isinstance(response, AIMessage):
         content = response.content
     else:
         content = str(response)
     # Try to parse JSON safely
-    import json
     try:
         data = json.loads(content)
         name = data.get("name")
@@ -89,72 +185,427 @@ def extract_name_email_llm(text: str):
         return None, None
 
 
+def extract_name_email_llm(text: str):
+    """
+    Ask LLM to extract name and email from user text.
+    Returns (name, email) or (None, None)
+    """
+    return parse_name_email(llm.invoke(name_email_prompt(text)))
 
-@application.post("/chat")
-async def chat_endpoint(data: UserQuery):
-    user_query = data.query
-    chat_history = data.chat_history or []
 
-    previous_ai_message = chat_history[-1].get("AI") if chat_history else None
-    previous_was_sensitive = (
-        previous_ai_message == "Sensitive query detected. Please provide your name and email."
-    )
+async def extract_name_email_llm_async(text: str, timeout: float = None):
+    """Async variant of extract_name_email_llm. A timeout counts as a failed extraction."""
+    try:
+        response = await ainvoke_with_timeout(llm, name_email_prompt(text), timeout)
+    except asyncio.TimeoutError:
+        print("Name/email extraction timed out.")
+        return None, None
+    return parse_name_email(response)
 
-    # CASE 1: User replied after a sensitive warning
-    if previous_was_sensitive:
-        # Try extracting name/email using LLM
-        name, email = extract_name_email_llm(user_query)
-
-        # Check if extraction looks valid
-        if name and email:
-            # Send admin email about original sensitive query
-            original_sensitive_query = chat_history[-1]["user"]
-            result = send_admin_email(name, email, original_sensitive_query)
-            # Ensure proper response format
-            if "response" not in result:
-                return {"response": {"AI": result.get("message", "Email sent successfully.")}}
-            return result
-        else:
-            # Extraction failed, treat as normal query
-            print("LLM could not confidently extract name/email. Processing as normal query.")
-            previous_was_sensitive = False  # continue to normal processing
 
-    # CASE 2: First-time sensitive query detection
-    if is_sensitive(user_query):
-        return {"response": {"AI": "Sensitive query detected. Please provide your name and email."}}
 
+def discard_speculative(task: asyncio.Task):
+    """Cancel a speculative task whose result is no longer needed, without leaking its exception."""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+# -------------------------
+# Speculative web fallback
+# -------------------------
+# Retrieval scores are cosine similarities (see RAG_SCORE_THRESHOLD). Below the threshold RAG skips
+# generation, so the band that pays off is just above it: with text-embedding-ada-002, off-corpus
+# questions top out around 0.74-0.79 while answerable ones mostly score 0.80 and up (the bench's fake
+# embeddings mimic this: rag_miss_web tops out at 0.73-0.76, history hits 0.82-0.86).
+# Scores in [RAG_SCORE_THRESHOLD, WEB_SPECULATION_SCORE) start the web search next to the RAG answer
+# generation instead of after it. Recalibrate from rag_top_score{outcome} in /metrics when the embedding
+# model or corpus changes. 0 disables speculation.
+WEB_SPECULATION_SCORE = float(os.getenv("WEB_SPECULATION_SCORE", "0.80"))
+
+SCORE_BUCKETS = tuple(round(0.5 + 0.025 * i, 3) for i in range(21))  # 0.5 .. 1.0
+rag_top_score = metrics_registry.histogram(
+    "rag_top_score", "Top retrieval score (cosine) of RAG-routed questions, by outcome (answered, missed)",
+    ("outcome",), buckets=SCORE_BUCKETS,
+)
+
+web_speculation_total = metrics_registry.counter(
+    "web_speculation_total", "Web searches started next to RAG generation, by outcome (paid_off, wasted)",
+    ("outcome",),
+)
+web_speculation_head_start = metrics_registry.histogram(
+    "web_speculation_head_start_seconds", "How long a speculative web search had been running when RAG missed"
+)
+
+
+def should_speculate(top_score) -> bool:
+    # Below the threshold RAG skips generation and returns at once, so there is nothing to overlap
+    return top_score is not None and SCORE_THRESHOLD <= top_score < WEB_SPECULATION_SCORE
+
+
+def observe_rag_outcome(top_score, rag_answered: bool):
+    """Feed the score distribution the speculation band is calibrated against (cache hits have no score)."""
+    if top_score is not None:
+        rag_top_score.observe(top_score, outcome="answered" if rag_answered else "missed")
+
+
+def settle_speculation(web_started: float, rag_answered: bool):
+    if rag_answered:
+        web_speculation_total.inc(outcome="wasted")
+    else:
+        web_speculation_total.inc(outcome="paid_off")
+        web_speculation_head_start.observe(time.perf_counter() - web_started)
+
+
+async def rag_or_web(user_query: str, retrieval_task: asyncio.Task):
+    """
+    Generate the RAG answer from the (speculatively started) retrieval; if retrieval scored in the
+    speculation band, run the web search concurrently and cancel whichever result is not used.
+    Returns (route, result).
+    """
+    retrieval = await retrieval_task
+    web_task, web_started = None, None
+    if should_speculate(retrieval_top_score(retrieval)):
+        web_task = asyncio.create_task(query_web_async(user_query))
+        web_started = time.perf_counter()
+
+    try:
+        rag_response = await answer_retrieved(user_query, retrieval)
+    except asyncio.TimeoutError:
+        print("RAG answer generation timed out.")
+        rag_response = {}
+    except BaseException:
+        if web_task is not None:
+            discard_speculative(web_task)
+        raise
+
+    print("RAG sourse:", rag_response.get("sources"))  # Debug print
+    print("RAG from:", rag_response.get("from"))  # Debug print
+
+    answered = bool(rag_response and rag_response.get("answer"))
+    observe_rag_outcome(retrieval_top_score(retrieval), answered)
+    if web_task is not None:
+        settle_speculation(web_started, answered)
+    if answered:
+        if web_task is not None:
+            discard_speculative(web_task)
+        return "rag", rag_response
+
+    if web_task is None:
+        print("RAG did not find anything. Falling back to web search...")
+        return "web", await query_web_async(user_query)
+    print("RAG did not find anything. Using the web search started alongside it...")
+    return "web", await web_task
+
+
+def prefetch_stream(stream):
+    """
+    Consume an async generator in a task, into a queue (None marks the end), so it runs ahead
+    of its reader. Returns (task, queue); cancel the task to abandon the stream, and await it
+    after the end marker to see its error, if any.
+    """
+    queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async with aclosing(stream):
+                async for item in stream:
+                    queue.put_nowait(item)
+        finally:
+            queue.put_nowait(None)
+
+    return asyncio.create_task(pump()), queue
+
+
+SENSITIVE_PROMPT_MESSAGE = "Sensitive query detected. Please provide your name and email."
+ROUTING_UNAVAILABLE_MESSAGE = "The assistant is busy right now. Please try again in a moment."
+# Messages without an email address skip the contact-extraction LLM call while contact details are pending
+CONTACT_EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.\w+")
+
+
+def load_session(data: UserQuery) -> Session:
+    if data.session_id or not data.chat_history:
+        return session_store.load(data.session_id)
+    return Session.from_client_history(data.chat_history, SENSITIVE_PROMPT_MESSAGE)
+
+
+def finish_turn(session: Session, user_query: str, answer: str, route: str, event: ChatEvent = ChatEvent.ANSWERED):
+    """Record the turn, apply `event` to the session state and persist it; `route` is counted in /metrics."""
+    route_total.inc(route=route)
+    pending_query = user_query if event == ChatEvent.SENSITIVE_QUERY else None
+    try:
+        session_store.record_turn(session, user_query, answer, event, pending_query=pending_query)
+    except SessionConflict:
+        # The answer is already generated; losing the turn from the history beats failing the request
+        print(f"Session {session.id} kept changing; turn not recorded")
+
+
+async def handle_sensitive_followup(user_query: str, session: Session):
+    """
+    If the session is waiting for contact details, try to extract them and notify the admin.
+    Returns the response dict, or None to continue with normal processing.
+    """
+    if session.state != ChatState.AWAITING_CONTACT or not CONTACT_EMAIL_PATTERN.search(user_query):
+        return None
+
+    # Try extracting name/email using LLM
+    with span("contact_extraction"):
+        name, email = await extract_name_email_llm_async(user_query)
+
+    # Check if extraction looks valid
+    if name and email:
+        # Queue the admin email about the original sensitive query (sent in the background)
+        original_sensitive_query = session.pending_query
+        result = send_admin_email(name, email, original_sensitive_query)
+        # Ensure proper response format
+        if "response" not in result:
+            return {"response": {"AI": result.get("message", "Admin will be notified.")}}
+        return result
+
+    # Extraction failed, treat as normal query; the session keeps waiting for the details
+    print("LLM could not confidently extract name/email. Processing as normal query.")
+    return None
+
+
+def build_messages(chat_history: list, user_query: str, summary: str = None) -> list:
     # Build normal LLM messages
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
     for msg in chat_history:
         messages.append({"role": "user", "content": msg["user"]})
         messages.append({"role": "assistant", "content": msg["AI"]})
     messages.append({"role": "user", "content": user_query})
+    return messages
+
+
+@application.post("/chat")
+async def chat_endpoint(data: UserQuery, response: Response):
+    session = load_session(data)
+    session_id = None if session.transient else session.id
+    if session_id:
+        response.headers["X-Session-Id"] = session_id
+    result = await answer_chat(data.query, session, response)
+    return {**result, "session_id": session_id}
+
+
+async def answer_chat(user_query: str, session: Session, response: Response) -> dict:
+    chat_history = session.history
+
+    # CASE 1: User replied after a sensitive warning
+    followup = await handle_sensitive_followup(user_query, session)
+    if followup is not None:
+        finish_turn(session, user_query, followup["response"]["AI"], "admin_notification", ChatEvent.CONTACT_RECEIVED)
+        return followup
+
+    # Route the query (one structured LLM call) while retrieval runs speculatively;
+    # the answer is only generated (and cached) once the route is known to be RAG
+    vectordbs = vector_registry.get()
+    retrieval_task = asyncio.create_task(retrieve_for_answer(user_query, vectordbs))
+    try:
+        with span("route"):
+            route = await route_query_async(user_query)
+    except Exception as e:
+        # Both the router and its fallback classifiers failed (e.g. timed out): nothing was
+        # decided about the query, so it is not answered and the turn is not recorded
+        discard_speculative(retrieval_task)
+        print(f"Routing failed: {type(e).__name__}: {e}")
+        return {"response": {"AI": ROUTING_UNAVAILABLE_MESSAGE}}
+    except BaseException:
+        discard_speculative(retrieval_task)
+        raise
+
+    # CASE 2: First-time sensitive query detection
+    if route["sensitive"]:
+        discard_speculative(retrieval_task)
+        finish_turn(session, user_query, SENSITIVE_PROMPT_MESSAGE, "sensitive", ChatEvent.SENSITIVE_QUERY)
+        return {"response": {"AI": SENSITIVE_PROMPT_MESSAGE}}
 
     print("user_query:", user_query)
 
     # News check
-    if is_news_queury(user_query):
-        news_result = query_news(user_query, messages)
+    if route["news"]:
+        discard_speculative(retrieval_task)
+        # Only the news answer uses the conversation; send it within the token budget
+        with span("history"):
+            summary, recent_history, history_stats = await prepare_history(chat_history)
+        print("History tokens:", history_stats)
+        response.headers["X-History-Tokens-Saved"] = str(history_stats["tokens_saved"])
+        messages = build_messages(recent_history, user_query, summary)
+        try:
+            news_result = await query_news_async(user_query, messages)
+        except asyncio.TimeoutError:
+            print("News search timed out.")
+            news_result = {"answer": "News search timed out. Try again later.", "source": [], "type": "News"}
         # Ensure proper response format
         if "response" not in news_result:
-            return {"response": {"AI": news_result.get("message", news_result.get("answer", "No news found."))}}
+            news_result = {"response": {"AI": news_result.get("message", news_result.get("answer", "No news found."))}}
+        finish_turn(session, user_query, news_result["response"]["AI"], "news")
         return news_result
 
-    # RAG async query
-    vectordbs = load_vectordbs(base_dir="vectorstores")
-    rag_response = await query_all_top3(user_query, vectordbs)
-
-    print("RAG sourse:", rag_response.get("sources"))  # Debug print
-    print("RAG from:", rag_response.get("from"))  # Debug print
-    
+    # RAG answer from the retrieval already running; a likely miss starts the web search alongside it
+    route, result = await rag_or_web(user_query, retrieval_task)
 
-    if rag_response and rag_response.get("answer"):
+    if route == "rag":
         # Ensure proper response format
-        return {"response": {"AI": rag_response["answer"]}}
-    else:
-        print("RAG did not find anything. Falling back to web search...")
-        web_result = query_web(user_query)
-        # Ensure proper response format
-        if "response" not in web_result:
-            return {"response": {"AI": web_result.get("message", web_result.get("answer", "No information found."))}}
-        return web_result
\ No newline at end of file
+        finish_turn(session, user_query, result["answer"], "rag")
+        return {"response": {"AI": result["answer"]}}
+
+    web_result = result
+    # Ensure proper response format
+    if "response" not in web_result:
+        web_result = {"response": {"AI": web_result.get("message", web_result.get("answer", "No information found."))}}
+    finish_turn(session, user_query, web_result["response"]["AI"], "web")
+    return web_result
+
+
+# -------------------------
+# Streaming chat (Server-Sent Events)
+# -------------------------
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def extract_source_urls(text: str) -> list:
+    return re.findall(r'\((https?://[^\s)]+)\)', text)
+
+
+async def chat_event_stream(data: UserQuery):
+    """
+    Event sequence: session -> route -> sources (RAG) -> token* -> [route: web -> token* -> sources] -> done.
+    Each event's data is JSON; token events carry {"text": ...}.
+    The turn is recorded in the session when the answer is complete.
+    """
+    user_query = data.query
+    session = load_session(data)
+    chat_history = session.history
+    yield sse_event("session", {"session_id": None if session.transient else session.id})
+    rag_events, first_rag_event = None, None
+    web_prefetch = None  # (task, queue) of a web search started alongside RAG generation
+
+    try:
+        followup = await handle_sensitive_followup(user_query, session)
+        if followup is not None:
+            text = followup["response"]["AI"]
+            finish_turn(session, user_query, text, "admin_notification", ChatEvent.CONTACT_RECEIVED)
+            yield sse_event("route", {"route": "admin_notification"})
+            yield sse_event("token", {"text": text})
+            yield sse_event("done", {"route": "admin_notification", "answer": text})
+            return
+
+        # Retrieval (first RAG event) runs speculatively while the query is routed
+        vectordbs = vector_registry.get()
+        rag_events = stream_query_all_top3(user_query, vectordbs)
+        first_rag_event = asyncio.create_task(rag_events.__anext__())
+        with span("route"):
+            route = await route_query_async(user_query)
+
+        if route["sensitive"] or route["news"]:
+            first_rag_event.cancel()
+
+        if route["sensitive"]:
+            finish_turn(session, user_query, SENSITIVE_PROMPT_MESSAGE, "sensitive", ChatEvent.SENSITIVE_QUERY)
+            yield sse_event("route", {"route": "sensitive"})
+            yield sse_event("token", {"text": SENSITIVE_PROMPT_MESSAGE})
+            yield sse_event("done", {"route": "sensitive", "answer": SENSITIVE_PROMPT_MESSAGE})
+            return
+
+        if route["news"]:
+            yield sse_event("route", {"route": "news"})
+            with span("history"):
+                summary, recent_history, history_stats = await prepare_history(chat_history)
+            print("History tokens:", history_stats)
+            parts = []
+            async for text in astream_news(user_query, build_messages(recent_history, user_query, summary)):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            answer = "".join(parts)
+            sources = extract_source_urls(answer) or ["Web / News"]
+            finish_turn(session, user_query, answer, "news")
+            yield sse_event("sources", {"urls": sources})
+            yield sse_event("done", {"route": "news", "answer": answer, "sources": sources, "history": history_stats})
+            return
+
+        yield sse_event("route", {"route": "rag", "domain": route.get("domain")})
+        rag_result = {}
+        try:
+            event = await first_rag_event
+            while True:
+                if event["event"] == "sources":
+                    if should_speculate(event.get("top_score")):
+                        web_prefetch = prefetch_stream(astream_web(user_query))
+                        web_started = time.perf_counter()
+                    yield sse_event("sources", {"stores": event["from"], "source_files": event["sources"]})
+                elif event["event"] == "token":
+                    yield sse_event("token", {"text": event["data"]})
+                elif event["event"] == "rag_result":
+                    rag_result = event
+                try:
+                    event = await rag_events.__anext__()
+                except StopAsyncIteration:
+                    break
+        except asyncio.TimeoutError:
+            print("RAG answer generation timed out.")
+            rag_result = {}
+
+        if not rag_result.get("cached"):
+            observe_rag_outcome(rag_result.get("top_score"), bool(rag_result.get("answer")))
+        if web_prefetch is not None:
+            settle_speculation(web_started, bool(rag_result.get("answer")))
+
+        if rag_result.get("answer"):
+            finish_turn(session, user_query, rag_result["answer"], "rag")
+            yield sse_event("done", {
+                "route": "rag",
+                "answer": rag_result["answer"],
+                "sources": rag_result.get("sources", []),
+                "cached": rag_result.get("cached", False),
+            })
+            return
+
+        yield sse_event("route", {"route": "web"})
+        parts = []
+        if web_prefetch is not None:
+            # Already running: replay what it produced so far, then follow it live
+            print("RAG did not find anything. Using the web search started alongside it...")
+            queue = web_prefetch[1]
+            while (text := await queue.get()) is not None:
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            await web_prefetch[0]  # raises if the web search failed
+        else:
+            print("RAG did not find anything. Falling back to web search...")
+            async for text in astream_web(user_query):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+        answer = "".join(parts)
+        sources = extract_source_urls(answer) or ["Web / Search"]
+        finish_turn(session, user_query, answer, "web")
+        yield sse_event("sources", {"urls": sources})
+        yield sse_event("done", {"route": "web", "answer": answer, "sources": sources})
+
+    except asyncio.CancelledError:
+        # Client disconnected: stop generating
+        raise
+    except Exception as e:
+        print(f"Streaming chat failed: {e}")
+        yield sse_event("error", {"message": "Sorry, something went wrong while answering."})
+    finally:
+        # Stop whatever is still running and collect its outcome, so no task exception goes unretrieved
+        # and the RAG generator is closed here rather than by the garbage collector
+        if first_rag_event is not None:
+            first_rag_event.cancel()
+            await asyncio.gather(first_rag_event, return_exceptions=True)
+        if rag_events is not None:
+            await rag_events.aclose()
+        if web_prefetch is not None:
+            web_prefetch[0].cancel()
+            await asyncio.gather(web_prefetch[0], return_exceptions=True)
+
+
+@application.post("/chat/stream")
+async def chat_stream_endpoint(data: UserQuery):
+    return StreamingResponse(
+        chat_event_stream(data),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
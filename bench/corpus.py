@@ -0,0 +1,86 @@
+"""
+Synthetic document corpus for benchmarks. Every document is about one topic (three keywords
+repeated through the text, mixed with filler words), so topic questions retrieve it with the
+fake embeddings and off-corpus questions miss.
+
+Usage:
+    python -m bench.corpus --out documents --files 200 --paragraphs 12
+"""
+import os
+import random
+import argparse
+
+
+TOPIC_WORDS = (
+    "indus harappa mohenjodaro gandhara taxila mughal akbar shahjahan aurangzeb lahore multan sindh "
+    "punjab balochistan khyber peshawar jinnah iqbal partition resolution constitution karachi durrani "
+    "ranjit sikh ghaznavid delhi sultanate babur humayun sher suri hyderabad bahawalpur swat chitral "
+    "gilgit baltistan hunza kashmir tarbela mangla quetta makran gwadar thatta makli rohtas derawar"
+).split()
+
+# Words the benchmark's off-corpus questions use; they never appear in the corpus
+MISS_WORDS = "volcano penguin glacier saxophone origami quasar tundra marathon robotics jazz".split()
+
+_SYLLABLES = "ka lo mi ren tu sa vel dor pen ga ri mo zan ko lu tem bar sil na fe".split()
+
+
+def topic_keywords(topic: int) -> list:
+    n = len(TOPIC_WORDS)
+    keywords = []
+    for index in (topic, topic * 7 + 3, topic * 13 + 5):
+        while TOPIC_WORDS[index % n] in keywords:
+            index += 1
+        keywords.append(TOPIC_WORDS[index % n])
+    return keywords
+
+
+def filler_vocabulary(size: int = 600, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))))
+    return sorted(words)
+
+
+def make_document(topic: int, paragraphs: int, rng: random.Random, vocabulary: list) -> str:
+    keywords = topic_keywords(topic)
+    lines = [f"Notes on {' '.join(keywords)}", ""]
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(4, 7)):
+            words = rng.sample(vocabulary, rng.randint(6, 10)) + rng.sample(keywords, rng.randint(1, 2))
+            rng.shuffle(words)
+            sentences.append(" ".join(words).capitalize() + ".")
+        lines.append(" ".join(sentences))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_corpus(out_dir: str, files: int = 200, paragraphs: int = 12, topics: int = 40, seed: int = 0) -> dict:
+    """Write `files` .txt documents (spread over `topics` topics) into out_dir."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    vocabulary = filler_vocabulary(seed=seed)
+    total_bytes = 0
+    for i in range(files):
+        text = make_document(i % topics, paragraphs, rng, vocabulary)
+        path = os.path.join(out_dir, f"topic{i % topics:03d}_{i:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        total_bytes += len(text.encode("utf-8"))
+    return {"files": files, "topics": topics, "bytes": total_bytes, "out_dir": out_dir}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic document corpus.")
+    parser.add_argument("--out", default="documents")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=12)
+    parser.add_argument("--topics", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="Write into a non-empty folder")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.out) and os.listdir(args.out) and not args.force:
+        parser.error(f"{args.out} is not empty (use --force to add the synthetic files anyway)")
+    print(generate_corpus(args.out, args.files, args.paragraphs, args.topics, args.seed))
@@ -0,0 +1,358 @@
+"""
+Local OpenAI-compatible stand-in for benchmarks: /v1/chat/completions, /v1/embeddings and
+/v1/responses (the shape used by the web_search tool), with configurable latency.
+
+Answers are chosen from the prompt (router, classifiers, contact extraction, RAG answer,
+history summary, web/news search), so every route of the app can be exercised offline.
+Embeddings are deterministic feature-hashed bags of words: texts that share words are close,
+texts that do not are orthogonal.
+
+Usage:
+    python -m bench.fake_openai --port 8001 --latency-ms 200 --token-ms 5
+    LLM_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=bench uvicorn application:application
+"""
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "200"))  # time to first token / full response
+TOKEN_MS = float(os.getenv("FAKE_OPENAI_TOKEN_MS", "5"))  # per streamed token
+EMBED_LATENCY_MS = float(os.getenv("FAKE_OPENAI_EMBED_LATENCY_MS", "30"))  # per embeddings request
+JITTER = float(os.getenv("FAKE_OPENAI_JITTER", "0"))  # +- fraction of each latency
+EMBED_DIM = int(os.getenv("FAKE_OPENAI_EMBED_DIM", "256"))
+# Cosine similarity every pair of texts shares, like text-embedding-ada-002 (unrelated text ~0.7),
+# so the app's score thresholds mean the same against the fake as against the real model
+EMBED_BASELINE = float(os.getenv("FAKE_OPENAI_EMBED_BASELINE", "0.6"))
+ANSWER_WORDS = int(os.getenv("FAKE_OPENAI_ANSWER_WORDS", "60"))
+
+# Words that decide the router / classifier answers; the bench scenarios use the same lists
+SENSITIVE_WORDS = ("troop", "troops", "classified", "weapons", "surveillance", "covert")
+NEWS_WORDS = ("latest", "breaking", "today", "news", "this week")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from had has have how i in is it its me of on or "
+    "please tell that the their them there these this to us was were what when where which who "
+    "why will with you your about say says said records".split()
+)
+_WORD = re.compile(r"[a-z][a-z0-9]{2,}")
+
+app = FastAPI()
+_random = random.Random(0)
+
+
+async def _sleep(ms: float):
+    if ms > 0:
+        if JITTER:
+            ms *= 1 + _random.uniform(-JITTER, JITTER)
+        await asyncio.sleep(ms / 1000)
+
+
+# -------------------------
+# Embeddings
+# -------------------------
+def embed_text(text: str) -> np.ndarray:
+    """
+    Feature-hashed bag of (non-stop) words in all but the last dimension, plus a component shared
+    by every text in the last one. Unit length; cosine = EMBED_BASELINE + (1 - EMBED_BASELINE) * word overlap.
+    """
+    words = np.zeros(EMBED_DIM - 1, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % (EMBED_DIM - 1)
+        words[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(words)
+    if norm == 0:
+        # No content words: a fixed pseudo-random direction per text
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=4).digest(), "little")
+        words = np.random.default_rng(seed).standard_normal(EMBED_DIM - 1).astype(np.float32)
+        norm = np.linalg.norm(words)
+    vector = np.empty(EMBED_DIM, dtype=np.float32)
+    vector[:-1] = words / norm * np.sqrt(1.0 - EMBED_BASELINE)
+    vector[-1] = np.sqrt(EMBED_BASELINE)
+    return vector
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    await _sleep(EMBED_LATENCY_MS)
+    data = []
+    for i, text in enumerate(inputs):
+        vector = embed_text(text if isinstance(text, str) else " ".join(map(str, text)))
+        if body.get("encoding_format") == "base64":
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+        else:
+            embedding = vector.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    tokens = sum(len(str(t).split()) for t in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "fake-embedding"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+# -------------------------
+# Answers
+# -------------------------
+def _collect_text(value) -> str:
+    """All text inside chat messages / responses input, whatever the nesting."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(_collect_text(v) for v in value)
+    if isinstance(value, dict):
+        return "\n".join(_collect_text(value[k]) for k in ("content", "text", "input") if k in value)
+    return ""
+
+
+def _quoted_query(prompt: str, marker: str) -> str:
+    match = re.search(marker + r'\s*"(.*?)"', prompt, re.S)
+    return match.group(1) if match else prompt
+
+
+def _has_any(text: str, words) -> bool:
+    text = text.lower()
+    return any(word in text for word in words)
+
+
+def _filler(seed: str, words: int) -> str:
+    rng = random.Random(seed)
+    vocabulary = ("the", "archive", "notes", "describe", "period", "region", "sources", "record", "events", "and")
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+def route_decision(prompt: str) -> dict:
+    query = _quoted_query(prompt, "User Query:")
+    sensitive = _has_any(query, SENSITIVE_WORDS)
+    news = not sensitive and _has_any(query, NEWS_WORDS)
+    return {"sensitive": sensitive, "news": news, "domain": "current_affairs" if news else "history"}
+
+
+def rag_answer(prompt: str) -> str:
+    documents, _, question = prompt.partition("Documents:")[2].rpartition("\n")
+    keywords = [w for w in _WORD.findall(question.lower()) if w not in STOPWORDS]
+    hits = [w for w in keywords if w in documents.lower()]
+    if not hits:
+        return "Information not found in documents."
+    return f"FOUND: The documents discuss {' '.join(hits)}. " + _filler(question, ANSWER_WORDS)
+
+
+def search_answer(prompt: str) -> str:
+    query = _quoted_query(prompt, "The user asked:")
+    slug = "-".join(_WORD.findall(query.lower())[:4]) or "story"
+    return (
+        f"Summary for {query.strip()}: " + _filler(query, ANSWER_WORDS)
+        + f" (https://www.dawn.com/news/{slug}) (https://tribune.com.pk/story/{slug})"
+    )
+
+
+def answer_for(prompt: str) -> str:
+    if "security filter" in prompt:
+        return "YES" if _has_any(_quoted_query(prompt, "User Query:"), SENSITIVE_WORDS) else "NO"
+    if "latest, breaking, or current events" in prompt and "Query:" in prompt and "router" not in prompt:
+        return "YES" if _has_any(_quoted_query(prompt, "Query:"), NEWS_WORDS) else "NO"
+    if "extracts a person's name and email" in prompt:
+        text = _quoted_query(prompt, "Text:")
+        email = re.search(r"[\w.+-]+@[\w-]+\.[\w.]+", text)
+        name = text.split()[0] if email and text.split() else None
+        return json.dumps({"name": name, "email": email.group(0) if email else None})
+    if "Summarize the earlier part of a conversation" in prompt:
+        return "Earlier the user asked about " + _filler(prompt[-200:], 40)
+    if "Documents:" in prompt and "FOUND:" in prompt:
+        return rag_answer(prompt)
+    if "The user asked:" in prompt:
+        return search_answer(prompt)
+    return _filler(prompt[-200:], ANSWER_WORDS)
+
+
+def _tokens(text: str) -> list:
+    # Word-sized tokens with their trailing space, like real streamed deltas
+    return re.findall(r"\S+\s*", text) or [text]
+
+
+def _usage(prompt: str, answer: str) -> tuple:
+    return len(prompt) // 4 + 1, len(answer) // 4 + 1
+
+
+def _sse(payload) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+# -------------------------
+# Chat completions
+# -------------------------
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = _collect_text(body.get("messages", []))
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        answer = json.dumps(route_decision(prompt))
+    else:
+        answer = answer_for(prompt)
+    prompt_tokens, completion_tokens = _usage(prompt, answer)
+    model = body.get("model", "gpt-4o-mini")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await _sleep(LATENCY_MS)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer, "refusal": None},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+    async def events():
+        def chunk(delta, finish_reason=None):
+            return _sse({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+            })
+
+        await _sleep(LATENCY_MS)
+        yield chunk({"role": "assistant", "content": ""})
+        for token in _tokens(answer):
+            yield chunk({"content": token})
+            await _sleep(TOKEN_MS)
+        yield chunk({}, "stop")
+        if include_usage:
+            yield _sse({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# -------------------------
+# Responses API (web_search tool)
+# -------------------------
+def _response_object(response_id: str, model: str, message_id: str, answer: str, prompt: str, status: str) -> dict:
+    input_tokens, output_tokens = _usage(prompt, answer)
+    output = []
+    if status == "completed":
+        output = [
+            {"id": f"ws_{message_id}", "type": "web_search_call", "status": "completed",
+             "action": {"type": "search", "query": _quoted_query(prompt, "The user asked:")}},
+            {"id": message_id, "type": "message", "role": "assistant", "status": "completed",
+             "content": [{"type": "output_text", "text": answer, "annotations": []}]},
+        ]
+    return {
+        "id": response_id,
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": status,
+        "output": output,
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [{"type": "web_search_preview"}],
+        "error": None,
+        "incomplete_details": None,
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        } if status == "completed" else None,
+    }
+
+
+@app.post("/v1/responses")
+async def responses(request: Request):
+    body = await request.json()
+    prompt = _collect_text(body.get("input", ""))
+    answer = answer_for(prompt)
+    model = body.get("model", "gpt-4o-mini")
+    response_id = f"resp_{uuid.uuid4().hex[:24]}"
+    message_id = f"msg_{uuid.uuid4().hex[:24]}"
+
+    if not body.get("stream"):
+        await _sleep(LATENCY_MS)
+        return _response_object(response_id, model, message_id, answer, prompt, "completed")
+
+    async def events():
+        sequence = iter(range(1_000_000))
+
+        def event(type_, **fields):
+            return f"event: {type_}\n" + _sse({"type": type_, "sequence_number": next(sequence), **fields})
+
+        yield event("response.created", response=_response_object(response_id, model, message_id, "", prompt, "in_progress"))
+        await _sleep(LATENCY_MS)
+        yield event("response.output_item.added", output_index=1, item={
+            "id": message_id, "type": "message", "role": "assistant", "status": "in_progress", "content": [],
+        })
+        for token in _tokens(answer):
+            yield event("response.output_text.delta", item_id=message_id, output_index=1, content_index=0,
+                        delta=token, logprobs=[])
+            await _sleep(TOKEN_MS)
+        yield event("response.output_text.done", item_id=message_id, output_index=1, content_index=0,
+                    text=answer, logprobs=[])
+        yield event("response.completed",
+                    response=_response_object(response_id, model, message_id, answer, prompt, "completed"))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "latency_ms": LATENCY_MS, "token_ms": TOKEN_MS, "embed_latency_ms": EMBED_LATENCY_MS}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the fake OpenAI server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=None)
+    parser.add_argument("--token-ms", type=float, default=None)
+    parser.add_argument("--embed-latency-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.latency_ms is not None:
+        LATENCY_MS = args.latency_ms
+    if args.token_ms is not None:
+        TOKEN_MS = args.token_ms
+    if args.embed_latency_ms is not None:
+        EMBED_LATENCY_MS = args.embed_latency_ms
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
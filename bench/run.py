@@ -0,0 +1,290 @@
+"""
+Offline benchmark: ingestion throughput and /chat latency per route, against the fake OpenAI
+server (no API key, no network). Everything runs in a scratch working directory, so the
+repository's vectorstores/ and cache/ are never touched.
+
+Usage:
+    python -m bench.run                                     # all scenarios, print + write a JSON report
+    python -m bench.run --scenarios history,rag_miss_web --units 50 --concurrency 16
+    python -m bench.run --save-baseline bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json      # exit 1 if anything regressed
+
+Latency of the fake model is set with --latency-ms / --token-ms / --embed-latency-ms; keep them
+equal between a baseline and the runs compared against it.
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+from bench.corpus import generate_corpus
+from bench.scenarios import SCENARIOS, run_scenario
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metric -> direction that counts as worse
+COMPARED = {
+    "p50_ms": "higher",
+    "p95_ms": "higher",
+    "p99_ms": "higher",
+    "rps": "lower",
+    "chunks_per_second": "lower",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready in {timeout}s")
+
+
+def bench_env(llm_port: int, extra: dict = None) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "LLM_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "OPENAI_API_KEY": "bench",
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPO_DIR, env.get("PYTHONPATH")])),
+        # No real mail server in a benchmark; notifications are only queued and logged
+        "BOT_EMAIL": "",
+        "ADMIN_EMAIL": "",
+    })
+    env.update(extra or {})
+    return env
+
+
+def start_fake_openai(port: int, args, log) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "bench.fake_openai", "--port", str(port),
+        "--latency-ms", str(args.latency_ms), "--token-ms", str(args.token_ms),
+        "--embed-latency-ms", str(args.embed_latency_ms),
+    ]
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=log, stderr=subprocess.STDOUT)
+    wait_ready(f"http://127.0.0.1:{port}/health", process)
+    return process
+
+
+def start_app(port: int, workdir: str, env: dict, log) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "uvicorn", "application:application",
+        "--port", str(port), "--log-level", "warning", "--no-access-log",
+    ]
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    wait_ready(f"http://127.0.0.1:{port}/health", process, timeout=120)
+    return process
+
+
+def run_ingest(workdir: str, env: dict, log) -> dict:
+    """Full build of workdir/documents with create_embeddings.py, in its own process."""
+    script = (
+        "import json, time\n"
+        "from create_embeddings import build_index_staged, iter_document_paths\n"
+        "started = time.perf_counter()\n"
+        "result = build_index_staged(iter_document_paths('documents'), full=True)\n"
+        "result['wall_seconds'] = time.perf_counter() - started\n"
+        "print('BENCH_RESULT ' + json.dumps(result, default=str))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=workdir, env=env, capture_output=True, text=True, check=False
+    )
+    log.write(output.stdout.encode() + output.stderr.encode())
+    for line in output.stdout.splitlines():
+        if line.startswith("BENCH_RESULT "):
+            result = json.loads(line[len("BENCH_RESULT "):])
+            seconds = result["wall_seconds"]
+            return {
+                "files": result["files"]["added"] + result["files"]["updated"],
+                "failed_files": result["files"]["failed"],
+                "chunks": result["total_chunks"],
+                "seconds": round(seconds, 3),
+                "chunks_per_second": round(result["total_chunks"] / seconds, 1) if seconds else 0.0,
+                "embedding": result.get("embedding"),
+                "peak_rss_mb": result["ingest"]["peak_rss_mb"],
+            }
+    raise RuntimeError(f"Ingestion failed:\n{output.stderr[-2000:]}")
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Return one line per metric that is worse than the baseline by more than `tolerance`."""
+    regressions = []
+    sections = [("ingest", report.get("ingest", {}), baseline.get("ingest", {}))]
+    sections += [
+        (f"scenario {name}", result, baseline.get("scenarios", {}).get(name, {}))
+        for name, result in report.get("scenarios", {}).items()
+    ]
+    for label, current, previous in sections:
+        for metric, worse in COMPARED.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (worse == "higher" and change > tolerance) or (worse == "lower" and -change > tolerance):
+                regressions.append(f"{label}: {metric} {old} -> {new} ({change:+.0%})")
+        if current.get("errors"):
+            regressions.append(f"{label}: {current['errors']} failed requests")
+    return regressions
+
+
+SCORE_BUCKET_LINE = re.compile(r'^rag_top_score_bucket\{outcome="(\w+)",le="([^"]+)"\} (\d+)$')
+
+
+def scrape_rag_scores(base_url: str) -> dict:
+    """Top retrieval scores of the run from /metrics: {outcome: {"<=le": questions in that bucket}}."""
+    cumulative = {}
+    for line in httpx.get(f"{base_url}/metrics", timeout=10).text.splitlines():
+        match = SCORE_BUCKET_LINE.match(line)
+        if match and match.group(2) != "+Inf":
+            cumulative.setdefault(match.group(1), []).append((float(match.group(2)), int(match.group(3))))
+    scores = {}
+    for outcome, buckets in cumulative.items():
+        previous = 0
+        scores[outcome] = {}
+        for le, count in buckets:
+            if count > previous:
+                scores[outcome][f"<={le:g}"] = count - previous
+            previous = count
+    return scores
+
+
+def print_report(report: dict):
+    ingest = report.get("ingest")
+    if ingest:
+        print(f"\ningest: {ingest['files']} files, {ingest['chunks']} chunks in {ingest['seconds']}s "
+              f"= {ingest['chunks_per_second']} chunks/s (peak RSS {ingest['peak_rss_mb']} MB)")
+    print(f"\n{'scenario':<14}{'reqs':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>9}  routes")
+    for name, r in report.get("scenarios", {}).items():
+        print(f"{name:<14}{r['requests']:>6}{r['errors']:>5}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['rps']:>9}  {r['routes']}")
+    # What WEB_SPECULATION_SCORE is calibrated against: where answered and missed questions score
+    for outcome, buckets in report.get("rag_top_score", {}).items():
+        print(f"rag_top_score {outcome:<9}{buckets}")
+
+
+async def run_scenarios(base_url: str, names: list, units: int, concurrency: int) -> dict:
+    results = {}
+    for name in names:
+        print(f"Running scenario {name} ({units} conversations, concurrency {concurrency})...")
+        result = await run_scenario(base_url, name, units, concurrency)
+        if result["routes"].get(result["expected_route"], 0) == 0:
+            print(f"  warning: no request took the {result['expected_route']} route")
+        results[name] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of ingestion and /chat.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenario names")
+    parser.add_argument("--units", type=int, default=40, help="Conversations per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--files", type=int, default=200, help="Synthetic documents to ingest")
+    parser.add_argument("--paragraphs", type=int, default=12)
+    parser.add_argument("--skip-ingest", action="store_true", help="Only ingest a small corpus, do not report it")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--embed-latency-ms", type=float, default=30)
+    parser.add_argument("--with-caches", action="store_true",
+                        help="Keep the semantic answer cache on (off by default so every request does the work)")
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a new temp dir, removed after)")
+    parser.add_argument("--output", default="bench/results/latest.json")
+    parser.add_argument("--baseline", default=None, help="Compare against this report; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", default=None, help="Also write the report here")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {unknown} (choose from {list(SCENARIOS)})")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench-")
+    os.makedirs(workdir, exist_ok=True)
+    log_path = os.path.join(workdir, "bench.log")
+    llm_port, app_port = free_port(), free_port()
+    env = bench_env(llm_port, None if args.with_caches else {"SEMANTIC_CACHE_ENABLED": "false"})
+    processes = []
+    report = {
+        "settings": {
+            "units": args.units, "concurrency": args.concurrency, "files": args.files,
+            "latency_ms": args.latency_ms, "token_ms": args.token_ms, "embed_latency_ms": args.embed_latency_ms,
+            "with_caches": args.with_caches,
+        },
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    with open(log_path, "ab") as log:
+        try:
+            processes.append(start_fake_openai(llm_port, args, log))
+
+            files = 20 if args.skip_ingest else args.files
+            print(f"Generating {files} documents in {workdir}/documents...")
+            generate_corpus(os.path.join(workdir, "documents"), files=files, paragraphs=args.paragraphs)
+            print("Ingesting...")
+            ingest = run_ingest(workdir, env, log)
+            if not args.skip_ingest:
+                report["ingest"] = ingest
+
+            processes.append(start_app(app_port, workdir, env, log))
+            report["scenarios"] = asyncio.run(
+                run_scenarios(f"http://127.0.0.1:{app_port}", names, args.units, args.concurrency)
+            )
+            report["rag_top_score"] = scrape_rag_scores(f"http://127.0.0.1:{app_port}")
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    print_report(report)
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {path}")
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        print(f"Logs: {log_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != report["settings"]:
+            print("warning: baseline was recorded with different settings")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\nREGRESSION against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  ✗ {line}")
+            sys.exit(1)
+        print(f"\n✓ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Load scenarios against a running app. One scenario "unit" is a short conversation on the
+route being measured; every /chat request in it is timed.
+
+    history       questions answered from the corpus (RAG), in sessions of several turns
+    news          "latest news" questions in multi-turn sessions (token-budgeted history)
+    sensitive     a sensitive question followed by the contact details (admin notification)
+    rag_miss_web  off-corpus questions that miss retrieval and fall back to web search
+"""
+import re
+import math
+import time
+import asyncio
+from typing import Callable, Dict, List
+
+import httpx
+
+from bench.corpus import MISS_WORDS, topic_keywords
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, wall_seconds: float) -> dict:
+    values = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2)  # noqa: E731
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+        "rps": round(len(values) / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        "wall_seconds": round(wall_seconds, 3),
+    }
+
+
+# -------------------------
+# Conversations
+# -------------------------
+def history_turns(unit: int, turns: int) -> List[str]:
+    keywords = topic_keywords(unit)
+    return [f"What do the historical records say about {' '.join(keywords)} (part {unit}.{turn})?" for turn in range(turns)]
+
+
+def news_turns(unit: int, turns: int) -> List[str]:
+    keywords = topic_keywords(unit)
+    return [f"What is the latest news about {keywords[turn % 3]} today (update {unit}.{turn})?" for turn in range(turns)]
+
+
+def sensitive_turns(unit: int, turns: int) -> List[str]:
+    return [
+        f"Where are the troops deployed near {topic_keywords(unit)[0]} right now (case {unit})?",
+        f"Bench{unit} bench{unit}@example.com",
+    ]
+
+
+def miss_turns(unit: int, turns: int) -> List[str]:
+    word = MISS_WORDS[unit % len(MISS_WORDS)]
+    other = MISS_WORDS[(unit + 3) % len(MISS_WORDS)]
+    return [f"Explain {word} and {other} for beginners (question {unit}.{turn})" for turn in range(turns)]
+
+
+SCENARIOS: Dict[str, Dict] = {
+    "history": {"turns": history_turns, "expected_route": "rag", "turns_per_unit": 4},
+    "news": {"turns": news_turns, "expected_route": "news", "turns_per_unit": 6},
+    "sensitive": {"turns": sensitive_turns, "expected_route": "sensitive", "turns_per_unit": 2},
+    "rag_miss_web": {"turns": miss_turns, "expected_route": "web", "turns_per_unit": 1},
+}
+
+
+async def run_conversation(client: httpx.AsyncClient, queries: List[str], latencies: list) -> int:
+    """Send the queries as one session. Returns the number of failed requests."""
+    session_id = None
+    errors = 0
+    for query in queries:
+        started = time.perf_counter()
+        try:
+            response = await client.post("/chat", json={"query": query, "session_id": session_id})
+            response.raise_for_status()
+            session_id = response.json().get("session_id")
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors += 1
+            print(f"  request failed: {type(e).__name__}: {e}")
+    return errors
+
+
+async def run_scenario(base_url: str, name: str, units: int, concurrency: int, timeout: float = 120.0) -> dict:
+    """Run `units` conversations of scenario `name` with `concurrency` in flight."""
+    scenario = SCENARIOS[name]
+    make_turns: Callable = scenario["turns"]
+    latencies: List[float] = []
+    errors = 0
+    queue = asyncio.Queue()
+    for unit in range(units):
+        queue.put_nowait(unit)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        routes_before = await route_counts(client)
+
+        async def worker():
+            nonlocal errors
+            while True:
+                try:
+                    unit = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                errors += await run_conversation(client, make_turns(unit, scenario["turns_per_unit"]), latencies)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+        routes_after = await route_counts(client)
+
+    result = summarize(latencies, errors, wall)
+    result["routes"] = {
+        route: count - routes_before.get(route, 0)
+        for route, count in routes_after.items() if count - routes_before.get(route, 0)
+    }
+    result["expected_route"] = scenario["expected_route"]
+    return result
+
+
+_ROUTE_LINE = re.compile(r'^chat_route_total\{route="([^"]+)"\} ([0-9.e+]+)$', re.M)
+
+
+async def route_counts(client: httpx.AsyncClient) -> Dict[str, float]:
+    """chat_route_total from /metrics, to check each scenario took the route it is meant to measure."""
+    try:
+        response = await client.get("/metrics")
+        return {route: float(count) for route, count in _ROUTE_LINE.findall(response.text)}
+    except Exception:
+        return {}
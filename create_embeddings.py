@@ -1,4 +1,15 @@
-from fastapi import FastAPI
+import argparse
+import json
+import time
+import random
+import shutil
+import heapq
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import os
@@ -11,12 +22,60 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 # Vector DB and embeddings
 from langchain_chroma import Chroma 
-from langchain_openai import OpenAIEmbeddings
+from utils.llm import EMBEDDING_MODEL, count_tokens, get_embeddings
+from utils.cache import EmbeddingCache
+from utils.jobs import Job, JobRegistry
+from utils.index_swap import (
+    IndexLock, create_staging_dir, discard_staging_dir, publish_index_dir, release_chroma_clients,
+)
+from utils.numpy_store import NumpyIndexWriter
+from utils.bm25 import BM25Builder
 
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# "per_type" writes {pdf,txt,docx}_vector_db, "unified" writes one collection with file_type metadata
+INDEX_MODE = os.getenv("INDEX_MODE", "per_type")
+FILE_TYPES = ["pdf", "txt", "docx"]
+UNIFIED_STORE_NAME = "unified"
+MIGRATION_BATCH_SIZE = 1000
+
+# Incremental indexing: vectorstores/manifest.json records each file's content hash and chunk ids
+MANIFEST_FILE = "manifest.json"
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "500"))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Parsing + splitting runs in worker processes (PyPDF is CPU-bound); 1 parses in-process
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Back-pressure: at most this many files parsed ahead of the embedding stage (0 = 2 per worker)
+INGEST_MAX_INFLIGHT = int(os.getenv("INGEST_MAX_INFLIGHT", "0"))
+# Workers are recycled after this many files so parser leaks cannot accumulate (0 = never)
+INGEST_MAX_TASKS_PER_CHILD = int(os.getenv("INGEST_MAX_TASKS_PER_CHILD", "100"))
+# Soft RSS ceiling for the indexing process: above it, batches are flushed early and parsing slows to one file
+INGEST_MEMORY_LIMIT_MB = int(os.getenv("INGEST_MEMORY_LIMIT_MB", "0"))  # 0 = no ceiling
+
+# Embedding stage: EMBED_CONCURRENCY requests of EMBED_BATCH_SIZE chunks in flight, throttled to EMBED_TPM_LIMIT
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_TPM_LIMIT = int(os.getenv("EMBED_TPM_LIMIT", "1000000"))  # 0 disables throttling
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")  # empty disables the cache
+
+# Memory-mapped numpy backend: exported automatically after a build when VECTOR_BACKEND=numpy
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_DIR = "numpy_index"
+NUMPY_DTYPE = os.getenv("NUMPY_INDEX_DTYPE", "float16")
+NUMPY_IVF_LISTS = int(os.getenv("NUMPY_IVF_LISTS", "0"))
+BM25_INDEX_FILE = "bm25_index.sqlite3"
+LEGACY_BM25_INDEX_FILE = "bm25_index.json"
+# Chunks read back from Chroma per page when exporting the numpy and BM25 indexes
+READ_PAGE_SIZE = int(os.getenv("READ_PAGE_SIZE", "1000"))
+
+# Builds run in a new version directory next to the index path; this many published versions are kept
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+
 embeddings_app = FastAPI()
 
 embeddings_app.add_middleware(
@@ -29,101 +88,754 @@ embeddings_app.add_middleware(
 
 class EmbeddingInput(BaseModel):
     folder_path: str = "documents"
+    index_mode: str = None
+    full_rebuild: bool = False
 
-def get_all_document_paths(folder="documents"):
-    """Return all PDF, TXT, and DOCX files in the specified folder."""
+def iter_document_paths(folder="documents"):
+    """Yield all PDF, TXT, and DOCX files under the folder, recursively (hidden directories skipped)."""
     supported_exts = (".pdf", ".txt", ".docx")
-    return [os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(supported_exts)]
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for f in sorted(files):
+            if f.lower().endswith(supported_exts):
+                yield os.path.join(root, f)
+
+def get_all_document_paths(folder="documents"):
+    """Return all PDF, TXT, and DOCX files under the specified folder."""
+    return list(iter_document_paths(folder))
+
+def current_rss_mb() -> float:
+    """Resident memory of this process (Linux /proc/self/statm); 0 where unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0.0
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+def over_memory_limit() -> bool:
+    return bool(INGEST_MEMORY_LIMIT_MB) and current_rss_mb() > INGEST_MEMORY_LIMIT_MB
+
+LOADERS = {
+    "pdf": PyPDFLoader,
+    "txt": lambda path: TextLoader(path, encoding="utf-8"),
+    "docx": Docx2txtLoader,
+}
+
+def load_file(path: str):
+    """
+    Load one document and attach metadata (filename, type, timestamp).
+    The loader is picked by extension; loader errors propagate to the caller.
+    """
+    ext = path.split(".")[-1].lower()
+    if ext not in LOADERS:
+        raise ValueError(f"Unsupported file type: {ext}")
+
+    loaded_docs = LOADERS[ext](path).load()
+
+    # Attach metadata to each document
+    for doc in loaded_docs:
+        if doc.metadata is None:
+            doc.metadata = {}
+
+        # Add custom metadata fields
+        doc.metadata["source_file"] = os.path.basename(path)  # filename
+        doc.metadata["file_type"] = ext                       # extension
+        doc.metadata["full_path"] = os.path.abspath(path)    # full path
+        doc.metadata["loaded_at"] = datetime.now().isoformat()  # timestamp
+
+    return loaded_docs
+
+def write_index_version(base_dir="vectorstores"):
+    """Bump the index version marker so running chat apps reload their vector stores."""
+    os.makedirs(base_dir, exist_ok=True)
+    path = os.path.join(base_dir, ".index_version")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(datetime.now().isoformat())
+    os.replace(tmp_path, path)
+
+# -------------------------
+# Incremental indexing
+# -------------------------
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(path: str, text: str, occurrence: int = 0) -> str:
+    """
+    Deterministic chunk id from the file path and the chunk text.
+    `occurrence` separates identical chunks within one file.
+    An unchanged chunk keeps its id when other parts of the file are edited.
+    """
+    key = f"{os.path.normpath(path)}\0{occurrence}\0{text}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+def split_file(path: str):
+    """Load and split one file. Every chunk gets a deterministic id in metadata["chunk_id"]."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = splitter.split_documents(load_file(path))
+
+    seen = {}
+    for index, chunk in enumerate(chunks):
+        occurrence = seen.get(chunk.page_content, 0)
+        seen[chunk.page_content] = occurrence + 1
+        chunk.metadata["chunk_index"] = index
+        chunk.metadata["chunk_id"] = chunk_id(path, chunk.page_content, occurrence)
+    return chunks
+
+def parse_file(path: str) -> dict:
+    """Worker entry point: load + split one file, never raising so one bad file cannot stop a run."""
+    started = time.perf_counter()
+    try:
+        chunks = split_file(path)
+        error = None
+    except Exception as e:
+        chunks = []
+        error = f"{type(e).__name__}: {e}"
+    return {"path": path, "chunks": chunks, "seconds": time.perf_counter() - started, "error": error}
 
-def load_documents_by_type(paths: list[str], file_type: str):
+def parse_files(paths, workers: int = None, max_inflight: int = None):
     """
-    Load documents of a specific type and attach metadata (filename, type, timestamp).
+    Parse and split files in a single pass, yielding parse_file results as they complete.
+    `paths` may be a lazy iterable: at most `max_inflight` files are parsed ahead of the consumer
+    (one while over the memory ceiling), so memory does not grow with the corpus.
     """
-    docs = []
-    for path in paths:
-        ext = path.split(".")[-1].lower()
-        if ext != file_type:
+    paths = iter(paths)
+    workers = max(1, workers or INGEST_WORKERS)
+    if workers == 1:
+        for path in paths:
+            yield parse_file(path)
+        return
+
+    max_inflight = max_inflight or INGEST_MAX_INFLIGHT or workers * 2
+    # spawn: forking a process that already holds Chroma/HTTP client threads is not safe
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=INGEST_MAX_TASKS_PER_CHILD or None,
+    )
+    try:
+        inflight = set()
+        exhausted = False
+        while True:
+            limit = 1 if over_memory_limit() else max_inflight
+            while not exhausted and len(inflight) < limit:
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                    break
+                inflight.add(pool.submit(parse_file, path))
+            if not inflight:
+                return
+            done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        # Also reached when the consumer stops early (e.g. a cancelled job): drop queued files
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def load_manifest(base_dir="vectorstores") -> dict:
+    path = os.path.join(base_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"index_mode": None, "files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict, base_dir="vectorstores"):
+    os.makedirs(base_dir, exist_ok=True)
+    path = os.path.join(base_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+def store_path(base_dir: str, name: str) -> str:
+    return os.path.join(base_dir, f"{name}_vector_db")
+
+def reset_stores(base_dir: str, mode: str, embeddings):
+    """
+    Clear the stores before a full rebuild. Stores of the target layout are emptied in place;
+    stores of the other layout are removed so INDEX_MODE=auto does not pick them up.
+    Pre-manifest stores hold random ids, so they are cleared too instead of being appended to.
+    """
+    target = [UNIFIED_STORE_NAME] if mode == "unified" else FILE_TYPES
+    for name in [UNIFIED_STORE_NAME] + FILE_TYPES:
+        path = store_path(base_dir, name)
+        if not os.path.exists(path):
             continue
-        
-        try:
-            if ext == "pdf":
-                loader = PyPDFLoader(path)
-            elif ext == "txt":
-                loader = TextLoader(path, encoding="utf-8")
-            elif ext == "docx":
-                loader = Docx2txtLoader(path)
-            
-            loaded_docs = loader.load()
-            
-            # Attach metadata to each document
-            for doc in loaded_docs:
-                if doc.metadata is None:
-                    doc.metadata = {}
-                
-                # Add custom metadata fields
-                doc.metadata["source_file"] = os.path.basename(path)  # filename
-                doc.metadata["file_type"] = ext                       # extension
-                doc.metadata["full_path"] = os.path.abspath(path)    # full path
-                doc.metadata["loaded_at"] = datetime.now().isoformat()  # timestamp
-                
-            docs.extend(loaded_docs)
-        except Exception as e:
-            print(f"Error loading {path}: {e}")
+        if name in target:
+            Chroma(persist_directory=path, embedding_function=embeddings).delete_collection()
+        else:
+            shutil.rmtree(path)
+        print(f"✓ Cleared {path}")
+
+def upsert_chunks(vectordb, chunks, vectors):
+    """Write chunks with precomputed embeddings under their deterministic ids, in batches Chroma accepts."""
+    for start in range(0, len(chunks), INDEX_BATCH_SIZE):
+        batch = chunks[start:start + INDEX_BATCH_SIZE]
+        vectordb._collection.upsert(
+            ids=[c.metadata["chunk_id"] for c in batch],
+            embeddings=vectors[start:start + INDEX_BATCH_SIZE],
+            documents=[c.page_content for c in batch],
+            metadatas=[c.metadata for c in batch],
+        )
+
+def delete_chunks(vectordb, ids):
+    for start in range(0, len(ids), INDEX_BATCH_SIZE):
+        vectordb.delete(ids=ids[start:start + INDEX_BATCH_SIZE])
+
+# -------------------------
+# Embedding stage
+# -------------------------
+class TokenRateLimiter:
+    """Token bucket refilled at `tokens_per_minute`; acquire() blocks until a request fits."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.available = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        if not self.capacity:
+            return
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                wait = (tokens - self.available) * 60 / self.capacity
+            time.sleep(wait)
+
+class ChunkEmbedder:
+    """
+    Embeds chunk texts in fixed-size batches with bounded concurrency.
+    Cached vectors (by model + text hash) are reused; each request is throttled
+    to the token budget and retried with exponential backoff.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache = None, batch_size=EMBED_BATCH_SIZE,
+                 concurrency=EMBED_CONCURRENCY, tokens_per_minute=EMBED_TPM_LIMIT, max_retries=EMBED_MAX_RETRIES):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", None) or EMBEDDING_MODEL
+        self.cache = cache
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.limiter = TokenRateLimiter(tokens_per_minute)
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+
+        self.started = time.perf_counter()
+        self.chunks = 0
+        self.cache_hits = 0
+        self.requests = 0
+        self.retries = 0
+        self.tokens = 0
+
+    def _embed_batch(self, texts):
+        tokens = sum(count_tokens(t, self.model) for t in texts)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+                with self._lock:
+                    self.requests += 1
+                    self.tokens += tokens
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(60, 2 ** attempt) * (0.5 + random.random() / 2)
+                with self._lock:
+                    self.retries += 1
+                print(f"Embedding batch of {len(texts)} failed ({e}); retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        hashes = [EmbeddingCache.text_hash(t) for t in texts]
+        unique = dict(zip(hashes, texts))
+        vectors = self.cache.get_many(self.model, list(unique)) if self.cache is not None else {}
+        self.cache_hits += sum(1 for h in hashes if h in vectors)
+
+        missing = [h for h in unique if h not in vectors]
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(self._embed_batch, [unique[h] for h in batch]): batch for batch in batches}
+            for future in as_completed(futures):
+                embedded = dict(zip(futures[future], future.result()))
+                # Persist each batch as soon as it lands, so a crash later in the run loses nothing
+                if self.cache is not None:
+                    self.cache.put_many(self.model, embedded)
+                vectors.update(embedded)
+
+        self.chunks += len(texts)
+        return [vectors[h] for h in hashes]
+
+    def stats(self) -> dict:
+        seconds = time.perf_counter() - self.started
+        return {
+            "model": self.model,
+            "chunks": self.chunks,
+            "cache_hits": self.cache_hits,
+            "requests": self.requests,
+            "retries": self.retries,
+            "tokens": self.tokens,
+            "seconds": round(seconds, 3),
+            "chunks_per_second": round(self.chunks / seconds, 1) if seconds else None,
+        }
+
+def index_documents(paths, index_mode: str = None, base_dir="vectorstores", full: bool = False,
+                    job: Job = None):
+    """
+    Bring the index in line with `paths` (a list or a lazy iterable), embedding only what changed.
+
+    Files whose size/mtime (then content hash) match the manifest are skipped without being parsed.
+    Changed files are re-split; only chunks with new ids are embedded (through ChunkEmbedder, in
+    batches across files), and ids that disappeared are deleted.
+    Files no longer present have all their chunks deleted.
+    A missing manifest, a changed index mode or full=True triggers a full rebuild.
+    Progress goes to `job` (which may raise JobCancelled between files and batches).
+
+    Stages are streamed: discovery -> hash check -> parse/split (bounded in flight) -> embed/persist
+    in fixed-size batches, so peak memory depends on batch sizes, not on corpus size.
+    """
+    report = job.update if job else (lambda phase=None, **progress: None)
+    mode = index_mode or INDEX_MODE
+    embeddings = get_embeddings()
+    manifest = load_manifest(base_dir)
+    old_files = manifest.get("files", {})
+    if full or manifest.get("index_mode") != mode:
+        print(f"Full rebuild (index mode {manifest.get('index_mode')} -> {mode})")
+        reset_stores(base_dir, mode, embeddings)
+        old_files = {}
+
+    stores = {}
+
+    def get_store(name):
+        if name not in stores:
+            stores[name] = Chroma(persist_directory=store_path(base_dir, name), embedding_function=embeddings)
+        return stores[name]
+
+    embedder = ChunkEmbedder(embeddings, cache=EmbeddingCache(EMBEDDING_CACHE_PATH) if EMBEDDING_CACHE_PATH else None)
+    batch_chunks = embedder.batch_size * embedder.concurrency
+    buffer = []  # (store, chunk) waiting to be embedded
+    peak_rss = current_rss_mb()
+
+    def flush(size=None):
+        """Embed and persist the first `size` buffered chunks (all of them by default)."""
+        nonlocal peak_rss
+        batch = buffer[:size] if size else list(buffer)
+        if not batch:
+            return
+        del buffer[:len(batch)]
+        vectors = embedder.embed([chunk.page_content for _, chunk in batch])
+        by_store = {}
+        for (store, chunk), vector in zip(batch, vectors):
+            by_store.setdefault(store, ([], []))
+            by_store[store][0].append(chunk)
+            by_store[store][1].append(vector)
+        for store, (chunks, store_vectors) in by_store.items():
+            upsert_chunks(get_store(store), chunks, store_vectors)
+        stats = embedder.stats()
+        rss = current_rss_mb()
+        peak_rss = max(peak_rss, rss)
+        print(f"Embedded {stats['chunks']} chunks ({stats['cache_hits']} cached), {stats['chunks_per_second']} chunks/s, RSS {rss:.0f} MB")
+        report(chunks_embedded=stats["chunks"], chunks_cached=stats["cache_hits"],
+               chunks_per_second=stats["chunks_per_second"], rss_mb=round(rss, 1))
+
+    files = {}
+    counts = {
+        "files": {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0},
+        "chunks": {"added": 0, "removed": 0, "unchanged": 0},
+    }
+    pending = {}  # path -> hash/stat info, only for files currently between the two stages
+    scanned = 0
+
+    def changed_paths():
+        """Stage 1 (in-process, lazy): yield the files that need parsing."""
+        nonlocal scanned
+        for path in paths:
+            scanned += 1
+            report(files_seen=scanned)
+            key = os.path.normpath(path)
+            stat = os.stat(path)
+            old = old_files.get(key)
+            if old and old["size"] == stat.st_size and old["mtime"] == stat.st_mtime:
+                files[key] = old
+                counts["files"]["unchanged"] += 1
+                counts["chunks"]["unchanged"] += len(old["chunks"])
+                continue
+
+            digest = file_sha256(path)
+            if old and old["sha256"] == digest:
+                files[key] = {**old, "size": stat.st_size, "mtime": stat.st_mtime}
+                counts["files"]["unchanged"] += 1
+                counts["chunks"]["unchanged"] += len(old["chunks"])
+                continue
+
+            pending[path] = {"key": key, "sha256": digest, "size": stat.st_size, "mtime": stat.st_mtime}
+            yield path
+
+    # Stage 2: parse + split in the worker pool, applying each file as soon as it is ready
+    report("indexing", files_seen=0, files_done=0, chunks_embedded=0)
+    slowest = []  # min-heap of the slowest parses, kept small regardless of corpus size
+    errors = {}
+    started = time.perf_counter()
+    for done, result in enumerate(parse_files(changed_paths()), start=1):
+        report(files_done=done)
+        path = result["path"]
+        info = pending.pop(path)
+        key = info["key"]
+        old = old_files.get(key)
+        heapq.heappush(slowest, (result["seconds"], key, len(result["chunks"])))
+        if len(slowest) > 20:
+            heapq.heappop(slowest)
+        if result["error"]:
+            # Leave the previously indexed version (if any) in place and retry on the next run
+            errors[key] = result["error"]
+            if job:
+                job.add_errors({key: result["error"]})
+            counts["files"]["failed"] += 1
+            if old:
+                files[key] = old
+            print(f"✗ {key}: {result['error']} ({result['seconds']:.2f}s)")
+            continue
+
+        file_type = path.split(".")[-1].lower()
+        store = UNIFIED_STORE_NAME if mode == "unified" else file_type
+        chunks = result["chunks"]
+        new_ids = [c.metadata["chunk_id"] for c in chunks]
+        old_ids = set(old["chunks"]) if old else set()
+
+        added = [c for c in chunks if c.metadata["chunk_id"] not in old_ids]
+        kept = [c for c in chunks if c.metadata["chunk_id"] in old_ids]
+        removed = sorted(old_ids - set(new_ids))
+
+        vectordb = get_store(store)
+        if removed:
+            delete_chunks(vectordb, removed)
+        if kept:
+            # Same text, so no re-embedding; refresh page numbers / chunk positions only
+            vectordb._collection.update(ids=[c.metadata["chunk_id"] for c in kept], metadatas=[c.metadata for c in kept])
+
+        buffer.extend((store, c) for c in added)
+        while len(buffer) >= batch_chunks:
+            flush(batch_chunks)
+        if over_memory_limit():
+            flush()
+
+        files[key] = {
+            "sha256": info["sha256"],
+            "size": info["size"],
+            "mtime": info["mtime"],
+            "file_type": file_type,
+            "store": store,
+            "chunks": new_ids,
+        }
+        counts["files"]["updated" if old else "added"] += 1
+        counts["chunks"]["added"] += len(added)
+        counts["chunks"]["removed"] += len(removed)
+        counts["chunks"]["unchanged"] += len(kept)
+        print(f"✓ {key}: +{len(added)} -{len(removed)} ={len(kept)} chunks ({result['seconds']:.2f}s parse)")
+    flush()
+
+    for key, old in old_files.items():
+        if key in files:
             continue
-    
-    return docs
+        if os.path.exists(store_path(base_dir, old["store"])):
+            delete_chunks(get_store(old["store"]), old["chunks"])
+        counts["files"]["removed"] += 1
+        counts["chunks"]["removed"] += len(old["chunks"])
+        print(f"✓ {key}: removed {len(old['chunks'])} chunks")
+
+    save_manifest({"index_mode": mode, "files": files}, base_dir)
+    changed = any(counts["files"][k] for k in ("added", "updated", "removed"))
+    counts["changed"] = changed
+    counts["total_chunks"] = sum(len(entry["chunks"]) for entry in files.values())
+    counts["ingest"] = {
+        "workers": INGEST_WORKERS,
+        "seconds": round(time.perf_counter() - started, 3),
+        "slowest_files": [
+            {"file": key, "seconds": round(seconds, 3), "chunks": n}
+            for seconds, key, n in sorted(slowest, reverse=True)
+        ],
+        "errors": errors,
+        "peak_rss_mb": round(max(peak_rss, current_rss_mb()), 1),
+    }
+    counts["embedding"] = embedder.stats()
+    return counts
 
 def create_embeddings_by_type(paths: list[str]):
+    """Incrementally index documents into one store per file type."""
+    return index_documents(paths, index_mode="per_type")
+
+def create_embeddings_unified(paths: list[str]):
     """
-    Create embeddings for documents grouped by type, preserving all metadata.
+    Incrementally index documents into ONE collection for all document types. Chunks carry
+    file_type/source_file metadata so queries can filter instead of searching separate databases.
     """
-    embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+    return index_documents(paths, index_mode="unified")
 
-    types = ["pdf", "txt", "docx"]
-    results = {}
+def create_embeddings(paths, index_mode: str = None, base_dir="vectorstores", full: bool = False,
+                      job: Job = None):
+    """Update the index in the configured mode, then rebuild the derived indexes if anything changed."""
+    results = index_documents(paths, index_mode=index_mode, base_dir=base_dir, full=full, job=job)
+    if not results["changed"] and os.path.exists(os.path.join(base_dir, BM25_INDEX_FILE)):
+        print("✓ Index is up to date")
+        return results
+
+    if job:
+        job.update("finalizing")
+    write_index_version(base_dir)
+    results["bm25_index"] = build_lexical_index(base_dir)
+    if VECTOR_BACKEND == "numpy":
+        results["numpy_index"] = export_numpy_index(base_dir)
+    return results
+
+def build_index_staged(paths, index_mode: str = None, base_dir="vectorstores", full: bool = False,
+                       job: Job = None):
+    """
+    Build into a new version directory (seeded with the live index) and publish it only on success,
+    by repointing the `base_dir` symlink. Running chat apps keep serving the previous version until
+    they see the new .index_version. A failed or cancelled build leaves the live index untouched.
+    The caller holds the IndexLock.
+    """
+    staging = create_staging_dir(base_dir, copy_current=not full)
+    try:
+        results = create_embeddings(paths, index_mode=index_mode, base_dir=staging, full=full, job=job)
+        if results["changed"] or not os.path.exists(base_dir):
+            if job:
+                job.update("publishing")
+            release_chroma_clients(staging)
+            publish_index_dir(staging, base_dir, keep=INDEX_KEEP_VERSIONS)
+            results["index_dir"] = staging
+            print(f"✓ Published {staging} as {base_dir}")
+            return results
+    except BaseException:
+        release_chroma_clients(staging)
+        discard_staging_dir(staging)
+        raise
+
+    release_chroma_clients(staging)
+    discard_staging_dir(staging)
+    return results
+
+def open_chunk_stores(base_dir="vectorstores"):
+    """(name, Chroma) for the unified collection if present, else for each existing per-type store."""
+    embeddings = get_embeddings()
+    unified_path = os.path.join(base_dir, f"{UNIFIED_STORE_NAME}_vector_db")
+    if os.path.exists(unified_path):
+        sources = {UNIFIED_STORE_NAME: unified_path}
+    else:
+        sources = {t: os.path.join(base_dir, f"{t}_vector_db") for t in FILE_TYPES}
+    return [
+        (name, Chroma(persist_directory=path, embedding_function=embeddings))
+        for name, path in sources.items() if os.path.exists(path)
+    ]
+
+def iter_store_chunks(stores, include_embeddings=False, page_size=None):
+    """
+    Page through every persisted chunk of `stores` (from open_chunk_stores), READ_PAGE_SIZE at a time.
+    Yields (ids, texts, metadatas, embeddings) per page; embeddings is empty unless requested.
+    """
+    page_size = page_size or READ_PAGE_SIZE
+    include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+    for name, store in stores:
+        offset = 0
+        while True:
+            data = store.get(include=include, limit=page_size, offset=offset)
+            if not data["ids"]:
+                break
+            metadatas = []
+            for m in data["metadatas"]:
+                m = dict(m or {})
+                if name != UNIFIED_STORE_NAME:
+                    m.setdefault("file_type", name)
+                metadatas.append(m)
+            vectors = data["embeddings"] if include_embeddings else []
+            yield data["ids"], data["documents"], metadatas, vectors
+            offset += len(data["ids"])
+
+def export_numpy_index(base_dir="vectorstores", dtype: str = None, nlist: int = None):
+    """Export the Chroma stores into the memory-mapped numpy format served by VECTOR_BACKEND=numpy."""
+    stores = open_chunk_stores(base_dir)
+    count = sum(store._collection.count() for _, store in stores)
+    if not count:
+        return "No vectors to export"
+
+    writer = NumpyIndexWriter(os.path.join(base_dir, NUMPY_INDEX_DIR), count, dtype=dtype or NUMPY_DTYPE)
+    for ids, texts, metadatas, vectors in iter_store_chunks(stores, include_embeddings=True):
+        writer.add(ids, vectors, texts, metadatas)
+    result = writer.finish(nlist=NUMPY_IVF_LISTS if nlist is None else nlist)
+    write_index_version(base_dir)
+    print(f"✓ Exported {result['chunks']} chunks to {result['path']}")
+    return result
 
-    for t in types:
-        # Load documents with metadata
-        docs = load_documents_by_type(paths, t)
-        if not docs:
-            results[t] = "No documents of this type"
+def build_lexical_index(base_dir="vectorstores"):
+    """Build the persisted BM25 index over the same chunks (and chunk ids) as the vector index."""
+    path = os.path.join(base_dir, BM25_INDEX_FILE)
+    legacy_path = os.path.join(base_dir, LEGACY_BM25_INDEX_FILE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    builder = BM25Builder(path)
+    for ids, texts, metadatas, _ in iter_store_chunks(open_chunk_stores(base_dir)):
+        builder.add(ids, texts, metadatas)
+    if not builder.count:
+        builder.discard()
+        if os.path.exists(path):
+            os.remove(path)
+        return "No chunks to index"
+
+    index = builder.build()
+    write_index_version(base_dir)
+    print(f"✓ BM25 index: {len(index)} chunks, {index.term_count} terms")
+    return {"path": path, "chunks": len(index), "terms": index.term_count}
+
+def migrate_to_unified(base_dir="vectorstores"):
+    """
+    Merge existing per-type stores into the unified collection.
+    Stored embeddings are copied as-is, so nothing is re-embedded.
+    Chunk ids are kept, so the manifest only needs its store names switched.
+    """
+    embeddings = get_embeddings()
+    unified = Chroma(
+        persist_directory=store_path(base_dir, UNIFIED_STORE_NAME),
+        embedding_function=embeddings
+    )
+
+    results = {}
+    for t in FILE_TYPES:
+        path = store_path(base_dir, t)
+        if not os.path.exists(path):
+            results[t] = "Not found"
             continue
 
-        # Split documents - metadata is automatically copied to chunks
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        split_docs = splitter.split_documents(docs)
+        store = Chroma(persist_directory=path, embedding_function=embeddings)
+        data = store.get(include=["embeddings", "documents", "metadatas"])
+        ids = data["ids"]
 
-        # Verify metadata is on chunks (debugging)
-        for chunk in split_docs[:1]:  # Check first chunk
-            print(f"[{t}] Chunk metadata: {chunk.metadata}")
+        for start in range(0, len(ids), MIGRATION_BATCH_SIZE):
+            end = start + MIGRATION_BATCH_SIZE
+            metadatas = [dict(m or {}) for m in data["metadatas"][start:end]]
+            for m in metadatas:
+                m.setdefault("file_type", t)
+            unified._collection.upsert(
+                ids=ids[start:end],
+                embeddings=data["embeddings"][start:end],
+                documents=data["documents"][start:end],
+                metadatas=metadatas,
+            )
 
-        # Create vector store with metadata
-        vectordb = Chroma.from_documents(
-            documents=split_docs,
-            embedding=embeddings,
-            persist_directory=f"vectorstores/{t}_vector_db"
-        )
+        results[t] = {"chunks": len(ids)}
+        print(f"✓ Migrated {len(ids)} chunks from {path}")
 
-        results[t] = {
-            "chunks": len(split_docs),
-            "path": f"vectorstores/{t}_vector_db",
-            "metadata_stored": True
-        }
+    manifest = load_manifest(base_dir)
+    if manifest.get("files"):
+        for entry in manifest["files"].values():
+            entry["store"] = UNIFIED_STORE_NAME
+        manifest["index_mode"] = "unified"
+        save_manifest(manifest, base_dir)
 
+    write_index_version(base_dir)
+    results["bm25_index"] = build_lexical_index(base_dir)
+    if VECTOR_BACKEND == "numpy":
+        results["numpy_index"] = export_numpy_index(base_dir)
     return results
 
-@embeddings_app.post("/create_embedding")
+# -------------------------
+# Background ingestion jobs
+# -------------------------
+ingest_jobs = JobRegistry()
+
+@embeddings_app.post("/create_embedding", status_code=202)
 async def create_embedding_endpoint(body: EmbeddingInput = None):
-    """Create embeddings for all documents with metadata preserved."""
-    folder = body.folder_path if body else "documents"
-    file_paths = get_all_document_paths(folder)
-    
-    if not file_paths:
-        return {"error": f"No documents found in folder: {folder}"}
-    
-    try:
-        result = create_embeddings_by_type(file_paths)
-        return result
-    except Exception as e:
-        return {"error": str(e)}
+    """
+    Start a background (re)index of a folder and return its job id right away.
+    Only one rebuild of the index runs at a time; a second request gets 409.
+    """
+    body = body or EmbeddingInput()
+    if not os.path.isdir(body.folder_path) or next(iter_document_paths(body.folder_path), None) is None:
+        return JSONResponse({"error": f"No documents found in folder: {body.folder_path}"}, status_code=400)
+
+    base_dir = "vectorstores"
+    lock = IndexLock(base_dir)
+    if not lock.acquire():
+        running = [j["job_id"] for j in ingest_jobs.list() if j["status"] in ("queued", "running")]
+        return JSONResponse(
+            {"error": "A rebuild of this index is already running", "job_ids": running},
+            status_code=409,
+        )
+
+    job = ingest_jobs.submit(
+        "ingest",
+        lambda job: build_index_staged(
+            iter_document_paths(body.folder_path), index_mode=body.index_mode, base_dir=base_dir,
+            full=body.full_rebuild, job=job,
+        ),
+        params={"folder_path": body.folder_path, "index_mode": body.index_mode or INDEX_MODE,
+                "full_rebuild": body.full_rebuild},
+        on_finish=lambda job: lock.release(),
+    )
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+@embeddings_app.get("/jobs")
+async def list_jobs():
+    return {"jobs": ingest_jobs.list()}
+
+@embeddings_app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Phase, files/chunks processed, throughput, errors and (when done) the build result."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job.to_dict()
+
+@embeddings_app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Stop a job at its next file or batch boundary; the live index is not modified."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return {"job_id": job.id, "cancel_requested": job.cancel(), "status": job.status}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or migrate the document vector index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Embed new and changed documents in a folder")
+    build_parser.add_argument("--folder", default="documents")
+    build_parser.add_argument("--mode", choices=["per_type", "unified"], default=None)
+    build_parser.add_argument("--full", action="store_true", help="Re-embed everything instead of only changes")
+
+    migrate_parser = subparsers.add_parser("migrate", help="Merge per-type stores into one unified collection")
+    migrate_parser.add_argument("--base-dir", default="vectorstores")
+
+    subparsers.add_parser("build-bm25", help="Rebuild the BM25 lexical index from the vector stores").add_argument(
+        "--base-dir", default="vectorstores"
+    )
+
+    export_parser = subparsers.add_parser("export-numpy", help="Export the Chroma index to the memory-mapped numpy format")
+    export_parser.add_argument("--base-dir", default="vectorstores")
+    export_parser.add_argument("--dtype", choices=["float16", "int8"], default=None)
+    export_parser.add_argument("--ivf-lists", type=int, default=None)
+
+    args = parser.parse_args()
+    with IndexLock(getattr(args, "base_dir", "vectorstores")):
+        if args.command == "build":
+            print(build_index_staged(iter_document_paths(args.folder), index_mode=args.mode, full=args.full))
+        elif args.command == "migrate":
+            print(migrate_to_unified(args.base_dir))
+        elif args.command == "build-bm25":
+            print(build_lexical_index(args.base_dir))
+        else:
+            print(export_numpy_index(args.base_dir, dtype=args.dtype, nlist=args.ivf_lists))
 
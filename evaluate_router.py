@@ -0,0 +1,84 @@
+"""
+Offline evaluation of the local routing tier against the LLM classifiers.
+
+Usage:
+    python evaluate_router.py                      # built-in held-out set (utils/route_examples.py)
+    python evaluate_router.py --labels data.jsonl  # lines of {"query": ..., "sensitive": bool, "news": bool}
+    python evaluate_router.py --skip-llm           # labels only, no LLM calls
+"""
+import json
+import argparse
+
+from utils.route_examples import EVAL_QUERIES
+from router_handler import local_route
+from sensitive_handler import is_sensitive
+from news_handler import is_news_queury
+
+
+def load_labeled_set(path=None):
+    if not path:
+        return [{"query": q, "sensitive": s, "news": n} for q, s, n in EVAL_QUERIES]
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(samples, skip_llm=False):
+    local_decided = 0
+    agree_llm = 0
+    agree_label = 0
+    guard_violations = []
+    rows = []
+
+    for sample in samples:
+        query = sample["query"]
+        local = local_route(query)
+
+        llm = None
+        if not skip_llm:
+            # Call the undecorated classifiers so cached results do not hide disagreements
+            llm_sensitive = is_sensitive.__wrapped__(query)
+            llm_news = is_news_queury.__wrapped__(query)
+            llm = {"sensitive": llm_sensitive, "news": llm_news}
+
+        row = {"query": query, "label": {"sensitive": sample["sensitive"], "news": sample["news"]}, "local": local, "llm": llm}
+        rows.append(row)
+        if local is None:
+            continue
+
+        local_decided += 1
+        local_flags = (local["sensitive"], local["news"])
+        if (sample["sensitive"], sample["news"]) == local_flags:
+            agree_label += 1
+        if llm is not None and (llm["sensitive"], llm["news"]) == local_flags:
+            agree_llm += 1
+        # The local tier must never clear a query that is actually sensitive
+        if sample["sensitive"] or (llm is not None and llm["sensitive"]):
+            guard_violations.append(query)
+
+    total = len(samples)
+    return {
+        "samples": total,
+        "local_coverage": round(local_decided / total, 4) if total else None,
+        "local_decided": local_decided,
+        "local_agreement_with_labels": round(agree_label / local_decided, 4) if local_decided else None,
+        "local_agreement_with_llm": round(agree_llm / local_decided, 4) if local_decided and not skip_llm else None,
+        "sensitive_guard_violations": guard_violations,
+        "rows": rows,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the local router with the LLM classifiers.")
+    parser.add_argument("--labels", default=None, help="JSONL file with query/sensitive/news labels")
+    parser.add_argument("--skip-llm", action="store_true", help="Only compare against labels")
+    parser.add_argument("--verbose", action="store_true", help="Print every query's decisions")
+    args = parser.parse_args()
+
+    report = evaluate(load_labeled_set(args.labels), skip_llm=args.skip_llm)
+    rows = report.pop("rows")
+    if args.verbose:
+        for row in rows:
+            print(json.dumps(row))
+    print(json.dumps(report, indent=2))
+    if report["sensitive_guard_violations"]:
+        raise SystemExit(1)
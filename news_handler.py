@@ -1,11 +1,31 @@
+import os
 import re
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import AIMessage
 from utils.prompt import TRUSTED_SOURCES
-
-llm = ChatOpenAI()
-
-def is_news_queury(user_query: str) -> bool:
+from utils.cache import make_query_cache, memoize_query
+from utils.llm import ainvoke_with_timeout, astream_with_timeout, chunk_text, get_chat_llm
+from utils.history import fit_messages
+from utils.metrics import registry as metrics_registry, span
+from utils.response_cache import TimeBucketedCache
+
+llm = get_chat_llm()
+
+# What counts as "current" drifts, so news classifications expire much sooner than sensitive ones
+NEWS_CLASSIFIER_CACHE_TTL_SECONDS = float(os.getenv("NEWS_CLASSIFIER_CACHE_TTL_SECONDS", "900"))
+NEWS_CLASSIFIER_CACHE_SIZE = int(os.getenv("NEWS_CLASSIFIER_CACHE_SIZE", "4096"))
+news_classifier_cache = make_query_cache(
+    "is_news_queury", maxsize=NEWS_CLASSIFIER_CACHE_SIZE, ttl=NEWS_CLASSIFIER_CACHE_TTL_SECONDS
+)
+metrics_registry.register_cache("news_classifier", news_classifier_cache)
+
+# News answers go stale in minutes; during a breaking story most users ask the same few questions
+NEWS_CACHE_FRESH_SECONDS = float(os.getenv("NEWS_CACHE_FRESH_SECONDS", "300"))
+NEWS_CACHE_TTL_SECONDS = float(os.getenv("NEWS_CACHE_TTL_SECONDS", "1800"))
+NEWS_CACHE_SIZE = int(os.getenv("NEWS_CACHE_SIZE", "2048"))
+news_response_cache = TimeBucketedCache("news", NEWS_CACHE_FRESH_SECONDS, NEWS_CACHE_TTL_SECONDS, NEWS_CACHE_SIZE)
+metrics_registry.register_cache("news_response", news_response_cache)
+
+def news_classifier_prompt(user_query: str) -> str:
     prompt = f"""
     Detect if the following query is asking about **latest, breaking, or current events** such as:
     - news happening now, live updates, breaking news, trending events
@@ -24,10 +44,10 @@ def is_news_queury(user_query: str) -> bool:
 
     Query: "{user_query}"
 """
+    return prompt
 
 
-    
-    response = llm.invoke(prompt)
+def parse_yes_no(response) -> bool:
     if isinstance(response, AIMessage):
         text = response.content
     else:
@@ -36,22 +56,28 @@ def is_news_queury(user_query: str) -> bool:
     return text.strip().upper() == "YES"
 
 
+@memoize_query(news_classifier_cache)
+def is_news_queury(user_query: str) -> bool:
+    response = llm.invoke(news_classifier_prompt(user_query))
+    return parse_yes_no(response)
+
+
+@memoize_query(news_classifier_cache)
+async def is_news_queury_async(user_query: str, timeout: float = None) -> bool:
+    with span("news_check"):
+        response = await ainvoke_with_timeout(llm, news_classifier_prompt(user_query), timeout)
+    return parse_yes_no(response)
 
 
-def query_news(user_query: str, message: list = None):
-    """
-    Use the full messages list built in application.py.
-    message: list of dicts, e.g., [{"role": "system", "content": ...}, ...]
-    """
-    print("Searching from the news handler...")
-    llm = ChatOpenAI(
-        model_name="gpt-4o-mini",
-        temperature=0,
-        model_kwargs={"tools": [{"type": "web_search_preview"}]}
-    )
 
-    # Convert the messages list into a single prompt
-    full_context = "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in (message or [])])
+
+def news_search_llm():
+    return get_chat_llm(model="gpt-4o-mini", temperature=0, tools=[{"type": "web_search_preview"}])
+
+
+def news_prompt(user_query: str, message: list = None) -> str:
+    # Convert the messages list into a single prompt, oldest turns dropped beyond the history token budget
+    full_context = "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in fit_messages(message or [])])
 
     prompt = f"""
     The user asked: "{user_query}".
@@ -64,9 +90,10 @@ def query_news(user_query: str, message: list = None):
     Conversation context:
     {full_context}
     """
+    return prompt
 
-    answer = llm.invoke(prompt)
 
+def parse_news_answer(answer) -> dict:
     # Extract text
     answer_text = "".join(
         block["text"] for block in answer.content if block.get("type") == "text"
@@ -80,3 +107,59 @@ def query_news(user_query: str, message: list = None):
         "source": urls if urls else ["Web / News"],
         "type": "News"
     }
+
+
+def query_news(user_query: str, message: list = None):
+    """
+    Use the (token-budgeted) messages list built in application.py.
+    message: list of dicts, e.g., [{"role": "system", "content": ...}, ...]
+    """
+    print("Searching from the news handler...")
+    answer = news_search_llm().invoke(news_prompt(user_query, message))
+    return parse_news_answer(answer)
+
+
+def is_standalone(message: list = None) -> bool:
+    """
+    True when the context is just the system prompt and the question (no earlier turns or summary),
+    so the answer depends on the query alone and can be shared through news_response_cache.
+    """
+    return len(message or []) <= 2
+
+
+async def query_news_async(user_query: str, message: list = None, timeout: float = None):
+    """Async variant of query_news, served from news_response_cache for first questions of a conversation."""
+    if not is_standalone(message):
+        return await fetch_news_async(user_query, message, timeout)
+    return await news_response_cache.get_or_fetch(user_query, lambda: fetch_news_async(user_query, message, timeout))
+
+
+async def fetch_news_async(user_query: str, message: list = None, timeout: float = None):
+    """Uncached news search; the LLM call is cancelled after `timeout` seconds."""
+    print("Searching from the news handler...")
+    with span("news_search"):
+        answer = await ainvoke_with_timeout(news_search_llm(), news_prompt(user_query, message), timeout)
+    return parse_news_answer(answer)
+
+
+async def astream_news(user_query: str, message: list = None):
+    """Stream the news answer text as it is generated (or the cached answer whole, see query_news_async)."""
+    standalone = is_standalone(message)
+    if standalone:
+        cached = news_response_cache.serve_cached(user_query, lambda: fetch_news_async(user_query, message))
+        if cached is not None:
+            print("Serving cached news answer")
+            yield cached["answer"]
+            return
+
+    print("Streaming from the news handler...")
+    parts = []
+    with span("news_search"):
+        async for chunk in astream_with_timeout(news_search_llm(), news_prompt(user_query, message)):
+            text = chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
+
+    if standalone and parts:
+        news_response_cache.store(user_query, parse_news_answer("".join(parts)))
@@ -1,23 +1,94 @@
 import os
+import time
+import heapq
 import asyncio
+import threading
+from datetime import datetime
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_core.documents import Document
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
+from utils.cache import LRUCache
+from utils.numpy_store import NumpyVectorStore
+from utils.bm25 import BM25Index, reciprocal_rank_fusion
+from utils.semantic_cache import SemanticCache
+from utils.index_swap import ReaderLease, release_chroma_clients
+from utils.metrics import registry as metrics_registry, span
+from utils.llm import ainvoke_with_timeout, astream_with_timeout, get_chat_llm, get_embeddings
 
 # Load environment variables
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# "auto" uses the unified collection when present, otherwise the per-type stores
+INDEX_MODE = os.getenv("INDEX_MODE", "auto")
+UNIFIED_STORE_NAME = "unified"
+# "chroma" opens the persistent Chroma stores, "numpy" the memory-mapped matrix exported by create_embeddings.py
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_DIR = "numpy_index"
+NUMPY_IVF_NPROBE = int(os.getenv("NUMPY_IVF_NPROBE", "8"))
+
+# Marker file rewritten by create_embeddings.py after every rebuild
+INDEX_VERSION_FILE = ".index_version"
+# How often (seconds) the registry stats the marker file to detect a rebuild
+RELOAD_CHECK_SECONDS = float(os.getenv("VECTORSTORE_RELOAD_CHECK_SECONDS", "5"))
+# A replaced index version stays open this long for requests still using it
+RETIRED_INDEX_GRACE_SECONDS = float(os.getenv("RETIRED_INDEX_GRACE_SECONDS", "120"))
+# Number of query embeddings kept in memory so repeated questions skip the embeddings API
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+# Retrieval: candidates per store, global top-k, and the minimum score worth answering from.
+# Scores are cosine similarities on every backend. text-embedding-ada-002 puts unrelated text at
+# about 0.70 and on-topic passages at 0.78 and above, so the useful range is narrow.
+PER_STORE_K = int(os.getenv("RAG_PER_STORE_K", "3"))
+TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+SCORE_THRESHOLD = float(os.getenv("RAG_SCORE_THRESHOLD", "0.75"))
+# "vector", "hybrid" (BM25 + vector with reciprocal rank fusion) or "lexical" (BM25 only)
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "vector")
+BM25_INDEX_FILE = "bm25_index.sqlite3"
+FUSION_CANDIDATES = int(os.getenv("RAG_FUSION_CANDIDATES", "10"))
+# Hybrid mode answers from BM25 alone (no query embedding) when the best lexical hit clears both bars
+LEXICAL_FASTPATH_COVERAGE = float(os.getenv("BM25_FASTPATH_COVERAGE", "0.9"))
+LEXICAL_FASTPATH_MIN_SCORE = float(os.getenv("BM25_FASTPATH_MIN_SCORE", "5.0"))
+# Semantic answer cache in front of RAG answering
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_MAX_MB = float(os.getenv("SEMANTIC_CACHE_MAX_MB", "32"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+
+query_embedding_cache = LRUCache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+answer_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    max_bytes=int(SEMANTIC_CACHE_MAX_MB * 1024 * 1024),
+    ttl=SEMANTIC_CACHE_TTL_SECONDS,
+)
+metrics_registry.register_cache("query_embedding", query_embedding_cache)
+metrics_registry.register_cache("semantic_answer", answer_cache)
+
 
 # -------------------------
 # Load Vector Databases
 # -------------------------
-def load_vectordbs(base_dir="vectorstores") -> Dict[str, Chroma]:
-    embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+def load_vectordbs(base_dir="vectorstores", embeddings=None, index_mode=None, backend=None) -> Dict[str, Chroma]:
+    """
+    Open the vector stores. In "unified" mode (or "auto" when a unified collection exists)
+    a single collection is returned; otherwise one store per file type.
+    The numpy backend always serves a single unified index.
+    """
+    if (backend or VECTOR_BACKEND) == "numpy":
+        path = os.path.join(base_dir, NUMPY_INDEX_DIR)
+        if os.path.exists(os.path.join(path, "index.json")):
+            print("✓ Loaded numpy index")
+            return {UNIFIED_STORE_NAME: NumpyVectorStore(path, nprobe=NUMPY_IVF_NPROBE)}
+        print(f"✗ Not found: {path}")
+        return {UNIFIED_STORE_NAME: None}
+
+    if embeddings is None:
+        embeddings = get_embeddings()
+    mode = index_mode or INDEX_MODE
 
     def load_db(name):
         path = os.path.join(base_dir, f"{name}_vector_db")
@@ -28,6 +99,10 @@ def load_vectordbs(base_dir="vectorstores") -> Dict[str, Chroma]:
             print(f"✗ Not found: {path}")
             return None
 
+    unified_path = os.path.join(base_dir, f"{UNIFIED_STORE_NAME}_vector_db")
+    if mode == "unified" or (mode == "auto" and os.path.exists(unified_path)):
+        return {UNIFIED_STORE_NAME: load_db(UNIFIED_STORE_NAME)}
+
     return {
         "txt": load_db("txt"),
         "docx": load_db("docx"),
@@ -35,65 +110,614 @@ def load_vectordbs(base_dir="vectorstores") -> Dict[str, Chroma]:
     }
 
 
+def load_lexical_index(base_dir="vectorstores") -> Optional[BM25Index]:
+    path = os.path.join(base_dir, BM25_INDEX_FILE)
+    if not os.path.exists(path):
+        print(f"✗ Not found: {path}")
+        return None
+    index = BM25Index.load(path)
+    print(f"✓ Loaded BM25 index ({len(index)} chunks)")
+    return index
+
+
+def read_index_version(base_dir="vectorstores") -> Optional[str]:
+    """Return the current on-disk index version token, or None if no index was built yet."""
+    path = os.path.join(base_dir, INDEX_VERSION_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def retire_index_dir(index_dir: str, lease: Optional[ReaderLease]):
+    """Close a replaced index version once in-flight queries are done with it, and let it be pruned."""
+    release_chroma_clients(index_dir)
+    if lease is not None:
+        lease.release()
+
+
+# -------------------------
+# Process-lifetime Vector Store Registry
+# -------------------------
+class VectorStoreRegistry:
+    """
+    Opens the vector stores once and hands out shared handles.
+    Reloads only when the on-disk index version changes or reload() is called.
+    """
+
+    def __init__(self, base_dir="vectorstores", check_interval=RELOAD_CHECK_SECONDS):
+        self.base_dir = base_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stores: Dict = {}
+        self.embeddings = None
+        self.lexical_index = None
+        self._index_version = None
+        self._index_dir = None
+        self._lease = None  # ReaderLease on _index_dir, so a rebuild does not prune it from under us
+        self._loaded_at = None
+        self._load_seconds = None
+        self._last_check = 0.0
+        self._last_error = None
+        self._reload_lock = threading.Lock()  # held while a background reload runs
+        self._reload_thread = None
+
+    def load(self) -> Dict:
+        """
+        (Re)open all stores and swap them in atomically.
+        The index path may be a symlink to a published version; stores are opened through
+        the resolved directory so each version gets its own Chroma client.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            index_dir = os.path.realpath(self.base_dir)
+            lease = self._lease
+            if index_dir != self._index_dir:
+                lease = ReaderLease(index_dir) if os.path.isdir(index_dir) else None
+                if lease is not None:
+                    lease.acquire()
+            version = read_index_version(index_dir)
+            try:
+                with span("load_vectordbs"):
+                    stores = load_vectordbs(base_dir=index_dir, embeddings=self.get_embeddings())
+                    lexical_index = load_lexical_index(index_dir)
+                self._last_error = None
+            except Exception as e:
+                print(f"Failed to load vector stores: {e}")
+                self._last_error = str(e)
+                if lease is not None and lease is not self._lease:
+                    lease.release()
+                return self._stores
+
+            previous_dir, previous_lease = self._index_dir, self._lease
+            self._lease = lease
+            self._stores = stores
+            self.lexical_index = lexical_index
+            self._index_version = version
+            self._index_dir = index_dir
+            self._loaded_at = datetime.now().isoformat()
+            self._load_seconds = round(time.perf_counter() - started, 4)
+            self._last_check = time.monotonic()
+            print(f"Vector stores loaded in {self._load_seconds}s (index version: {version})")
+
+            if previous_dir and previous_dir != index_dir:
+                timer = threading.Timer(RETIRED_INDEX_GRACE_SECONDS, retire_index_dir, args=(previous_dir, previous_lease))
+                timer.daemon = True
+                timer.start()
+            return self._stores
+
+    @property
+    def index_version(self) -> Optional[str]:
+        return self._index_version
+
+    def reload(self) -> Dict:
+        return self.load()
+
+    def _version_changed(self) -> bool:
+        self._last_check = time.monotonic()
+        version = read_index_version(self.base_dir)
+        # None while loaded means the index path is being swapped; keep serving the current one
+        return not self._loaded_at or (version != self._index_version and version is not None)
+
+    def reload_if_changed(self) -> bool:
+        """Reload if the index version marker changed since the last load. Returns True on reload."""
+        if not self._version_changed():
+            return False
+        self.load()
+        return True
+
+    def _reload_in_background(self):
+        """Open the new stores on a thread; requests keep using the current ones until the swap."""
+        if not self._reload_lock.acquire(blocking=False):
+            return  # already reloading
+
+        def run():
+            try:
+                self.load()
+            finally:
+                self._reload_lock.release()
+
+        self._reload_thread = threading.Thread(target=run, name="vectorstore-reload", daemon=True)
+        self._reload_thread.start()
+
+    def get(self) -> Dict:
+        """
+        Return the shared store handles. A rebuilt index is noticed here but opened in the
+        background, so the request path (the event loop) never waits for Chroma to load.
+        """
+        if not self._loaded_at:
+            return self.load()
+        if time.monotonic() - self._last_check >= self.check_interval and self._version_changed():
+            self._reload_in_background()
+        return self._stores
+
+    def get_embeddings(self):
+        if self.embeddings is None:
+            self.embeddings = get_embeddings()
+        return self.embeddings
+
+    def health(self) -> Dict:
+        stores = {}
+        for name, db in self._stores.items():
+            if db is None:
+                stores[name] = {"loaded": False}
+                continue
+            try:
+                count = db._collection.count() if hasattr(db, "_collection") else len(db)
+                stores[name] = {"loaded": True, "chunks": count}
+            except Exception as e:
+                stores[name] = {"loaded": True, "error": str(e)}
+
+        return {
+            "status": "ok" if any(db is not None for db in self._stores.values()) else "empty",
+            "base_dir": self.base_dir,
+            "backend": VECTOR_BACKEND,
+            "index_version": self._index_version,
+            "loaded_at": self._loaded_at,
+            "load_seconds": self._load_seconds,
+            "last_error": self._last_error,
+            "stores": stores,
+            "retrieval_mode": RETRIEVAL_MODE,
+            "bm25_chunks": len(self.lexical_index) if self.lexical_index is not None else None,
+            "query_embedding_cache": query_embedding_cache.stats(),
+            "semantic_cache": answer_cache.stats(),
+        }
+
+
+vector_registry = VectorStoreRegistry(base_dir="vectorstores")
+
+
+# -------------------------
+# Embed the Query Once
+# -------------------------
+def embed_query_sync(user_query: str, embeddings=None) -> List[float]:
+    """Blocking variant of embed_query sharing the same cache."""
+    key = " ".join(user_query.split())
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        return cached
+
+    embeddings = embeddings or vector_registry.get_embeddings()
+    vector = embeddings.embed_query(key)
+    query_embedding_cache.set(key, vector)
+    return vector
+
+
+# key -> {"task", "waiters"}: the router and retrieval embed the same query concurrently
+_embedding_flights = {}
+
+
+async def embed_query(user_query: str, embeddings=None) -> List[float]:
+    """
+    Embed the query once per request, reusing cached vectors for repeated questions.
+    Concurrent calls for the same query share one in-flight embedding call.
+    """
+    key = " ".join(user_query.split())
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        return cached
+
+    flight = _embedding_flights.get(key)
+    if flight is None or flight["task"].get_loop() is not asyncio.get_running_loop():
+        embeddings = embeddings or vector_registry.get_embeddings()
+
+        async def fill():
+            try:
+                with span("embed_query"):
+                    vector = await embeddings.aembed_query(key)
+                query_embedding_cache.set(key, vector)
+                return vector
+            finally:
+                if _embedding_flights.get(key) is flight:
+                    del _embedding_flights[key]
+
+        flight = {"task": asyncio.create_task(fill()), "waiters": 0}
+        _embedding_flights[key] = flight
+
+    flight["waiters"] += 1
+    try:
+        # Shielded so one caller going away does not cancel the call for the others
+        return await asyncio.shield(flight["task"])
+    except asyncio.CancelledError:
+        if flight["waiters"] == 1 and not flight["task"].done():
+            flight["task"].cancel()  # the last interested caller is gone
+        raise
+    finally:
+        flight["waiters"] -= 1
+
+
 # -------------------------
 # Query a Single Store
 # -------------------------
-async def query_single_store_async(store_name: str, vectordb, user_query: str, k=3) -> List[Document]:
-    """Query a single vector store asynchronously and attach store_name metadata."""
+def distance_space(vectordb) -> str:
+    """The store's distance function: "l2" (Chroma's default), "cosine" or "ip"."""
+    space = getattr(vectordb, "distance_space", None)
+    if space:
+        return space
+    try:
+        collection = vectordb._collection
+        config = collection.configuration or {}
+        return (config.get("hnsw") or {}).get("space") or (collection.metadata or {}).get("hnsw:space", "l2")
+    except Exception:
+        return "l2"
+
+
+def cosine_similarity_fn(vectordb):
+    """
+    Return the store's distance -> cosine similarity conversion, so scores from every backend
+    (and every store in a merge) are on one scale. OpenAI embeddings are unit length.
+    """
+    if distance_space(vectordb) == "l2":
+        # Chroma's l2 is the squared distance: |a - b|^2 = 2 - 2cos for unit vectors
+        return lambda distance: 1.0 - distance / 2.0
+    # cosine and inner-product distances are both 1 - similarity
+    return lambda distance: 1.0 - distance
+
+
+async def query_single_store_async(
+    store_name: str, vectordb, query_embedding: List[float], k=PER_STORE_K, metadata_filter: Optional[Dict] = None
+) -> List[Tuple[Document, float]]:
+    """
+    Query a single vector store by a precomputed query vector.
+    Returns (doc, cosine similarity) pairs and attaches store_name/score metadata.
+    """
     if vectordb is None:
         return []
 
     # Run similarity search in a background thread
-    docs = await asyncio.to_thread(vectordb.similarity_search, user_query, k=k)
+    with span("store_search", store=store_name):
+        results = await asyncio.to_thread(
+            vectordb.similarity_search_by_vector_with_relevance_scores, query_embedding, k=k, filter=metadata_filter
+        )
+    to_cosine = cosine_similarity_fn(vectordb)
 
-    # Attach store_name to each doc for tracking
-    for doc in docs:
-        doc.metadata["store_name"] = store_name
+    scored = []
+    for doc, distance in results:
+        score = to_cosine(distance)
+        # Attach store_name and score to each doc for tracking
+        # (the unified collection reports the chunk's file type instead)
+        if store_name == UNIFIED_STORE_NAME:
+            doc.metadata["store_name"] = doc.metadata.get("file_type", store_name)
+        else:
+            doc.metadata["store_name"] = store_name
+        doc.metadata["score"] = score
+        scored.append((doc, score))
 
-    return docs
+    return scored
 
 
 # -------------------------
-# Query All Vector Stores
+# Retrieve Top Docs Across Stores
 # -------------------------
-async def query_all_top3(user_query: str, vectordbs: Dict) -> Dict:
-    """
-    Query all vector stores in parallel, get ALL docs, return top 3 most relevant overall.
-    Tracks which document the answer comes from.
-    """
-    print("Querying all vector stores...")
-    llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0)
+def build_metadata_filter(file_types: Optional[List[str]] = None, source_files: Optional[List[str]] = None) -> Optional[Dict]:
+    """Build a Chroma `where` filter for the unified collection."""
+    clauses = []
+    if file_types:
+        clauses.append({"file_type": {"$in": list(file_types)}})
+    if source_files:
+        clauses.append({"source_file": {"$in": list(source_files)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+async def vector_search(
+    user_query: str,
+    vectordbs: Dict,
+    per_store_k=PER_STORE_K,
+    top_k=TOP_K,
+    file_types: Optional[List[str]] = None,
+    source_files: Optional[List[str]] = None,
+) -> List[Tuple[Document, float]]:
+    """Query all stores in parallel and merge the per-store results into a global top-k by score."""
+    if file_types:
+        # Per-type stores are filtered by skipping stores; the unified store filters on metadata
+        vectordbs = {
+            name: db for name, db in vectordbs.items()
+            if name == UNIFIED_STORE_NAME or name in file_types
+        }
+
+    # Embed the query once and fan the same vector out to every store
+    if not any(db is not None for db in vectordbs.values()):
+        return []
+    query_embedding = await embed_query(user_query)
+
+    # Per-type stores only need the source filter; their file type is implied
+    unified_filter = build_metadata_filter(file_types, source_files)
+    store_filter = build_metadata_filter(source_files=source_files)
 
     # Create all async tasks at once for all stores
     tasks = [
-        query_single_store_async(store_name, vectordbs[store_name], user_query, k=100)
-        for store_name in vectordbs.keys()
+        query_single_store_async(
+            store_name,
+            vectordb,
+            query_embedding,
+            # A single unified search already returns the global ranking
+            k=top_k if store_name == UNIFIED_STORE_NAME else per_store_k,
+            metadata_filter=unified_filter if store_name == UNIFIED_STORE_NAME else store_filter,
+        )
+        for store_name, vectordb in vectordbs.items()
     ]
 
     # Run all tasks simultaneously
     results = await asyncio.gather(*tasks)
 
-    # Combine ALL docs from all stores
-    all_docs = [doc for docs in results for doc in docs]
+    # Keep only the global top-k by cosine similarity
+    return heapq.nlargest(top_k, (pair for pairs in results for pair in pairs), key=lambda pair: pair[1])
+
+
+def lexical_search(
+    lexical_index: BM25Index, user_query: str, k: int, metadata_filter: Optional[Dict] = None
+) -> List[Tuple[Document, float]]:
+    """BM25 search. The pair score is the query-term coverage (0-1) so it is comparable to relevance."""
+    scored = []
+    for row, bm25_score, coverage in lexical_index.search(user_query, k=k, filter=metadata_filter):
+        doc = lexical_index.document(row)
+        doc.metadata["store_name"] = doc.metadata.get("file_type", "bm25")
+        doc.metadata["score"] = coverage
+        doc.metadata["bm25_score"] = bm25_score
+        scored.append((doc, coverage))
+    return scored
 
-    if not all_docs:
-        return {
-            "answer": None,
-            "sources": [],
-            "from": [],
-            "found": False,
-            "docs_count": 0
-        }
 
-    # Sort by similarity score descending
-    all_docs.sort(key=lambda d: getattr(d, "score", 0), reverse=True)
+def lexical_is_confident(lexical_hits: List[Tuple[Document, float]]) -> bool:
+    if not lexical_hits:
+        return False
+    doc, coverage = lexical_hits[0]
+    return coverage >= LEXICAL_FASTPATH_COVERAGE and doc.metadata["bm25_score"] >= LEXICAL_FASTPATH_MIN_SCORE
 
-    # Take ONLY top 3 most relevant overall
-    top_3_docs = all_docs[:3]
+
+def lexical_candidates(
+    user_query: str,
+    top_k: int,
+    file_types: Optional[List[str]] = None,
+    source_files: Optional[List[str]] = None,
+    mode: Optional[str] = None,
+    lexical_index: Optional[BM25Index] = None,
+) -> Optional[List[Tuple[Document, float]]]:
+    """BM25 candidates in hybrid/lexical mode; None in vector mode or when there is no BM25 index."""
+    mode = mode or RETRIEVAL_MODE
+    if lexical_index is None:
+        lexical_index = vector_registry.lexical_index
+    if mode not in ("hybrid", "lexical") or lexical_index is None:
+        return None
+    with span("lexical_search"):
+        return lexical_search(
+            lexical_index, user_query, k=max(top_k, FUSION_CANDIDATES),
+            metadata_filter=build_metadata_filter(file_types, source_files)
+        )
+
+
+def answers_lexically(lexical_hits: Optional[List[Tuple[Document, float]]], mode: Optional[str] = None) -> bool:
+    """True when retrieval will use the BM25 hits alone, i.e. without embedding the query."""
+    if lexical_hits is None:
+        return False
+    return (mode or RETRIEVAL_MODE) == "lexical" or lexical_is_confident(lexical_hits)
+
+
+def _doc_key(doc: Document):
+    return doc.id or (doc.metadata.get("source_file"), doc.page_content)
+
+
+def fuse_results(
+    vector_hits: List[Tuple[Document, float]], lexical_hits: List[Tuple[Document, float]], top_k: int
+) -> List[Tuple[Document, float]]:
+    """Reciprocal rank fusion of both rankings; each doc keeps its best 0-1 score for thresholding."""
+    best = {}
+    for doc, score in vector_hits + lexical_hits:
+        key = _doc_key(doc)
+        if key not in best or score > best[key][1]:
+            best[key] = (doc, score)
+
+    fused = reciprocal_rank_fusion([
+        [_doc_key(doc) for doc, _ in vector_hits],
+        [_doc_key(doc) for doc, _ in lexical_hits],
+    ])
+    ranked = heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])
+    return [best[key] for key, _ in ranked]
+
+
+async def retrieve_top_docs(
+    user_query: str,
+    vectordbs: Dict,
+    per_store_k=PER_STORE_K,
+    top_k=TOP_K,
+    file_types: Optional[List[str]] = None,
+    source_files: Optional[List[str]] = None,
+    mode: Optional[str] = None,
+    lexical_index: Optional[BM25Index] = None,
+    lexical_hits: Optional[List[Tuple[Document, float]]] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Retrieve the global top-k (doc, score) pairs.
+    vector: embedding search only. lexical: BM25 only (falls back to vector without an index).
+    hybrid: BM25 first; if it is confident the embedding call is skipped, otherwise both are fused.
+    `lexical_hits` from an earlier lexical_candidates() call are reused instead of searching again.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if lexical_hits is None:
+        lexical_hits = lexical_candidates(
+            user_query, top_k, file_types, source_files, mode=mode, lexical_index=lexical_index
+        )
+    if answers_lexically(lexical_hits, mode):
+        return lexical_hits[:top_k]
+
+    if not lexical_hits:
+        return await vector_search(
+            user_query, vectordbs, per_store_k=per_store_k, top_k=top_k,
+            file_types=file_types, source_files=source_files
+        )
+
+    vector_hits = await vector_search(
+        user_query, vectordbs, per_store_k=max(per_store_k, FUSION_CANDIDATES),
+        top_k=max(top_k, FUSION_CANDIDATES), file_types=file_types, source_files=source_files
+    )
+    return fuse_results(vector_hits, lexical_hits, top_k)
+
+
+def not_found_response(docs_count=0, top_score=None) -> Dict:
+    return {
+        "answer": None,
+        "sources": [],
+        "from": [],
+        "found": False,
+        "docs_count": docs_count,
+        "top_score": top_score,
+    }
+
+
+# -------------------------
+# Query All Vector Stores
+# -------------------------
+async def query_all_top3(
+    user_query: str,
+    vectordbs: Dict,
+    per_store_k: Optional[int] = None,
+    top_k: Optional[int] = None,
+    score_threshold: Optional[float] = None,
+    file_types: Optional[List[str]] = None,
+    source_files: Optional[List[str]] = None,
+) -> Dict:
+    """
+    Answer from the documents, serving near-duplicate questions from the semantic cache.
+    Filtered queries bypass the cache.
+    """
+    retrieval = await retrieve_for_answer(
+        user_query, vectordbs, per_store_k=per_store_k, top_k=top_k, score_threshold=score_threshold,
+        file_types=file_types, source_files=source_files
+    )
+    return await answer_retrieved(user_query, retrieval)
+
+
+async def retrieve_for_answer(
+    user_query: str,
+    vectordbs: Dict,
+    per_store_k: Optional[int] = None,
+    top_k: Optional[int] = None,
+    score_threshold: Optional[float] = None,
+    file_types: Optional[List[str]] = None,
+    source_files: Optional[List[str]] = None,
+) -> Dict:
+    """
+    First half of query_all_top3: the semantic cache lookup, then retrieval on a miss.
+    Generates nothing and writes nothing to the cache, so it is safe to start before the route is known.
+    Returns {"cached": response or None, "context": retrieve_context() result or None, ...}.
+    """
+    use_cache = SEMANTIC_CACHE_ENABLED and not file_types and not source_files
+    # BM25 runs first: when it can answer alone, the cache is checked by exact query, not by embedding
+    lexical_hits = lexical_candidates(user_query, top_k or TOP_K, file_types, source_files)
+    query_embedding, cached = await cache_lookup(user_query, lexical_hits) if use_cache else (None, None)
+    if cached is not None:
+        print("Semantic cache hit")
+        return {"cached": {**cached, "cached": True}, "context": None, "query_embedding": query_embedding, "use_cache": use_cache}
+
+    context = await retrieve_context(
+        user_query, vectordbs, per_store_k=per_store_k, top_k=top_k, score_threshold=score_threshold,
+        file_types=file_types, source_files=source_files, lexical_hits=lexical_hits
+    )
+    return {"cached": None, "context": context, "query_embedding": query_embedding, "use_cache": use_cache}
+
+
+async def answer_retrieved(user_query: str, retrieval: Dict) -> Dict:
+    """Second half of query_all_top3: generate the answer from a retrieve_for_answer() result and cache it."""
+    if retrieval["cached"] is not None:
+        return retrieval["cached"]
+
+    response = await answer_from_context(user_query, retrieval["context"])
+    # Only found answers are cached: a miss is sent to the web fallback, and caching it would keep
+    # near-duplicate questions there even once the index has the answer
+    if retrieval["use_cache"] and response["answer"]:
+        answer_cache.store(retrieval["query_embedding"], user_query, response, index_version=vector_registry.index_version)
+    return response
+
+
+def retrieval_top_score(retrieval: Dict) -> Optional[float]:
+    """Top relevance score of a retrieve_for_answer() result; None for cache hits and empty retrievals."""
+    if retrieval["cached"] is not None:
+        return None
+    return retrieval["context"]["top_score"]
+
+
+async def cache_lookup(user_query: str, lexical_hits) -> Tuple[Optional[List[float]], Optional[Dict]]:
+    """
+    Semantic cache lookup. Returns (query_embedding, cached response or None); the embedding is
+    None when BM25 answers alone, since then the query is never embedded and only an exact hit counts.
+    """
+    if answers_lexically(lexical_hits):
+        return None, answer_cache.lookup_exact(user_query, index_version=vector_registry.index_version)
+    query_embedding = await embed_query(user_query)
+    return query_embedding, answer_cache.lookup(query_embedding, index_version=vector_registry.index_version)
+
+
+async def retrieve_context(
+    user_query: str,
+    vectordbs: Dict,
+    per_store_k: Optional[int] = None,
+    top_k: Optional[int] = None,
+    score_threshold: Optional[float] = None,
+    file_types: Optional[List[str]] = None,
+    source_files: Optional[List[str]] = None,
+    lexical_hits: Optional[List[Tuple[Document, float]]] = None,
+) -> Dict:
+    """
+    Retrieval stage: the top-k docs plus their source metadata.
+    "docs" is empty when nothing was found or nothing clears the score threshold.
+    """
+    print("Querying all vector stores...")
+    per_store_k = per_store_k or PER_STORE_K
+    top_k = top_k or TOP_K
+    score_threshold = SCORE_THRESHOLD if score_threshold is None else score_threshold
+
+    with span("retrieval"):
+        scored_docs = await retrieve_top_docs(
+            user_query, vectordbs, per_store_k=per_store_k, top_k=top_k,
+            file_types=file_types, source_files=source_files, lexical_hits=lexical_hits
+        )
+
+    if not scored_docs:
+        return {"docs": [], "sources": [], "from": [], "top_score": None, "docs_count": 0}
+
+    top_score = max(score for _, score in scored_docs)
+    if top_score < score_threshold:
+        # Clear miss: nothing is close enough to be worth an LLM call
+        print(f"Top relevance score {top_score:.3f} below threshold {score_threshold}")
+        return {"docs": [], "sources": [], "from": [], "top_score": top_score, "docs_count": len(scored_docs)}
+
+    top_docs = [doc for doc, _ in scored_docs]
 
     # Extract metadata BEFORE generating answer
-    sources = list({doc.metadata.get("source_file") for doc in top_3_docs if doc.metadata.get("source_file")})
-    stores_used = list({doc.metadata.get("store_name") for doc in top_3_docs})
+    sources = list({doc.metadata.get("source_file") for doc in top_docs if doc.metadata.get("source_file")})
+    stores_used = list({doc.metadata.get("store_name") for doc in top_docs})
+
+    return {"docs": top_docs, "sources": sources, "from": stores_used, "top_score": top_score, "docs_count": len(top_docs)}
+
+
+FOUND_PREFIX = "FOUND:"
+
+
+def build_answer_chain():
+    llm = get_chat_llm(model="gpt-4o-mini", temperature=0)
 
     # Create prompt with explicit FOUND/NOT_FOUND format
     prompt = ChatPromptTemplate.from_messages([
@@ -106,24 +730,113 @@ async def query_all_top3(user_query: str, vectordbs: Dict) -> Dict:
          "Documents:\n{context}"),
         ("human", "{question}")
     ])
-    chain = create_stuff_documents_chain(llm, prompt)
+    return create_stuff_documents_chain(llm, prompt)
+
+
+async def answer_from_context(user_query: str, context: Dict) -> Dict:
+    """
+    Generation stage: answer from a retrieve_context() result.
+    Skips answer generation when nothing cleared the score threshold.
+    Tracks which document the answer comes from.
+    """
+    if not context["docs"]:
+        return not_found_response(docs_count=context["docs_count"], top_score=context["top_score"])
+
+    top_docs = context["docs"]
+    chain = build_answer_chain()
 
-    # Generate answer from top 3 docs
-    output = await asyncio.to_thread(chain.invoke, {"context": top_3_docs, "question": user_query})
+    # Generate answer from the top docs
+    with span("generation"):
+        output = await ainvoke_with_timeout(chain, {"context": top_docs, "question": user_query})
     output = output.strip()
 
     # Check if answer was found
-    found = output.startswith("FOUND:")
+    found = output.startswith(FOUND_PREFIX)
     
     if found:
-        answer = output.replace("FOUND:", "").strip()
+        answer = output.replace(FOUND_PREFIX, "").strip()
     else:
         answer = None
 
     return {
         "answer": answer,
-        "sources": sources,
-        "from": stores_used,
+        "sources": context["sources"],
+        "from": context["from"],
         "found": found,  # NEW: Boolean flag
-        "docs_count": len(top_3_docs)
-    }
\ No newline at end of file
+        "docs_count": len(top_docs),
+        "top_score": context["top_score"],
+    }
+
+
+# -------------------------
+# Streaming Answers
+# -------------------------
+async def stream_found_answer(chain, payload: Dict) -> AsyncIterator[str]:
+    """
+    Stream the answer tokens of a FOUND: response.
+    Only the prefix is buffered: as soon as the output cannot start with "FOUND:" the
+    generation is abandoned and nothing is yielded (the caller falls back to the web).
+    """
+    buffer = ""
+    decided = False
+    async for token in astream_with_timeout(chain, payload):
+        if decided:
+            yield token
+            continue
+
+        buffer += token
+        head = buffer.lstrip()
+        if len(head) >= len(FOUND_PREFIX):
+            if not head.startswith(FOUND_PREFIX):
+                return
+            decided = True
+            rest = head[len(FOUND_PREFIX):].lstrip()
+            if rest:
+                yield rest
+        elif not FOUND_PREFIX.startswith(head):
+            return
+
+
+async def stream_query_all_top3(user_query: str, vectordbs: Dict) -> AsyncIterator[Dict]:
+    """
+    Streaming counterpart of query_all_top3. Yields events:
+    {"event": "sources", ...} once retrieval is done, {"event": "token", "data": str} per token,
+    and finally {"event": "rag_result", ...} with the same fields as query_all_top3.
+    """
+    lexical_hits = lexical_candidates(user_query, TOP_K)
+    if SEMANTIC_CACHE_ENABLED:
+        query_embedding, cached = await cache_lookup(user_query, lexical_hits)
+        if cached is not None:
+            print("Semantic cache hit")
+            yield {
+                "event": "sources", "sources": cached.get("sources", []), "from": cached.get("from", []),
+                "top_score": cached.get("top_score"),
+            }
+            if cached.get("answer"):
+                yield {"event": "token", "data": cached["answer"]}
+            yield {"event": "rag_result", **cached, "cached": True}
+            return
+
+    context = await retrieve_context(user_query, vectordbs, lexical_hits=lexical_hits)
+    yield {"event": "sources", "sources": context["sources"], "from": context["from"], "top_score": context["top_score"]}
+
+    tokens = []
+    if context["docs"]:
+        chain = build_answer_chain()
+        with span("generation"):
+            async for token in stream_found_answer(chain, {"context": context["docs"], "question": user_query}):
+                tokens.append(token)
+                yield {"event": "token", "data": token}
+
+    answer = "".join(tokens).strip() or None
+    response = {
+        "answer": answer,
+        "sources": context["sources"] if answer else [],
+        "from": context["from"] if answer else [],
+        "found": answer is not None,
+        "docs_count": context["docs_count"],
+        "top_score": context["top_score"],
+    }
+    if SEMANTIC_CACHE_ENABLED and answer:
+        answer_cache.store(query_embedding, user_query, response, index_version=vector_registry.index_version)
+    yield {"event": "rag_result", **response}
@@ -0,0 +1,150 @@
+import os
+import asyncio
+from typing import Literal
+from pydantic import BaseModel, Field
+
+from utils.cache import make_query_cache, memoize_query
+from utils.local_router import CentroidClassifier, LocalRouter, rule_route, has_escalation_cues
+from utils.llm import ainvoke_with_timeout, get_chat_llm
+from utils.metrics import registry as metrics_registry, span
+from sensitive_handler import is_sensitive, is_sensitive_async
+from news_handler import is_news_queury, is_news_queury_async
+from rag_handler import embed_query, embed_query_sync, vector_registry
+
+llm = get_chat_llm(model="gpt-4o-mini", temperature=0)
+
+# A route contains the news flag, so it expires as fast as the news classifier cache
+ROUTE_CACHE_TTL_SECONDS = float(os.getenv("ROUTE_CACHE_TTL_SECONDS", os.getenv("NEWS_CLASSIFIER_CACHE_TTL_SECONDS", "900")))
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "4096"))
+route_cache = make_query_cache("route_query", maxsize=ROUTE_CACHE_SIZE, ttl=ROUTE_CACHE_TTL_SECONDS)
+metrics_registry.register_cache("route", route_cache)
+
+# Local zero-network tier: rules + nearest-centroid over cached example embeddings
+LOCAL_ROUTER_ENABLED = os.getenv("LOCAL_ROUTER_ENABLED", "true").lower() == "true"
+local_router = LocalRouter(
+    CentroidClassifier(cache_path=os.getenv("LOCAL_ROUTER_CENTROIDS_PATH", "cache/route_centroids.json")),
+    min_similarity=float(os.getenv("LOCAL_ROUTER_MIN_SIMILARITY", "0.75")),
+    min_margin=float(os.getenv("LOCAL_ROUTER_MIN_MARGIN", "0.03")),
+    sensitive_margin=float(os.getenv("LOCAL_ROUTER_SENSITIVE_MARGIN", "0.05")),
+)
+
+
+class RouteDecision(BaseModel):
+    sensitive: bool = Field(
+        description="True if the query requests restricted, confidential, or harmful information"
+    )
+    news: bool = Field(
+        description="True only if the query is about news or events happening currently or very recently"
+    )
+    domain: Literal["history", "current_affairs", "general", "off_topic"] = Field(
+        description="Broad topic of the query"
+    )
+
+
+ROUTER_PROMPT = """
+You are the router of a Pakistan History chatbot. Classify the user query.
+
+sensitive = true if the query requests **restricted, confidential, or harmful information**:
+- Military operations, troop locations, strategies, weapons access
+- Intelligence agency methods, surveillance techniques, internal investigations
+- Counter-terrorism missions or internal security details
+- Classified or non-public government information
+- Instructions that could enable harm or illegal actions
+Do NOT mark general knowledge, history, politics, or geographic questions as sensitive.
+
+news = true only if the query is about **latest, breaking, or current events**:
+- news happening now, live updates, breaking news, trending events
+- press releases or official announcements made recently
+- ongoing developments or reports from media outlets that are current
+Do NOT mark general informational, historical, or educational questions as news.
+Examples of NOT news: "What is the Kashmir issue?", "Tell me history of Pakistan Army".
+
+domain: history, current_affairs, general, or off_topic (not about Pakistan).
+
+User Query: "{query}"
+"""
+
+
+def local_route(user_query: str):
+    """Decide locally if possible (confidently historical queries only); None means escalate."""
+    if not LOCAL_ROUTER_ENABLED:
+        return None
+    return local_router.route(
+        user_query,
+        embed_query=embed_query_sync,
+        embed_documents=lambda texts: vector_registry.get_embeddings().embed_documents(texts),
+    )
+
+
+@memoize_query(route_cache)
+def route_query(user_query: str) -> dict:
+    """
+    Route locally when confident, otherwise with one structured LLM call.
+    Returns {"sensitive", "news", "domain"}.
+    """
+    decision = local_route(user_query)
+    if decision is not None:
+        return decision
+
+    return llm_route(user_query)
+
+
+def llm_route(user_query: str) -> dict:
+    """Structured LLM routing; falls back to the two separate classifiers if the call fails."""
+    try:
+        decision = llm.with_structured_output(RouteDecision).invoke(ROUTER_PROMPT.format(query=user_query))
+        return decision.model_dump()
+    except Exception as e:
+        print(f"Structured routing failed, using separate classifiers: {e}")
+        sensitive = is_sensitive(user_query)
+        news = False if sensitive else is_news_queury(user_query)
+        return {"sensitive": sensitive, "news": news, "domain": "current_affairs" if news else "general"}
+
+
+async def local_route_async(user_query: str):
+    """Async local routing: rules first, then the centroid check on the (cached) query embedding."""
+    if not LOCAL_ROUTER_ENABLED:
+        return None
+    decision = rule_route(user_query)
+    if decision is not None or has_escalation_cues(user_query):
+        return decision
+
+    try:
+        vector = await embed_query(user_query)
+    except Exception as e:
+        print(f"Local router unavailable: {e}")
+        return None
+    # The centroids are embedded once; after that this is pure numpy
+    with span("local_route"):
+        return await asyncio.to_thread(
+            local_router.route,
+            user_query,
+            lambda _: vector,
+            lambda texts: vector_registry.get_embeddings().embed_documents(texts),
+        )
+
+
+@memoize_query(route_cache)
+async def route_query_async(user_query: str) -> dict:
+    """Async variant of route_query."""
+    decision = await local_route_async(user_query)
+    if decision is not None:
+        return decision
+
+    return await llm_route_async(user_query)
+
+
+async def llm_route_async(user_query: str) -> dict:
+    try:
+        with span("llm_route"):
+            decision = await ainvoke_with_timeout(
+                llm.with_structured_output(RouteDecision), ROUTER_PROMPT.format(query=user_query)
+            )
+        return decision.model_dump()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Structured routing failed, using separate classifiers: {e}")
+        sensitive = await is_sensitive_async(user_query)
+        news = False if sensitive else await is_news_queury_async(user_query)
+        return {"sensitive": sensitive, "news": news, "domain": "current_affairs" if news else "general"}
@@ -1,27 +1,47 @@
 from datetime import datetime
-import smtplib
-from email.mime.text import MIMEText
 import os
-from langchain_openai import ChatOpenAI
+import threading
 from langchain_core.messages import AIMessage
+from utils.cache import make_query_cache, memoize_query
+from utils.llm import ainvoke_with_timeout, get_chat_llm
+from utils.outbox import Outbox
+from utils.metrics import registry as metrics_registry, span
 
 
 from dotenv import load_dotenv
 
 load_dotenv()
-llm = ChatOpenAI()
+llm = get_chat_llm()
 
 # Email credentials
 sender_email = os.getenv("BOT_EMAIL")
 recipient_email = os.getenv("ADMIN_EMAIL")
 bot_password = os.getenv("BOT_EMAIL_APP_PASSWORD")
 
+# Notifications are delivered by a background sender (started in the app lifespan)
+_admin_outbox = None
+_admin_outbox_lock = threading.Lock()
+
+
+def get_admin_outbox() -> Outbox:
+    """The admin notification outbox, opened on first use rather than at import."""
+    global _admin_outbox
+    with _admin_outbox_lock:
+        if _admin_outbox is None:
+            _admin_outbox = Outbox(sender=sender_email, recipient=recipient_email, password=bot_password)
+        return _admin_outbox
+
+# Classification of a query does not drift, so results are kept for a long time
+SENSITIVE_CACHE_TTL_SECONDS = float(os.getenv("SENSITIVE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+SENSITIVE_CACHE_SIZE = int(os.getenv("SENSITIVE_CACHE_SIZE", "4096"))
+sensitive_cache = make_query_cache("is_sensitive", maxsize=SENSITIVE_CACHE_SIZE, ttl=SENSITIVE_CACHE_TTL_SECONDS)
+metrics_registry.register_cache("sensitive_classifier", sensitive_cache)
+
 
 # -------------------------------------------------------------
 # CHECK SENSITIVE QUERY (Safe)
 # -------------------------------------------------------------
-def is_sensitive(query: str):
-
+def sensitive_prompt(query: str) -> str:
     prompt = f"""
 You are a security filter. Detect if the following user query requests **restricted, confidential, or harmful information**.
 
@@ -38,9 +58,10 @@ IMPORTANT: Respond with **ONLY** 'YES' if the query is sensitive, otherwise resp
 
 User Query: "{query}"
 """
+    return prompt
 
-    
-    response = llm.invoke(prompt)
+
+def parse_yes_no(response) -> bool:
     if isinstance(response, AIMessage):
         text = response.content
     else:
@@ -48,10 +69,27 @@ User Query: "{query}"
     
     return text.strip().upper() == "YES"
 
+
+@memoize_query(sensitive_cache)
+def is_sensitive(query: str):
+    response = llm.invoke(sensitive_prompt(query))
+    return parse_yes_no(response)
+
+
+@memoize_query(sensitive_cache)
+async def is_sensitive_async(query: str, timeout: float = None):
+    with span("sensitive_check"):
+        response = await ainvoke_with_timeout(llm, sensitive_prompt(query), timeout)
+    return parse_yes_no(response)
+
 # -------------------------------------------------------------
 # SEND NOTIFICATION EMAIL TO ADMIN (Safe)
 # -------------------------------------------------------------
 def send_admin_email(user_name, user_email, query):
+    """
+    Queue the admin notification in the durable outbox and return at once.
+    Delivery (with retries and digest batching) happens on the outbox sender thread.
+    """
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     # Build email body safely
@@ -68,19 +106,6 @@ def send_admin_email(user_name, user_email, query):
         print(f"Failed to create email body: {e}")
         body = "Sensitive query detected, but failed to format details."
 
-    # Try to create email message
-    try:
-        msg = MIMEText(body)
-        msg['Subject'] = "Sensitive Query Notification"
-        msg['From'] = sender_email or "unknown"
-        msg['To'] = recipient_email or "unknown"
-    except Exception as e:
-        print(f"Failed to create email message: {e}")
-        return {
-            "message": "Failed to prepare email message.",
-            "timestamp": timestamp
-        }
-
     # -------------------------------------------------------------
     # Validate environment variables first
     # -------------------------------------------------------------
@@ -93,48 +118,17 @@ def send_admin_email(user_name, user_email, query):
             "timestamp": timestamp
         }
 
-    # -------------------------------------------------------------
-    # TRY SENDING EMAIL
-    # -------------------------------------------------------------
     try:
-        server = smtplib.SMTP("smtp.gmail.com", 587, timeout=10)
-        server.starttls()
-
-        try:
-            server.login(sender_email, bot_password)
-        except Exception as e:
-            print(f"SMTP Login failed: {e}")
-            return {
-                "message": "SMTP login failed — logged instead.",
-                "timestamp": timestamp
-            }
-
-        try:
-            server.send_message(msg)
-            print("✓ Email sent successfully")
-        except Exception as e:
-            print(f"Failed to send email: {e}")
-            return {
-                "message": "Failed during sending — logged instead.",
-                "timestamp": timestamp
-            }
-        finally:
-            server.quit()
-
+        get_admin_outbox().enqueue("Sensitive Query Notification", body)
     except Exception as e:
-        print(f"Email connection error: {e}")
-        print("Message logged locally instead:")
+        print(f"Failed to queue admin notification: {e}")
         print(body)
-
         return {
-            "message": "Email server error — logged instead.",
+            "message": "Notification could not be queued — logged instead.",
             "timestamp": timestamp
         }
 
-    # -------------------------------------------------------------
-    # SUCCESS
-    # -------------------------------------------------------------
     return {
-        "message": "Admin notified successfully.",
+        "message": "Admin will be notified.",
         "timestamp": timestamp
     }
@@ -0,0 +1,18 @@
+"""
+Shared test setup. Tests never reach OpenAI or a mail server: the API key is a placeholder, the
+client base URL points at a closed local port, and everything that writes relative paths
+(cache/, vectorstores/) does so inside a scratch working directory.
+"""
+import os
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["LLM_BASE_URL"] = "http://127.0.0.1:9/v1"
+os.environ["BOT_EMAIL"] = ""
+os.environ["ADMIN_EMAIL"] = ""
+os.environ["BOT_EMAIL_APP_PASSWORD"] = ""
+os.chdir(tempfile.mkdtemp(prefix="tests-"))
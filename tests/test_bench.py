@@ -0,0 +1,51 @@
+import asyncio
+
+import httpx
+import numpy as np
+import pytest
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from bench import fake_openai, run
+from router_handler import RouteDecision
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """An async httpx client wired to the fake OpenAI app in-process, with no added latency."""
+    for name in ("LATENCY_MS", "TOKEN_MS", "EMBED_LATENCY_MS"):
+        monkeypatch.setattr(fake_openai, name, 0)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_openai.app), base_url="http://fake")
+
+
+def test_fake_embeddings_are_close_only_for_shared_words():
+    a = fake_openai.embed_text("Lahore Resolution Minto Park")
+    b = fake_openai.embed_text("resolution passed at Minto Park")
+    c = fake_openai.embed_text("volcano penguin glacier")
+    assert np.linalg.norm(a) == pytest.approx(1.0, abs=1e-5)
+    assert float(a @ b) > float(a @ c)
+    assert float(a @ c) == pytest.approx(fake_openai.EMBED_BASELINE, abs=0.05)
+
+
+def test_structured_routing_works_against_the_fake_server(fake_server):
+    llm = ChatOpenAI(model="gpt-4o-mini", api_key="bench", base_url="http://fake/v1", http_async_client=fake_server)
+    decision = asyncio.run(llm.with_structured_output(RouteDecision).ainvoke(
+        'Classify.\nUser Query: "latest news from Lahore"'
+    ))
+    assert (decision.sensitive, decision.news) == (False, True)
+
+
+def test_embeddings_work_against_the_fake_server(fake_server):
+    embeddings = OpenAIEmbeddings(
+        api_key="bench", base_url="http://fake/v1", http_async_client=fake_server, check_embedding_ctx_length=False
+    )
+    vector = asyncio.run(embeddings.aembed_query("Lahore Resolution"))
+    assert np.allclose(vector, fake_openai.embed_text("Lahore Resolution"), atol=1e-6)
+
+
+def test_compare_flags_only_regressions_beyond_the_tolerance():
+    baseline = {"scenarios": {"rag": {"p95_ms": 100, "rps": 50}}, "ingest": {"chunks_per_second": 200}}
+    report = {"scenarios": {"rag": {"p95_ms": 130, "rps": 48, "errors": 0}}, "ingest": {"chunks_per_second": 100}}
+    regressions = run.compare(report, baseline, tolerance=0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("ingest: chunks_per_second")
+    assert regressions[1].startswith("scenario rag: p95_ms")
@@ -0,0 +1,101 @@
+import asyncio
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+import rag_handler
+from utils.bm25 import BM25Builder, BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "The Lahore Resolution was passed on 23 March 1940 at Minto Park.",
+    "The Objectives Resolution was adopted by the Constituent Assembly in 1949.",
+    "Mohenjo-daro is a site of the Indus Valley civilisation.",
+]
+
+
+@pytest.fixture
+def index():
+    return BM25Index.build(
+        [f"c{i}" for i in range(3)], TEXTS,
+        [{"source_file": f"f{i}.txt", "file_type": "pdf" if i == 2 else "txt"} for i in range(3)],
+    )
+
+
+def test_tokenize_drops_stopwords_and_keeps_years():
+    assert tokenize("When was the Resolution passed in 1940?") == ["resolution", "passed", "1940"]
+
+
+def test_search_ranks_by_bm25_and_reports_coverage(index):
+    hits = index.search("Lahore Resolution 1940")
+    assert [row for row, _, _ in hits] == [0, 1]
+    assert hits[0][2] == pytest.approx(1.0)
+    assert 0 < hits[1][2] < 1
+    assert index.search("cricket") == []
+
+
+def test_search_applies_metadata_filters(index):
+    assert [row for row, _, _ in index.search("site Resolution", filter={"file_type": {"$in": ["pdf"]}})] == [2]
+
+
+def test_saved_index_searches_the_same(index, tmp_path):
+    path = str(tmp_path / "bm25.sqlite3")
+    BM25Index.build(
+        [f"c{i}" for i in range(3)], TEXTS,
+        [{"source_file": f"f{i}.txt", "file_type": "pdf" if i == 2 else "txt"} for i in range(3)], path=path,
+    )
+    assert not os.path.exists(path + ".tmp")
+    saved = BM25Index.load(path)
+    assert saved.search("Objectives Resolution") == index.search("Objectives Resolution")
+    assert saved.search("site", filter={"file_type": "pdf"}) == index.search("site", filter={"file_type": "pdf"})
+    assert saved.document(1).page_content == TEXTS[1]
+
+
+def test_builder_keeps_only_counters_in_memory(tmp_path):
+    builder = BM25Builder(str(tmp_path / "bm25.sqlite3"))
+    builder.add(["c0", "c1"], TEXTS[:2], [{}, {}])
+    assert not any(isinstance(value, (list, dict)) for value in vars(builder).values())
+    assert builder.count == 2
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=1)
+    assert max(fused, key=fused.get) == "b"
+
+
+def test_fusion_keeps_each_docs_best_score():
+    shared = Document(page_content="shared", id="s")
+    vector_only = Document(page_content="vector", id="v")
+    lexical_only = Document(page_content="lexical", id="l")
+    fused = rag_handler.fuse_results(
+        [(vector_only, 0.9), (shared, 0.8)], [(shared, 1.0), (lexical_only, 0.5)], top_k=2
+    )
+    assert [(doc.id, score) for doc, score in fused] == [("s", 1.0), ("v", 0.9)]
+
+
+def test_hybrid_mode_fuses_when_bm25_is_not_confident(index, monkeypatch):
+    vector_calls = []
+
+    async def fake_vector_search(user_query, vectordbs, **kwargs):
+        vector_calls.append(kwargs)
+        return [(Document(page_content=TEXTS[2], id="c2"), 0.8)]
+
+    monkeypatch.setattr(rag_handler, "vector_search", fake_vector_search)
+    monkeypatch.setattr(rag_handler, "LEXICAL_FASTPATH_MIN_SCORE", 100.0)
+    hits = asyncio.run(rag_handler.retrieve_top_docs(
+        "Resolution at Minto Park", {}, top_k=2, mode="hybrid", lexical_index=index
+    ))
+    assert len(vector_calls) == 1
+    assert {doc.id for doc, _ in hits} == {"c0", "c2"}
+
+
+def test_lexical_mode_never_searches_vectors(index, monkeypatch):
+    async def fail(*args, **kwargs):
+        raise AssertionError("vector search in lexical mode")
+
+    monkeypatch.setattr(rag_handler, "vector_search", fail)
+    hits = asyncio.run(rag_handler.retrieve_top_docs(
+        "Indus Valley", {}, top_k=3, mode="lexical", lexical_index=index
+    ))
+    assert [doc.id for doc, _ in hits] == ["c2"]
+    assert hits[0][0].metadata["bm25_score"] > 0
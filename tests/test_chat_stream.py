@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+import application
+
+
+@pytest.fixture
+def streams(monkeypatch):
+    """Fake RAG, news and web streams; records whether the RAG generator was closed."""
+    state = {"route": {"sensitive": False, "news": False}, "top_score": 0.9, "answer": True, "closed": False}
+
+    async def fake_rag(user_query, vectordbs):
+        try:
+            await asyncio.sleep(0.01)
+            yield {"event": "sources", "sources": [], "from": [], "top_score": state["top_score"]}
+            if state["answer"]:
+                yield {"event": "token", "data": "an answer"}
+                yield {"event": "rag_result", "answer": "an answer", "sources": []}
+            else:
+                yield {"event": "rag_result", "answer": None, "sources": []}
+        finally:
+            state["closed"] = True
+
+    async def fake_route(user_query):
+        await asyncio.sleep(0.005)  # retrieval is under way when the route comes back
+        return state["route"]
+
+    async def fake_news(user_query, messages):
+        yield "news"
+
+    async def failing_web(user_query):
+        await asyncio.sleep(0)
+        raise RuntimeError("search backend down")
+        yield
+
+    async def fake_history(chat_history):
+        return None, [], {"tokens_saved": 0}
+
+    monkeypatch.setattr(application, "stream_query_all_top3", fake_rag)
+    monkeypatch.setattr(application, "route_query_async", fake_route)
+    monkeypatch.setattr(application, "astream_news", fake_news)
+    monkeypatch.setattr(application, "astream_web", failing_web)
+    monkeypatch.setattr(application, "prepare_history", fake_history)
+    monkeypatch.setattr(application, "SCORE_THRESHOLD", 0.75)
+    monkeypatch.setattr(application, "WEB_SPECULATION_SCORE", 0.80)
+    return state
+
+
+def run_stream(streams, query):
+    """SSE event names, whether the RAG stream was closed by the end, and unretrieved task exceptions."""
+    unretrieved = []
+
+    async def collect():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        events = [event async for event in application.chat_event_stream(application.UserQuery(query=query))]
+        closed = streams["closed"]  # by the handler itself, not by the loop shutting down
+        # Let any leftover task finish and be collected
+        await asyncio.sleep(0.05)
+        return events, closed
+
+    events, closed = asyncio.run(collect())
+    return [event.split("\n")[0].removeprefix("event: ") for event in events], closed, unretrieved
+
+
+def test_news_route_closes_the_speculative_rag_stream(streams):
+    streams["route"] = {"sensitive": False, "news": True}
+    events, closed, unretrieved = run_stream(streams, "latest news")
+    assert events[-1] == "done"
+    assert closed is True
+    assert unretrieved == []
+
+
+def test_rag_answer_closes_the_rag_stream(streams):
+    events, closed, unretrieved = run_stream(streams, "Who founded Pakistan?")
+    assert events == ["session", "route", "sources", "token", "done"]
+    assert closed is True
+    assert unretrieved == []
+
+
+def test_failed_web_prefetch_is_reported_not_leaked(streams):
+    streams["top_score"], streams["answer"] = 0.77, False
+    events, closed, unretrieved = run_stream(streams, "Who founded Pakistan?")
+    assert events[-1] == "error"
+    assert unretrieved == []
+
+
+def test_client_disconnect_cancels_everything(streams):
+    async def disconnect():
+        stream = application.chat_event_stream(application.UserQuery(query="q"))
+        await stream.__anext__()  # session event
+        await stream.__anext__()  # route event
+        await stream.aclose()
+
+        return streams["closed"]
+
+    assert asyncio.run(disconnect()) is True
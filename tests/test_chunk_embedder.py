@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+import create_embeddings
+from create_embeddings import ChunkEmbedder, TokenRateLimiter
+from utils.cache import EmbeddingCache
+
+
+class CountingEmbeddings:
+    """Returns [len(text)] per text; fails the first `failures` requests."""
+
+    model = "fake-embedding"
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("429 rate limited")
+            self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(create_embeddings.time, "sleep", lambda seconds: None)
+
+
+def test_batches_are_bounded_and_duplicates_embedded_once():
+    embeddings = CountingEmbeddings()
+    embedder = ChunkEmbedder(embeddings, batch_size=2, concurrency=2, tokens_per_minute=0)
+    texts = ["a", "bb", "a", "ccc", "dddd", "bb"]
+    assert embedder.embed(texts) == [[1.0], [2.0], [1.0], [3.0], [4.0], [2.0]]
+    assert sorted(len(batch) for batch in embeddings.batches) == [2, 2]
+
+
+def test_cached_vectors_are_reused_across_runs(tmp_path):
+    cache_path = str(tmp_path / "embeddings.sqlite3")
+    ChunkEmbedder(CountingEmbeddings(), cache=EmbeddingCache(cache_path), tokens_per_minute=0).embed(["a", "bb"])
+
+    embeddings = CountingEmbeddings()
+    embedder = ChunkEmbedder(embeddings, cache=EmbeddingCache(cache_path), tokens_per_minute=0)
+    assert embedder.embed(["bb", "ccc"]) == [[2.0], [3.0]]
+    assert embeddings.batches == [["ccc"]]
+    assert embedder.stats()["cache_hits"] == 1
+
+
+def test_failed_requests_are_retried():
+    embeddings = CountingEmbeddings(failures=2)
+    embedder = ChunkEmbedder(embeddings, tokens_per_minute=0, max_retries=3)
+    assert embedder.embed(["a"]) == [[1.0]]
+    assert embedder.stats()["retries"] == 2
+
+
+def test_retries_give_up_after_max_retries():
+    embedder = ChunkEmbedder(CountingEmbeddings(failures=5), tokens_per_minute=0, max_retries=1)
+    with pytest.raises(RuntimeError):
+        embedder.embed(["a"])
+
+
+def test_rate_limiter_waits_for_the_bucket_to_refill(monkeypatch):
+    now = [0.0]
+    waits = []
+    monkeypatch.setattr(create_embeddings.time, "monotonic", lambda: now[0])
+
+    def fake_sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(create_embeddings.time, "sleep", fake_sleep)
+    limiter = TokenRateLimiter(tokens_per_minute=600)
+    limiter.acquire(600)
+    assert waits == []
+    limiter.acquire(60)
+    # 60 tokens at 10 tokens per second
+    assert waits == [pytest.approx(6.0)]
@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import application
+
+
+@pytest.fixture
+def client():
+    return TestClient(application.application)
+
+
+def test_profiler_endpoints_do_not_exist_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(application, "ADMIN_TOKEN", "")
+    assert client.get("/debug/profiler").status_code == 404
+    assert client.get("/debug/profiler/collapsed", headers={"X-Admin-Token": ""}).status_code == 404
+    assert client.post("/debug/profiler", json={"enabled": True}).status_code == 404
+    assert not application.profiler.running
+
+
+def test_profiler_endpoints_require_the_token(client, monkeypatch):
+    monkeypatch.setattr(application, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/debug/profiler").status_code == 401
+    assert client.get("/debug/profiler", headers={"X-Admin-Token": "wrong"}).status_code == 401
+
+    response = client.get("/debug/profiler", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200
+    assert "samples" in response.json()
+
+
+def test_vectorstore_reload_requires_the_token(client, monkeypatch):
+    reloads = []
+    monkeypatch.setattr(application, "ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(application.vector_registry, "reload", lambda: reloads.append(True))
+    monkeypatch.setattr(application.vector_registry, "health", lambda: {"status": "ok"})
+    assert client.post("/vectorstores/reload").status_code == 401
+    assert reloads == []
+
+    response = client.post("/vectorstores/reload", headers={"X-Admin-Token": "s3cret"})
+    assert response.status_code == 200 and reloads == [True]
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+import rag_handler
+from utils.cache import LRUCache
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return [float(len(text)), 1.0]
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    monkeypatch.setattr(rag_handler, "query_embedding_cache", LRUCache(maxsize=16))
+    return CountingEmbeddings()
+
+
+def test_concurrent_calls_share_one_embedding(embeddings):
+    async def both():
+        # As /chat does: the router and the speculative retrieval embed the same query at once
+        return await asyncio.gather(
+            rag_handler.embed_query("Who founded Pakistan?", embeddings),
+            rag_handler.embed_query("Who  founded Pakistan? ", embeddings),
+        )
+
+    first, second = asyncio.run(both())
+    assert first == second
+    assert embeddings.calls == 1
+    assert rag_handler._embedding_flights == {}
+
+
+def test_one_cancelled_caller_does_not_cancel_the_other(embeddings):
+    async def scenario():
+        leaving = asyncio.create_task(rag_handler.embed_query("q", embeddings))
+        staying = asyncio.create_task(rag_handler.embed_query("q", embeddings))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(scenario()) == [1.0, 1.0]
+    assert embeddings.calls == 1
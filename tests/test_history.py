@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from utils import history
+
+
+def turns(count, words=3):
+    return [{"user": f"question {i} " + "x " * words, "AI": f"answer {i}"} for i in range(count)]
+
+
+@pytest.fixture
+def budgeted(monkeypatch):
+    """One token per word, fixed window settings and a fake summarizer that records its prompts."""
+    prompts = []
+
+    async def fake_invoke(llm, prompt, timeout=None):
+        prompts.append(prompt)
+        return f"summary {len(prompts)}"
+
+    monkeypatch.setattr(history, "count_tokens", lambda text, model=None: len(text.split()))
+    monkeypatch.setattr(history, "HISTORY_RECENT_TURNS", 6)
+    monkeypatch.setattr(history, "HISTORY_FOLD_EVERY", 4)
+    monkeypatch.setattr(history, "HISTORY_SUMMARY_TOKENS", 20)
+    monkeypatch.setattr(history, "ainvoke_with_timeout", fake_invoke)
+    monkeypatch.setattr(history, "get_chat_llm", lambda **kwargs: None)
+    monkeypatch.setattr(history, "summary_cache", history.LRUCache(maxsize=16))
+    return prompts
+
+
+def test_short_histories_are_sent_verbatim(budgeted):
+    folded, recent = history.split_history(turns(5), budget=1000)
+    assert folded == [] and len(recent) == 5
+
+
+def test_older_turns_fold_on_block_boundaries(budgeted):
+    folded, recent = history.split_history(turns(11), budget=1000)
+    # 11 - 6 = 5 older turns, rounded down to a block of 4
+    assert len(folded) == 4 and len(recent) == 7
+
+
+def test_over_budget_history_folds_more_turns(budgeted):
+    # Each turn is 9 tokens; 60 leaves room for the summary reserve and 4 turns
+    folded, recent = history.split_history(turns(10), budget=60)
+    assert len(folded) == 8 and len(recent) == 2
+    assert sum(map(history.turn_tokens, recent)) + history.HISTORY_SUMMARY_TOKENS <= 60
+
+
+def test_rolling_summary_folds_only_new_turns(budgeted):
+    conversation = turns(12)
+    asyncio.run(history.summarize_turns(conversation[:4]))
+    summary, cached = asyncio.run(history.summarize_turns(conversation[:8]))
+
+    assert (summary, cached) == ("summary 2", False)
+    assert "summary 1" in budgeted[1]
+    assert "question 3" not in budgeted[1] and "question 4" in budgeted[1]
+    # The same prefix is served from the cache
+    assert asyncio.run(history.summarize_turns(conversation[:8])) == ("summary 2", True)
+    assert len(budgeted) == 2
+
+
+def test_failed_summary_drops_older_turns(budgeted, monkeypatch):
+    async def failing_invoke(llm, prompt, timeout=None):
+        raise TimeoutError()
+
+    monkeypatch.setattr(history, "ainvoke_with_timeout", failing_invoke)
+    summary, recent, stats = asyncio.run(history.prepare_history(turns(11), budget=1000))
+    assert summary is None
+    assert len(recent) == 7
+    assert stats["summarized_turns"] == 4 and stats["tokens_saved"] > 0
+
+
+def test_fit_messages_keeps_the_system_prompt_and_latest_message(budgeted):
+    messages = [{"role": "system", "content": "be brief"}] + [
+        {"role": "user", "content": "word " * 10} for _ in range(5)
+    ]
+    fitted = history.fit_messages(messages, budget=25)
+    assert fitted[0]["role"] == "system"
+    assert len(fitted) == 3
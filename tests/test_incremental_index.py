@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+from langchain_chroma import Chroma
+
+import create_embeddings
+
+
+class FakeEmbeddings:
+    """Deterministic vectors from the text hash; records every text it was asked to embed."""
+
+    model = "fake-embedding"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(8)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    """A documents folder, a scratch index dir and in-process parsing with fake embeddings."""
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(create_embeddings, "get_embeddings", lambda model=None: embeddings)
+    monkeypatch.setattr(create_embeddings, "INGEST_WORKERS", 1)
+    monkeypatch.setattr(create_embeddings, "EMBEDDING_CACHE_PATH", "")
+    docs = tmp_path / "documents"
+    docs.mkdir()
+    (docs / "partition.txt").write_text("The partition of British India took place in 1947.", encoding="utf-8")
+    (docs / "resolution.txt").write_text("The Lahore Resolution was passed in 1940.", encoding="utf-8")
+    return docs, str(tmp_path / "vectorstores"), embeddings
+
+
+def index(docs, base_dir, **kwargs):
+    return create_embeddings.index_documents(
+        create_embeddings.iter_document_paths(str(docs)), index_mode="unified", base_dir=base_dir, **kwargs
+    )
+
+
+def stored_texts(base_dir):
+    store = Chroma(persist_directory=create_embeddings.store_path(base_dir, "unified"))
+    return sorted(store.get()["documents"])
+
+
+def test_unchanged_files_are_not_reembedded(corpus):
+    docs, base_dir, embeddings = corpus
+    first = index(docs, base_dir)
+    assert first["files"]["added"] == 2 and first["changed"] is True
+
+    embeddings.embedded.clear()
+    second = index(docs, base_dir)
+    assert second["changed"] is False
+    assert second["files"]["unchanged"] == 2
+    assert embeddings.embedded == []
+
+
+def test_edited_and_deleted_files_update_the_store(corpus):
+    docs, base_dir, embeddings = corpus
+    index(docs, base_dir)
+    (docs / "partition.txt").write_text("Pakistan became independent on 14 August 1947.", encoding="utf-8")
+    os.remove(docs / "resolution.txt")
+
+    embeddings.embedded.clear()
+    result = index(docs, base_dir)
+    assert result["files"] == {"added": 0, "updated": 1, "removed": 1, "unchanged": 0, "failed": 0}
+    assert embeddings.embedded == ["Pakistan became independent on 14 August 1947."]
+    assert stored_texts(base_dir) == ["Pakistan became independent on 14 August 1947."]
+
+    manifest = create_embeddings.load_manifest(base_dir)
+    assert list(manifest["files"]) == [os.path.normpath(str(docs / "partition.txt"))]
+
+
+def test_touched_but_identical_files_are_skipped_by_hash(corpus):
+    docs, base_dir, embeddings = corpus
+    index(docs, base_dir)
+    path = docs / "resolution.txt"
+    os.utime(path, (1, 1))
+
+    embeddings.embedded.clear()
+    result = index(docs, base_dir)
+    assert result["files"]["unchanged"] == 2 and embeddings.embedded == []
+    assert create_embeddings.load_manifest(base_dir)["files"][os.path.normpath(str(path))]["mtime"] == 1
+
+
+def test_changing_the_index_mode_rebuilds(corpus):
+    docs, base_dir, embeddings = corpus
+    index(docs, base_dir)
+    result = create_embeddings.index_documents(
+        create_embeddings.iter_document_paths(str(docs)), index_mode="per_type", base_dir=base_dir
+    )
+    assert result["files"]["added"] == 2
+    assert not os.path.exists(create_embeddings.store_path(base_dir, "unified"))
+
+
+def test_chunk_ids_are_stable_and_separate_repeats():
+    first = create_embeddings.chunk_id("docs/a.txt", "same text")
+    assert first == create_embeddings.chunk_id("docs/./a.txt", "same text")
+    assert first != create_embeddings.chunk_id("docs/a.txt", "same text", occurrence=1)
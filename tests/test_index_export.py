@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_chroma import Chroma
+
+import create_embeddings
+from utils.bm25 import BM25Index
+from utils.numpy_store import NumpyIndexWriter, NumpyVectorStore, write_numpy_index
+
+
+def unit_vectors(count, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("dtype,nlist", [("float16", 0), ("int8", 4)])
+def test_batched_writer_matches_one_shot_write(tmp_path, dtype, nlist):
+    vectors = unit_vectors(50)
+    ids = [f"c{i}" for i in range(50)]
+    texts = [f"chunk {i}" for i in range(50)]
+    metadatas = [{"row": i} for i in range(50)]
+
+    write_numpy_index(str(tmp_path / "whole"), ids, vectors, texts, metadatas, dtype=dtype, nlist=nlist)
+    writer = NumpyIndexWriter(str(tmp_path / "batched"), 50, dtype=dtype)
+    for start in range(0, 50, 16):
+        end = start + 16
+        writer.add(ids[start:end], vectors[start:end], texts[start:end], metadatas[start:end])
+    writer.finish(nlist=nlist)
+
+    for name in os.listdir(tmp_path / "whole"):
+        with open(tmp_path / "whole" / name, "rb") as a, open(tmp_path / "batched" / name, "rb") as b:
+            assert a.read() == b.read(), name
+
+
+def test_writer_rejects_a_short_count(tmp_path):
+    writer = NumpyIndexWriter(str(tmp_path / "index"), 3)
+    writer.add(["a"], unit_vectors(1), ["text"], [{}])
+    with pytest.raises(ValueError):
+        writer.finish()
+
+
+def test_exports_page_through_the_store(tmp_path, monkeypatch):
+    vectors = unit_vectors(25, seed=1)
+    store = Chroma(persist_directory=str(tmp_path / "unified_vector_db"))
+    store._collection.add(
+        ids=[f"c{i}" for i in range(25)],
+        embeddings=vectors.tolist(),
+        documents=[f"chunk number {i}" for i in range(25)],
+        metadatas=[{"source_file": f"f{i}.txt"} for i in range(25)],
+    )
+    pages = []
+    get = Chroma.get
+
+    def counting_get(self, *args, **kwargs):
+        data = get(self, *args, **kwargs)
+        pages.append(len(data["ids"]))
+        return data
+
+    monkeypatch.setattr(create_embeddings, "READ_PAGE_SIZE", 10)
+    monkeypatch.setattr(Chroma, "get", counting_get)
+
+    result = create_embeddings.export_numpy_index(str(tmp_path), dtype="float16", nlist=0)
+    assert result["chunks"] == 25
+    assert pages == [10, 10, 5, 0]
+
+    exported = NumpyVectorStore(result["path"])
+    row = exported.ids.index("c7")
+    assert exported._text(row) == "chunk number 7"
+    assert exported.search(vectors[7], k=1)[0][0][0] == row
+
+    create_embeddings.build_lexical_index(str(tmp_path))
+    index = BM25Index.load(str(tmp_path / create_embeddings.BM25_INDEX_FILE))
+    assert len(index) == 25
+    assert index.document(index.search("number 7", k=1)[0][0]).id == "c7"
+
+
+def test_parsing_reads_paths_lazily_within_the_inflight_bound(tmp_path, monkeypatch):
+    folder = tmp_path / "documents" / "nested" / "deeper"
+    folder.mkdir(parents=True)
+    for i in range(6):
+        (folder / f"doc{i}.txt").write_text(f"Document {i}.", encoding="utf-8")
+    pulled = []
+
+    def paths():
+        for path in create_embeddings.iter_document_paths(str(tmp_path / "documents")):
+            pulled.append(path)
+            yield path
+
+    monkeypatch.setattr(create_embeddings, "over_memory_limit", lambda: False)
+    results = create_embeddings.parse_files(paths(), workers=2, max_inflight=2)
+    next(results)
+    assert len(pulled) <= 2
+    assert len([next(results)] + list(results)) == 5
+    assert len(pulled) == 6
+
+
+def test_over_the_memory_ceiling_one_file_is_parsed_at_a_time(tmp_path, monkeypatch):
+    for i in range(3):
+        (tmp_path / f"doc{i}.txt").write_text(f"Document {i}.", encoding="utf-8")
+    pulled = []
+
+    def paths():
+        for path in sorted(str(p) for p in tmp_path.iterdir()):
+            pulled.append(path)
+            yield path
+
+    monkeypatch.setattr(create_embeddings, "over_memory_limit", lambda: True)
+    results = create_embeddings.parse_files(paths(), workers=2, max_inflight=4)
+    next(results)
+    assert len(pulled) == 1
+    results.close()
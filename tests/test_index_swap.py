@@ -0,0 +1,56 @@
+import os
+
+from utils.index_swap import ReaderLease, create_staging_dir, prune_index_dirs, publish_index_dir
+
+
+def build_version(base_dir, copy_current=True):
+    staging = create_staging_dir(str(base_dir), copy_current=copy_current)
+    store = os.path.join(staging, "unified_vector_db")
+    os.makedirs(store, exist_ok=True)
+    if not copy_current or not os.path.exists(os.path.join(store, "chroma.sqlite3")):
+        with open(os.path.join(store, "chroma.sqlite3"), "w") as f:
+            f.write("store")
+        with open(os.path.join(staging, "bm25_index.sqlite3"), "w") as f:
+            f.write("index")
+    return staging
+
+
+def test_staging_copy_links_renamed_files_and_copies_store_files(tmp_path):
+    base = tmp_path / "vectorstores"
+    first = build_version(base, copy_current=False)
+    publish_index_dir(first, str(base))
+
+    second = build_version(base)
+    same_inode = lambda name: os.stat(os.path.join(first, name)).st_ino == os.stat(os.path.join(second, name)).st_ino
+    assert same_inode("bm25_index.sqlite3")
+    assert not same_inode(os.path.join("unified_vector_db", "chroma.sqlite3"))
+
+    # Writing the staged store must not touch the live one
+    with open(os.path.join(second, "unified_vector_db", "chroma.sqlite3"), "w") as f:
+        f.write("changed")
+    with open(os.path.join(first, "unified_vector_db", "chroma.sqlite3")) as f:
+        assert f.read() == "store"
+
+
+def test_prune_skips_versions_held_by_a_reader(tmp_path):
+    base = tmp_path / "vectorstores"
+    versions = []
+    for _ in range(3):
+        versions.append(build_version(base, copy_current=False))
+        publish_index_dir(versions[-1], str(base), keep=0)
+
+    # keep=0 still keeps the live version
+    assert [os.path.isdir(v) for v in versions] == [False, False, True]
+
+    held = build_version(base, copy_current=False)
+    publish_index_dir(held, str(base), keep=0)
+    lease = ReaderLease(held)
+    assert lease.acquire()
+    newest = build_version(base, copy_current=False)
+    publish_index_dir(newest, str(base), keep=0)
+    assert os.path.isdir(held)
+
+    lease.release()
+    prune_index_dirs(str(base), keep=0)
+    assert not os.path.isdir(held) and not os.path.exists(held + ".readers")
+    assert os.path.isdir(newest)
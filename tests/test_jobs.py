@@ -0,0 +1,74 @@
+import threading
+
+from utils.jobs import JobRegistry
+
+
+def run_job(registry, target, **kwargs):
+    """Submit a job and wait for its on_finish callback."""
+    done = threading.Event()
+    job = registry.submit("test", target, on_finish=lambda job: done.set(), **kwargs)
+    return job, done
+
+
+def test_successful_job_records_result_and_progress():
+    def target(job):
+        job.update("embedding", files=2, chunks=10)
+        return {"chunks": 10}
+
+    job, done = run_job(JobRegistry(), target, params={"folder_path": "docs"})
+    assert done.wait(5)
+    state = job.to_dict()
+    assert state["status"] == "succeeded" and state["phase"] == "succeeded"
+    assert state["progress"] == {"files": 2, "chunks": 10}
+    assert state["result"] == {"chunks": 10}
+    assert state["params"] == {"folder_path": "docs"}
+    assert state["elapsed_seconds"] is not None
+
+
+def test_cancel_stops_the_job_at_its_next_update():
+    started, release = threading.Event(), threading.Event()
+    reached_end = []
+
+    def target(job):
+        started.set()
+        release.wait(5)
+        job.update("embedding", files=1)
+        reached_end.append(True)
+
+    job, done = run_job(JobRegistry(), target)
+    assert started.wait(5)
+    assert job.cancel() is True
+    release.set()
+    assert done.wait(5)
+    assert job.status == "cancelled"
+    assert reached_end == []
+    # A finished job cannot be cancelled again
+    assert job.cancel() is False
+
+
+def test_failure_is_recorded_and_on_finish_still_runs():
+    def target(job):
+        raise ValueError("bad document")
+
+    job, done = run_job(JobRegistry(), target)
+    assert done.wait(5)
+    assert job.status == "failed"
+    assert job.error == "ValueError: bad document"
+
+
+def test_history_pruning_keeps_unfinished_jobs():
+    registry = JobRegistry(max_history=1)
+    release = threading.Event()
+    running, running_done = run_job(registry, lambda job: release.wait(5))
+    finished, finished_done = run_job(registry, lambda job: None)
+    assert finished_done.wait(5)
+
+    # The oldest job is still running, so it is not evicted
+    assert registry.get(running.id) is running
+    release.set()
+    assert running_done.wait(5)
+
+    latest, latest_done = run_job(registry, lambda job: None)
+    assert latest_done.wait(5)
+    assert registry.get(running.id) is None
+    assert [job["job_id"] for job in registry.list()][0] == latest.id
@@ -0,0 +1,21 @@
+from utils import llm
+
+
+def test_chat_clients_are_cached_per_configuration():
+    assert llm.get_chat_llm(model="gpt-4o-mini", temperature=0) is llm.get_chat_llm(model="gpt-4o-mini", temperature=0)
+    assert llm.get_chat_llm(model="gpt-4o-mini", temperature=0) is not llm.get_chat_llm(model="gpt-4o-mini", temperature=1)
+
+
+def test_all_clients_share_one_connection_pool():
+    sync_client, async_client = llm.shared_http_clients()
+    chat = llm.get_chat_llm(model="gpt-4o-mini", temperature=0)
+    embeddings = llm.get_embeddings()
+    assert embeddings is llm.get_embeddings()
+    assert chat.http_client is sync_client and chat.http_async_client is async_client
+    assert embeddings.http_client is sync_client and embeddings.http_async_client is async_client
+
+
+def test_clients_point_at_the_configured_base_url():
+    # conftest routes every client to a closed local port
+    assert str(llm.get_chat_llm(model="gpt-4o-mini").openai_api_base) == llm.LLM_BASE_URL
+    assert llm.get_embeddings().openai_api_base == llm.LLM_BASE_URL
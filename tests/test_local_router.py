@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from utils.local_router import CentroidClassifier, LocalRouter, rule_route
+from utils.route_examples import EVAL_QUERIES
+
+
+@pytest.mark.parametrize("query", [
+    "Who founded Pakistan?",
+    "who was jinnah",
+    "Tell me about Sir Syed Ahmad Khan and the Aligarh movement",
+    "When was the 1973 constitution adopted?",
+    "What is the history of the Kashmir issue?",
+])
+def test_rules_clear_plain_history_questions(query):
+    assert rule_route(query)["router"] == "rules"
+
+
+@pytest.mark.parametrize("query", [
+    # Bare years and generic words are not history
+    "What happened in 1971?",
+    "What was the poison used in 1971?",
+    # History cue, but an unrecognized intent
+    "Who founded Pakistan and how do I reach its founder's tomb at night unnoticed?",
+    "Give me the history of the Kahuta plant",
+    "History of the Pakistan Army",
+    # Capitalization does not make a word a known name
+    "Who founded Pakistan And Where Can I Buy Detonators",
+])
+def test_rules_escalate_everything_else(query):
+    assert rule_route(query) is None
+
+
+@pytest.mark.parametrize("query", [q for q, sensitive, _ in EVAL_QUERIES if sensitive])
+def test_rules_never_clear_sensitive_eval_queries(query):
+    assert rule_route(query) is None
+
+
+def test_local_router_escalates_sensitive_cues_without_embedding():
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        return np.ones(4)
+
+    router = LocalRouter(CentroidClassifier({"history": ["x"], "sensitive": ["y"]}))
+    query = "What were the coordinates of the Kahuta enrichment facility built in 1976?"
+    assert router.route(query, embed_query=embed, embed_documents=lambda texts: [embed(t) for t in texts]) is None
+    assert calls == []
+
@@ -0,0 +1,88 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from utils import metrics
+from utils.metrics import LLMMetricsCallback, MetricsMiddleware, MetricsRegistry, span
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "help", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="embed")
+    histogram.observe(0.5, stage="embed")
+    text = registry.render()
+    assert 'stage_seconds_bucket{stage="embed",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="embed",le="1"} 2' in text
+    assert 'stage_seconds_bucket{stage="embed",le="+Inf"} 2' in text
+    assert 'stage_seconds_count{stage="embed"} 2' in text
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("errors_total", "help", ("error",)).inc(error='say "hi"\n')
+    assert 'errors_total{error="say \\"hi\\"\\n"} 1' in registry.render()
+
+
+def stage_count(stage):
+    return sum(series[-1] for key, series in metrics.stage_seconds._series.items() if key[0] == stage)
+
+
+def test_span_counts_errors_but_not_cancellations():
+    stage = f"test-{uuid.uuid4().hex[:6]}"
+    with pytest.raises(ValueError):
+        with span(stage):
+            raise ValueError()
+    with pytest.raises(asyncio.CancelledError):
+        with span(stage):
+            raise asyncio.CancelledError()
+
+    assert stage_count(stage) == 1
+    assert metrics.stage_errors._values[(stage, "ValueError")] == 1
+
+
+def test_middleware_sends_server_timing_for_finished_stages(monkeypatch):
+    monkeypatch.setattr(metrics, "SERVER_TIMING_ENABLED", True)
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/timed")
+    async def timed():
+        with span("retrieval"):
+            pass
+        with span("store_search", store="pdf"):
+            pass
+        return {}
+
+    response = TestClient(app).get("/timed")
+    names = [part.split(";")[0] for part in response.headers["server-timing"].split(", ")]
+    assert names == ["retrieval", "store_search-pdf", "total"]
+    assert 'handler="timed",method="GET",status="200"' in metrics.registry.render()
+
+
+def test_llm_callback_records_latency_and_tokens():
+    callback = LLMMetricsCallback()
+    model = f"model-{uuid.uuid4().hex[:6]}"
+    run_id = uuid.uuid4()
+    callback.on_chat_model_start({}, [], run_id=run_id, metadata={"ls_model_name": model})
+    message = AIMessage(content="hi", usage_metadata={"input_tokens": 12, "output_tokens": 3, "total_tokens": 15})
+    callback.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]), run_id=run_id)
+
+    assert metrics.llm_tokens._values[(model, "input")] == 12
+    assert metrics.llm_tokens._values[(model, "output")] == 3
+    assert (model,) in metrics.llm_seconds._series
+
+
+def test_cancelled_llm_calls_are_not_errors():
+    callback = LLMMetricsCallback()
+    model = f"model-{uuid.uuid4().hex[:6]}"
+    for error in (asyncio.CancelledError(), TimeoutError()):
+        run_id = uuid.uuid4()
+        callback.on_chat_model_start({}, [], run_id=run_id, metadata={"ls_model_name": model})
+        callback.on_llm_error(error, run_id=run_id)
+    assert metrics.llm_errors._values[(model,)] == 1
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from utils.numpy_store import NumpyVectorStore, matches_filter, write_numpy_index
+
+
+def unit_vectors(count, dim=32, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top(vectors, query, k):
+    scores = vectors @ query
+    return list(np.argsort(-scores)[:k])
+
+
+def build(tmp_path, vectors, dtype="float16", nlist=0, nprobe=8):
+    count = len(vectors)
+    write_numpy_index(
+        str(tmp_path / "index"), [f"c{i}" for i in range(count)], vectors,
+        [f"chunk {i} ✓" for i in range(count)],
+        [{"file_type": "pdf" if i % 2 else "txt", "row": i} for i in range(count)],
+        dtype=dtype, nlist=nlist,
+    )
+    return NumpyVectorStore(str(tmp_path / "index"), nprobe=nprobe)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_search_matches_exact_search(tmp_path, dtype):
+    vectors = unit_vectors(200)
+    store = build(tmp_path, vectors, dtype=dtype)
+    query = vectors[17]
+    rows = [row for row, _ in store.search(query, k=5)[0]]
+    assert rows[0] == 17
+    assert len(set(rows) & set(exact_top(vectors, query, 5))) >= 4
+
+
+def test_ivf_probing_every_list_is_exhaustive(tmp_path):
+    vectors = unit_vectors(200, seed=1)
+    store = build(tmp_path, vectors, nlist=8, nprobe=8)
+    queries = unit_vectors(3, seed=2)
+    for query, hits in zip(queries, store.search(queries, k=5)):
+        assert [row for row, _ in hits] == exact_top(vectors, query, 5)
+
+
+def test_filters_and_chroma_compatible_results(tmp_path):
+    vectors = unit_vectors(20, seed=3)
+    store = build(tmp_path, vectors)
+    pairs = store.similarity_search_by_vector_with_relevance_scores(
+        vectors[4].tolist(), k=3, filter={"file_type": {"$in": ["txt"]}}
+    )
+    assert all(doc.metadata["file_type"] == "txt" for doc, _ in pairs)
+    doc, distance = pairs[0]
+    assert (doc.id, doc.page_content) == ("c4", "chunk 4 ✓")
+    assert distance == pytest.approx(0.0, abs=2e-3)
+
+
+def test_matches_filter_operators():
+    metadata = {"file_type": "pdf", "source_file": "a.pdf"}
+    assert matches_filter(metadata, {"$and": [{"file_type": {"$in": ["pdf"]}}, {"source_file": "a.pdf"}]})
+    assert matches_filter(metadata, {"$or": [{"file_type": "txt"}, {"source_file": {"$ne": "b.pdf"}}]})
+    assert not matches_filter(metadata, {"file_type": {"$nin": ["pdf"]}})
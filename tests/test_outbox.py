@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+import sensitive_handler
+from utils import outbox as outbox_module
+from utils.outbox import Outbox
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "outbox.sqlite3")
+
+
+def statuses(box):
+    return dict(box._conn.execute("SELECT id, status FROM outbox").fetchall())
+
+
+def test_concurrent_senders_never_claim_the_same_message(path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "OUTBOX_DIGEST_MAX", 3)
+    boxes = [Outbox(path=path) for _ in range(4)]
+    ids = {boxes[0].enqueue("s", f"body {i}") for i in range(60)}
+    claimed = [[] for _ in boxes]
+
+    def sender(n):
+        while True:
+            _, rows = boxes[n]._claim_due()
+            if not rows:
+                return
+            claimed[n].extend(row[0] for row in rows)
+
+    threads = [threading.Thread(target=sender, args=(n,)) for n in range(len(boxes))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    everything = [row_id for rows in claimed for row_id in rows]
+    assert sorted(everything) == sorted(ids)  # each message claimed exactly once
+
+
+def test_a_new_outbox_leaves_live_claims_alone(path, monkeypatch):
+    first = Outbox(path=path)
+    row_id = first.enqueue("s", "body")
+    first._claim_due()
+
+    second = Outbox(path=path)  # e.g. another worker starting up
+    assert statuses(second)[row_id] == "sending"
+    assert second._claim_due()[1] == []
+
+    # Once the lease has expired the message is claimed again
+    monkeypatch.setattr(outbox_module, "OUTBOX_LEASE_SECONDS", 0)
+    time.sleep(0.01)
+    assert [row[0] for row in second._claim_due()[1]] == [row_id]
+
+
+def test_an_expired_claim_cannot_overwrite_the_new_one(path, monkeypatch):
+    box = Outbox(path=path)
+    row_id = box.enqueue("s", "body")
+    stale_claim, rows = box._claim_due()
+    monkeypatch.setattr(outbox_module, "OUTBOX_LEASE_SECONDS", 0)
+    time.sleep(0.01)
+    box._claim_due()
+
+    box._mark_failed(stale_claim, rows, "timeout")
+    assert statuses(box)[row_id] == "sending"
+
+
+def test_missing_password_logs_instead_of_sending(path, capsys):
+    box = Outbox(path=path, sender="bot@example.org", recipient="admin@example.org", password=None)
+    row_id = box.enqueue("s", "notification body")
+    box.flush()
+    assert statuses(box)[row_id] == "sent"
+    assert "notification body" in capsys.readouterr().out
+
+
+def test_send_admin_email_without_credentials_queues_nothing(monkeypatch):
+    monkeypatch.setattr(sensitive_handler, "_admin_outbox", None)
+    result = sensitive_handler.send_admin_email("Ali", "ali@example.org", "q")
+    assert result["message"].startswith("Credentials missing")
+    assert sensitive_handler._admin_outbox is None  # not even opened
+
+
+def test_send_admin_email_queues_with_credentials(monkeypatch, path):
+    monkeypatch.setattr(sensitive_handler, "sender_email", "bot@example.org")
+    monkeypatch.setattr(sensitive_handler, "recipient_email", "admin@example.org")
+    monkeypatch.setattr(sensitive_handler, "bot_password", "secret")
+    box = Outbox(path=path)
+    monkeypatch.setattr(sensitive_handler, "_admin_outbox", box)
+    result = sensitive_handler.send_admin_email("Ali", "ali@example.org", "q")
+    assert result["message"] == "Admin will be notified."
+    assert box.stats()["pending"] == 1
@@ -0,0 +1,41 @@
+import create_embeddings
+
+
+def write_docs(folder, count):
+    folder.mkdir()
+    for i in range(count):
+        (folder / f"doc{i}.txt").write_text(f"Document {i}. " + "Partition history. " * 100, encoding="utf-8")
+    (folder / "broken.pdf").write_bytes(b"not a pdf")
+    return sorted(str(path) for path in folder.iterdir())
+
+
+def by_path(results):
+    return {result["path"]: result for result in results}
+
+
+def test_pool_results_match_in_process_parsing(tmp_path):
+    paths = write_docs(tmp_path / "documents", 4)
+    pooled = by_path(create_embeddings.parse_files(iter(paths), workers=2, max_inflight=2))
+    serial = by_path(create_embeddings.parse_files(paths, workers=1))
+
+    assert pooled.keys() == serial.keys() == set(paths)
+    for path in paths:
+        assert [c.metadata["chunk_id"] for c in pooled[path]["chunks"]] == \
+               [c.metadata["chunk_id"] for c in serial[path]["chunks"]]
+
+
+def test_a_bad_file_is_reported_without_stopping_the_run(tmp_path):
+    paths = write_docs(tmp_path / "documents", 2)
+    results = by_path(create_embeddings.parse_files(paths, workers=1))
+    broken = results[str(tmp_path / "documents" / "broken.pdf")]
+    assert broken["error"] and broken["chunks"] == []
+    assert all(results[path]["chunks"] for path in paths if path.endswith(".txt"))
+
+
+def test_chunks_carry_positions_and_ids(tmp_path):
+    paths = write_docs(tmp_path / "documents", 1)
+    chunks = create_embeddings.split_file(paths[1])
+    assert len(chunks) > 1
+    assert [c.metadata["chunk_index"] for c in chunks] == list(range(len(chunks)))
+    assert len({c.metadata["chunk_id"] for c in chunks}) == len(chunks)
+    assert chunks[0].metadata["file_type"] == "txt"
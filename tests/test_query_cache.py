@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from utils.cache import LRUCache, SQLiteCache, memoize_query, normalize_query
+
+
+def test_normalize_query_folds_case_punctuation_and_spaces():
+    assert normalize_query("  Who founded   Pakistan?? ") == normalize_query("who founded pakistan")
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_lru_entries_expire():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a", "gone") == "gone"
+
+
+def test_sqlite_cache_survives_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCache(path, "route_query").set("q", {"sensitive": False})
+    reopened = SQLiteCache(path, "route_query")
+    assert reopened.get("q") == {"sensitive": False}
+    # Namespaces sharing a file do not see each other's keys
+    assert SQLiteCache(path, "is_news").get("q") is None
+
+
+def test_sqlite_cache_keeps_maxsize_entries(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), "ns", maxsize=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+        time.sleep(0.001)
+    assert len(cache) == 2
+    assert cache.get("a") is None
+
+
+def test_memoized_sync_function_runs_once_per_normalized_query():
+    calls = []
+
+    @memoize_query(LRUCache())
+    def classify(query):
+        calls.append(query)
+        return False
+
+    assert classify("Latest news?") is False
+    assert classify("latest   NEWS") is False
+    assert calls == ["Latest news?"]
+
+
+def test_memoized_async_function_caches_falsy_results():
+    calls = []
+
+    @memoize_query(LRUCache())
+    async def classify(query):
+        calls.append(query)
+        return None
+
+    async def run():
+        await classify("q")
+        await classify("Q!")
+
+    asyncio.run(run())
+    assert calls == ["q"]
@@ -0,0 +1,70 @@
+import asyncio
+
+from utils.response_cache import TimeBucketedCache
+
+
+def counting_fetch(result=None, delay=0.01):
+    calls = {"count": 0}
+
+    async def fetch():
+        calls["count"] += 1
+        await asyncio.sleep(delay)
+        return dict(result or {"answer": f"answer {calls['count']}"})
+
+    return fetch, calls
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = TimeBucketedCache("test-collapse", fresh_seconds=60, ttl=600)
+    fetch, calls = counting_fetch()
+
+    async def burst():
+        return await asyncio.gather(*(cache.get_or_fetch("Latest news?", fetch) for _ in range(5)))
+
+    results = asyncio.run(burst())
+    assert calls["count"] == 1
+    assert all(r == {"answer": "answer 1"} for r in results)
+    assert cache.stats()["collapsed"] == 4 and cache.stats()["in_flight"] == 0
+
+
+def test_a_cancelled_caller_leaves_the_fetch_to_the_others():
+    cache = TimeBucketedCache("test-cancel", fresh_seconds=60, ttl=600)
+    fetch, calls = counting_fetch()
+
+    async def scenario():
+        leaving = asyncio.create_task(cache.get_or_fetch("q", fetch))
+        staying = asyncio.create_task(cache.get_or_fetch("q", fetch))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(scenario()) == {"answer": "answer 1"}
+    assert calls["count"] == 1
+
+
+def test_stale_entries_are_served_and_refreshed_in_the_background():
+    cache = TimeBucketedCache("test-stale", fresh_seconds=0.05, ttl=60)
+    fetch, calls = counting_fetch()
+
+    async def scenario():
+        await cache.get_or_fetch("q", fetch)
+        await asyncio.sleep(0.06)  # next bucket: the entry is stale
+        stale = await cache.get_or_fetch("q", fetch)
+        await asyncio.gather(*cache._background)
+        return stale, cache.lookup("q")
+
+    stale, (refreshed, fresh) = asyncio.run(scenario())
+    assert stale == {"answer": "answer 1", "cached": True}
+    assert refreshed == {"answer": "answer 2"} and fresh
+    assert cache.stats()["revalidations"] == 1
+
+
+def test_uncacheable_results_are_returned_not_stored():
+    cache = TimeBucketedCache("test-uncacheable", fresh_seconds=60, ttl=600)
+    fetch, calls = counting_fetch({"answer": "Search failed"})
+    cacheable = lambda result: result["answer"] != "Search failed"  # noqa: E731
+
+    for _ in range(2):
+        assert asyncio.run(cache.get_or_fetch("q", fetch, cacheable)) == {"answer": "Search failed"}
+    assert calls["count"] == 2
+    assert cache.lookup("q") == (None, False)
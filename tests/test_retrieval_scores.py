@@ -0,0 +1,77 @@
+import asyncio
+
+import numpy as np
+from langchain_chroma import Chroma
+
+from rag_handler import cosine_similarity_fn, distance_space, query_single_store_async
+from utils.numpy_store import NumpyVectorStore, write_numpy_index
+
+
+def unit_vectors(count, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def chroma_store(path, vectors, metadata=None):
+    store = Chroma(persist_directory=str(path), collection_metadata=metadata)
+    store._collection.add(
+        ids=[f"c{i}" for i in range(len(vectors))],
+        embeddings=vectors.tolist(),
+        documents=[f"chunk {i}" for i in range(len(vectors))],
+        metadatas=[{"source_file": f"f{i}.txt"} for i in range(len(vectors))],
+    )
+    return store
+
+
+def top_scores(store, name, query):
+    pairs = asyncio.run(query_single_store_async(name, store, query.tolist(), k=3))
+    return {doc.page_content: score for doc, score in pairs}
+
+
+def test_chroma_l2_scores_are_cosine(tmp_path):
+    vectors = unit_vectors(8)
+    store = chroma_store(tmp_path / "l2", vectors)
+    assert distance_space(store) == "l2"
+
+    scores = top_scores(store, "txt", vectors[0])
+    for text, score in scores.items():
+        row = int(text.split()[1])
+        assert abs(score - float(vectors[0] @ vectors[row])) < 1e-4
+
+
+def test_chroma_cosine_space_scores_are_cosine(tmp_path):
+    vectors = unit_vectors(8, seed=1)
+    store = chroma_store(tmp_path / "cos", vectors, metadata={"hnsw:space": "cosine"})
+    assert distance_space(store) == "cosine"
+
+    scores = top_scores(store, "txt", vectors[3])
+    assert abs(scores["chunk 3"] - 1.0) < 1e-4
+
+
+def test_numpy_and_chroma_scores_agree(tmp_path):
+    vectors = unit_vectors(20, seed=2)
+    query = unit_vectors(1, seed=3)[0]
+    chroma = chroma_store(tmp_path / "chroma", vectors)
+    write_numpy_index(
+        str(tmp_path / "numpy"), [f"c{i}" for i in range(20)], vectors,
+        [f"chunk {i}" for i in range(20)], [{} for _ in range(20)],
+    )
+    numpy_store = NumpyVectorStore(str(tmp_path / "numpy"))
+
+    chroma_scores = top_scores(chroma, "unified", query)
+    numpy_scores = top_scores(numpy_store, "unified", query)
+    assert chroma_scores.keys() == numpy_scores.keys()
+    for text, score in chroma_scores.items():
+        # float16 storage on the numpy side
+        assert abs(score - numpy_scores[text]) < 2e-3
+
+
+def test_conversion_by_space():
+    class Store:
+        pass
+
+    store = Store()
+    store.distance_space = "l2"
+    assert cosine_similarity_fn(store)(0.5) == 0.75
+    store.distance_space = "ip"
+    assert cosine_similarity_fn(store)(0.25) == 0.75
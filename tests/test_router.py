@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+import router_handler
+from router_handler import RouteDecision
+
+
+class FakeRouterLLM:
+    """Stands in for the chat model; returns `decision` or raises it if it is an exception."""
+
+    def __init__(self, decision):
+        self.decision = decision
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        assert schema is RouteDecision
+        return self
+
+    async def ainvoke(self, prompt):
+        self.calls += 1
+        if isinstance(self.decision, Exception):
+            raise self.decision
+        return self.decision
+
+
+@pytest.fixture
+def router(monkeypatch):
+    """LLM routing only (no local tier), with fake classifiers for the fallback path."""
+    classified = []
+
+    async def fake_sensitive(query):
+        classified.append("sensitive")
+        return "troops" in query
+
+    async def fake_news(query):
+        classified.append("news")
+        return "latest" in query
+
+    monkeypatch.setattr(router_handler, "LOCAL_ROUTER_ENABLED", False)
+    monkeypatch.setattr(router_handler, "is_sensitive_async", fake_sensitive)
+    monkeypatch.setattr(router_handler, "is_news_queury_async", fake_news)
+    router_handler.route_cache.clear()
+    yield classified
+    router_handler.route_cache.clear()
+
+
+def route(query):
+    return asyncio.run(router_handler.route_query_async(query))
+
+
+def test_one_structured_call_gives_the_whole_route(monkeypatch, router):
+    llm = FakeRouterLLM(RouteDecision(sensitive=False, news=True, domain="current_affairs"))
+    monkeypatch.setattr(router_handler, "llm", llm)
+    assert route("latest on the budget") == {"sensitive": False, "news": True, "domain": "current_affairs"}
+    assert llm.calls == 1
+    assert router == []
+
+
+def test_routes_are_memoized_on_the_normalized_query(monkeypatch, router):
+    llm = FakeRouterLLM(RouteDecision(sensitive=False, news=False, domain="history"))
+    monkeypatch.setattr(router_handler, "llm", llm)
+    route("What was the Lahore Resolution?")
+    route("what was the lahore resolution")
+    assert llm.calls == 1
+
+
+def test_failed_structured_call_falls_back_to_the_classifiers(monkeypatch, router):
+    monkeypatch.setattr(router_handler, "llm", FakeRouterLLM(ValueError("unparseable output")))
+    assert route("latest cricket score") == {"sensitive": False, "news": True, "domain": "current_affairs"}
+    assert router == ["sensitive", "news"]
+
+
+def test_fallback_skips_the_news_check_for_sensitive_queries(monkeypatch, router):
+    monkeypatch.setattr(router_handler, "llm", FakeRouterLLM(ValueError("unparseable output")))
+    assert route("where are the troops")["sensitive"] is True
+    assert router == ["sensitive"]
+
+
+def test_obvious_history_questions_never_reach_the_llm(monkeypatch, router):
+    llm = FakeRouterLLM(RouteDecision(sensitive=False, news=False, domain="general"))
+    monkeypatch.setattr(router_handler, "llm", llm)
+    monkeypatch.setattr(router_handler, "LOCAL_ROUTER_ENABLED", True)
+    assert route("Who founded Pakistan?")["domain"] == "history"
+    assert llm.calls == 0
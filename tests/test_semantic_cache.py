@@ -0,0 +1,126 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import rag_handler
+from utils.bm25 import BM25Index
+from utils.semantic_cache import SemanticCache
+
+
+def test_lookup_by_similarity():
+    cache = SemanticCache(threshold=0.95)
+    cache.store([1.0, 0.0], "Who founded Pakistan?", {"answer": "Jinnah"})
+    assert cache.lookup([0.99, 0.05]) == {"answer": "Jinnah"}
+    assert cache.lookup([0.0, 1.0]) is None
+
+
+def test_exact_entries_need_no_embedding():
+    cache = SemanticCache()
+    cache.store(None, "Who founded  Pakistan?", {"answer": "Jinnah"})
+    assert cache.lookup_exact("who founded pakistan") == {"answer": "Jinnah"}
+    # Not part of the similarity matrix
+    assert cache.lookup([1.0, 0.0]) is None
+
+
+def test_restoring_a_query_replaces_its_entry():
+    cache = SemanticCache()
+    cache.store([1.0, 0.0], "q", {"answer": "old"})
+    cache.store(None, "Q", {"answer": "new"})
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup_exact("q") == {"answer": "new"}
+
+
+def test_index_version_change_clears_exact_entries():
+    cache = SemanticCache()
+    cache.store(None, "q", {"answer": "a"}, index_version="v1")
+    assert cache.lookup_exact("q", index_version="v2") is None
+
+
+@pytest.fixture
+def hybrid_rag(monkeypatch):
+    """Hybrid retrieval over a small BM25 index; counts query embeddings and answer generations."""
+    texts = [
+        "The Lahore Resolution was passed on 23 March 1940 at Minto Park.",
+        "The Objectives Resolution was adopted in 1949.",
+        "Mohenjo-daro is a site of the Indus Valley civilisation.",
+    ]
+    index = BM25Index.build([f"c{i}" for i in range(3)], texts, [{"source_file": f"f{i}.txt"} for i in range(3)])
+    calls = {"embed": 0, "generate": 0}
+
+    async def fake_embed(user_query, embeddings=None):
+        calls["embed"] += 1
+        return list(np.ones(4) / 2)
+
+    async def fake_generate(chain, payload, timeout=None):
+        calls["generate"] += 1
+        return "FOUND: an answer"
+
+    async def fake_stream(chain, payload, timeout=None):
+        calls["generate"] += 1
+        for token in ("FOUND:", " an", " answer"):
+            yield token
+
+    monkeypatch.setattr(rag_handler, "RETRIEVAL_MODE", "hybrid")
+    monkeypatch.setattr(rag_handler, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(rag_handler, "LEXICAL_FASTPATH_MIN_SCORE", 0.1)
+    monkeypatch.setattr(rag_handler, "answer_cache", SemanticCache())
+    monkeypatch.setattr(rag_handler.vector_registry, "lexical_index", index)
+    monkeypatch.setattr(rag_handler, "embed_query", fake_embed)
+    monkeypatch.setattr(rag_handler, "ainvoke_with_timeout", fake_generate)
+    monkeypatch.setattr(rag_handler, "astream_with_timeout", fake_stream)
+    monkeypatch.setattr(rag_handler, "build_answer_chain", lambda: None)
+    return calls
+
+
+def test_lexical_fast_path_never_embeds(hybrid_rag):
+    query = "When was the Lahore Resolution passed in Minto Park?"
+    first = asyncio.run(rag_handler.query_all_top3(query, {}))
+    second = asyncio.run(rag_handler.query_all_top3(query, {}))
+
+    assert first["answer"] == "an answer" and not first.get("cached")
+    assert second["cached"] is True
+    assert hybrid_rag == {"embed": 0, "generate": 1}
+
+
+def test_unconfident_bm25_uses_the_semantic_cache(hybrid_rag):
+    query = "Tell me about civilisations older than Mohenjo-daro elsewhere"
+    asyncio.run(rag_handler.query_all_top3(query, {}))
+    asyncio.run(rag_handler.query_all_top3(query, {}))
+    # One embedding per request for the cache lookup; the second request is a cache hit
+    assert hybrid_rag["embed"] == 2
+
+
+def test_stream_fast_path_never_embeds(hybrid_rag):
+    async def collect(query):
+        return [event async for event in rag_handler.stream_query_all_top3(query, {})]
+
+    query = "When was the Lahore Resolution passed in Minto Park?"
+    first = asyncio.run(collect(query))
+    second = asyncio.run(collect(query))
+    assert first[-1]["answer"] == "an answer"
+    assert second[-1]["cached"] is True
+    assert hybrid_rag == {"embed": 0, "generate": 1}
+
+
+def test_not_found_answers_are_not_cached(hybrid_rag, monkeypatch):
+    async def not_found(chain, payload, timeout=None):
+        hybrid_rag["generate"] += 1
+        return "Information not found in documents."
+
+    async def not_found_stream(chain, payload, timeout=None):
+        hybrid_rag["generate"] += 1
+        yield "Information not found in documents."
+
+    monkeypatch.setattr(rag_handler, "ainvoke_with_timeout", not_found)
+    monkeypatch.setattr(rag_handler, "astream_with_timeout", not_found_stream)
+
+    async def collect(query):
+        return [event async for event in rag_handler.stream_query_all_top3(query, {})]
+
+    query = "When was the Lahore Resolution passed in Minto Park?"
+    assert asyncio.run(rag_handler.query_all_top3(query, {}))["answer"] is None
+    assert asyncio.run(collect(query))[-1]["answer"] is None
+    assert asyncio.run(rag_handler.query_all_top3(query, {}))["answer"] is None
+    assert hybrid_rag["generate"] == 3
+    assert rag_handler.answer_cache.stats()["entries"] == 0
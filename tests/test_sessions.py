@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+
+from utils.sessions import ChatEvent, ChatState, InvalidTransition, Session, SessionStore
+
+
+def test_contact_flow():
+    session = Session()
+    session.transition(ChatEvent.ANSWERED)
+    assert session.state == ChatState.ACTIVE
+
+    session.transition(ChatEvent.SENSITIVE_QUERY, pending_query="where are the troops?")
+    session.transition(ChatEvent.ANSWERED)  # other questions are answered while waiting
+    assert session.state == ChatState.AWAITING_CONTACT
+    assert session.pending_query == "where are the troops?"
+
+    session.transition(ChatEvent.CONTACT_RECEIVED)
+    assert session.state == ChatState.ACTIVE
+    assert session.pending_query is None
+
+
+@pytest.mark.parametrize("state", [ChatState.IDLE, ChatState.ACTIVE])
+def test_contact_only_received_when_awaited(state):
+    with pytest.raises(InvalidTransition):
+        Session(state=state).transition(ChatEvent.CONTACT_RECEIVED)
+
+
+def test_sessions_saved_before_the_active_state_load_as_active():
+    session = Session.from_dict({"id": "s", "history": [{"user": "q", "AI": "a"}], "state": "IDLE"})
+    assert session.state == ChatState.ACTIVE
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store_pair(request, tmp_path):
+    """Two stores over the same sessions, as two workers would see them."""
+    if request.param == "memory":
+        store = SessionStore(backend="memory")
+        return store, store
+    path = str(tmp_path / "sessions.sqlite3")
+    return SessionStore(backend="sqlite", path=path), SessionStore(backend="sqlite", path=path)
+
+
+def test_save_is_compare_and_set(store_pair):
+    first_store, second_store = store_pair
+    session = Session()
+    assert first_store.save(session)
+
+    first, second = first_store.load(session.id), second_store.load(session.id)
+    assert first_store.save(first)
+    assert not second_store.save(second)  # stale: loaded before the first save
+    assert second_store.load(session.id).version == 2
+
+
+def test_concurrent_turns_are_both_kept(store_pair):
+    first_store, second_store = store_pair
+    session = Session()
+    first_store.save(session)
+
+    first, second = first_store.load(session.id), second_store.load(session.id)
+    first_store.record_turn(first, "q1", "a1", ChatEvent.SENSITIVE_QUERY, pending_query="q1")
+    second_store.record_turn(second, "q2", "a2", ChatEvent.ANSWERED)
+
+    stored = first_store.load(session.id)
+    assert [turn["user"] for turn in stored.history] == ["q1", "q2"]
+    # The later turn was re-applied on top of the sensitive one, so the contact is still awaited
+    assert stored.state == ChatState.AWAITING_CONTACT and stored.pending_query == "q1"
+
+
+def test_contact_received_twice_records_both_turns(store_pair):
+    first_store, second_store = store_pair
+    session = Session(state=ChatState.AWAITING_CONTACT, pending_query="q")
+    first_store.save(session)
+
+    first, second = first_store.load(session.id), second_store.load(session.id)
+    first_store.record_turn(first, "me@x.org", "notified", ChatEvent.CONTACT_RECEIVED)
+    second_store.record_turn(second, "me@x.org", "notified", ChatEvent.CONTACT_RECEIVED)
+    stored = first_store.load(session.id)
+    assert stored.state == ChatState.ACTIVE and len(stored.history) == 2
+
+
+def test_threads_recording_turns_lose_none(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    stores = [SessionStore(backend="sqlite", path=path) for _ in range(4)]
+    session = Session()
+    stores[0].save(session)
+
+    def worker(store, n):
+        for i in range(5):
+            store.record_turn(store.load(session.id), f"{n}-{i}", "a", ChatEvent.ANSWERED, attempts=100)
+
+    threads = [threading.Thread(target=worker, args=(store, n)) for n, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(stores[0].load(session.id).history) == 20
+
+
+def test_unsaved_turns_are_not_visible_to_other_requests():
+    store = SessionStore(backend="memory")
+    session = Session()
+    store.record_turn(session, "q1", "a1", ChatEvent.ANSWERED)
+
+    loaded = store.load(session.id)
+    loaded.add_turn("q2", "a2")
+    loaded.history[0]["AI"] = "edited"
+    stored = store.load(session.id)
+    assert stored.history == [{"user": "q1", "AI": "a1"}]
+
+    # A rejected save leaves the stored session as it was
+    stale = store.load(session.id)
+    store.record_turn(store.load(session.id), "q3", "a3", ChatEvent.ANSWERED)
+    stale.add_turn("q4", "a4")
+    assert not store.save(stale)
+    assert [turn["user"] for turn in store.load(session.id).history] == ["q1", "q3"]
+
+
+def test_sessions_rebuilt_from_client_history_are_not_stored():
+    store = SessionStore(backend="memory")
+    session = Session.from_client_history([{"user": "q", "AI": "Sensitive?"}], "Sensitive?")
+    assert session.state == ChatState.AWAITING_CONTACT
+
+    store.record_turn(session, "me@x.org", "notified", ChatEvent.CONTACT_RECEIVED)
+    assert session.state == ChatState.ACTIVE and len(session.history) == 2
+    assert store.stats()["size"] == 0
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from fastapi import Response
+
+import application
+from utils.sessions import Session
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Fake retrieval, generation, routing and web search; records which stages ran."""
+    calls = {"retrieved": 0, "generated": 0, "web": 0}
+    state = {"route": {"sensitive": False, "news": False}, "top_score": 0.9, "answer": "an answer"}
+
+    async def fake_retrieve(user_query, vectordbs):
+        calls["retrieved"] += 1
+        return {"cached": None, "context": {"top_score": state["top_score"]}, "query_embedding": None, "use_cache": True}
+
+    async def fake_answer(user_query, retrieval):
+        calls["generated"] += 1
+        await asyncio.sleep(0.01)
+        return {"answer": state["answer"], "sources": [], "from": []}
+
+    async def fake_route(user_query):
+        # Let the speculative retrieval finish first, as it would with a slow router
+        await asyncio.sleep(0.01)
+        return state["route"]
+
+    async def fake_web(user_query):
+        calls["web"] += 1
+        return {"response": {"AI": "from the web"}}
+
+    monkeypatch.setattr(application, "retrieve_for_answer", fake_retrieve)
+    monkeypatch.setattr(application, "answer_retrieved", fake_answer)
+    monkeypatch.setattr(application, "route_query_async", fake_route)
+    monkeypatch.setattr(application, "query_web_async", fake_web)
+    monkeypatch.setattr(application, "SCORE_THRESHOLD", 0.75)
+    monkeypatch.setattr(application, "WEB_SPECULATION_SCORE", 0.80)
+    return calls, state
+
+
+def chat(query):
+    return asyncio.run(application.answer_chat(query, Session(), Response()))
+
+
+def test_sensitive_route_never_generates(pipeline):
+    calls, state = pipeline
+    state["route"] = {"sensitive": True, "news": False}
+    result = chat("something sensitive")
+    assert result["response"]["AI"] == application.SENSITIVE_PROMPT_MESSAGE
+    assert calls == {"retrieved": 1, "generated": 0, "web": 0}
+
+
+def test_rag_route_generates_after_routing(pipeline):
+    calls, _ = pipeline
+    result = chat("Who founded Pakistan?")
+    assert result["response"]["AI"] == "an answer"
+    assert calls == {"retrieved": 1, "generated": 1, "web": 0}
+
+
+def test_weak_retrieval_speculates_the_web_search(pipeline):
+    calls, state = pipeline
+    state["top_score"], state["answer"] = 0.77, None
+    result = chat("Who founded Pakistan?")
+    assert result["response"]["AI"] == "from the web"
+    assert calls == {"retrieved": 1, "generated": 1, "web": 1}
+
+
+def test_default_band_sits_just_above_the_threshold():
+    assert application.SCORE_THRESHOLD < application.WEB_SPECULATION_SCORE <= application.SCORE_THRESHOLD + 0.1
+
+
+@pytest.mark.parametrize("score,expected", [(None, False), (0.7, False), (0.75, True), (0.79, True), (0.8, False)])
+def test_should_speculate_band(monkeypatch, score, expected):
+    monkeypatch.setattr(application, "SCORE_THRESHOLD", 0.75)
+    monkeypatch.setattr(application, "WEB_SPECULATION_SCORE", 0.80)
+    assert application.should_speculate(score) is expected
+
+
+def test_rag_outcomes_are_recorded_for_calibration(pipeline):
+    _, state = pipeline
+    state["top_score"], state["answer"] = 0.77, None
+    chat("Who founded Pakistan?")
+    assert 'rag_top_score_bucket{outcome="missed",le="0.775"}' in application.metrics_registry.render()
+
+
+def test_router_and_classifier_timeouts_answer_without_an_error(pipeline, monkeypatch):
+    import router_handler
+
+    class TimingOutLLM:
+        def with_structured_output(self, schema):
+            return self
+
+        async def ainvoke(self, prompt):
+            raise asyncio.TimeoutError()
+
+    async def timing_out_classifier(query):
+        raise asyncio.TimeoutError()
+
+    calls, _ = pipeline
+    monkeypatch.setattr(application, "route_query_async", router_handler.route_query_async)
+    monkeypatch.setattr(router_handler, "LOCAL_ROUTER_ENABLED", False)
+    monkeypatch.setattr(router_handler, "llm", TimingOutLLM())
+    monkeypatch.setattr(router_handler, "is_sensitive_async", timing_out_classifier)
+    monkeypatch.setattr(router_handler, "is_news_queury_async", timing_out_classifier)
+    session = Session()
+
+    result = asyncio.run(application.answer_chat("Who founded Pakistan?", session, Response()))
+    assert result["response"]["AI"] == application.ROUTING_UNAVAILABLE_MESSAGE
+    assert calls["generated"] == 0 and calls["web"] == 0
+    assert session.history == []
+    # Nothing was decided, so nothing was memoized
+    assert router_handler.route_cache.get("who founded pakistan") is None
+
+
+def test_session_conflicts_do_not_lose_the_answer(pipeline, monkeypatch):
+    from utils.sessions import SessionConflict
+
+    def conflicting_record_turn(session, *args, **kwargs):
+        raise SessionConflict(session.id)
+
+    monkeypatch.setattr(application.session_store, "record_turn", conflicting_record_turn)
+    assert chat("Who founded Pakistan?")["response"]["AI"] == "an answer"
+
+
+def test_legacy_chat_history_requests_get_no_session(pipeline):
+    size = application.session_store.stats()["size"]
+    data = application.UserQuery(query="Who founded Pakistan?", chat_history=[{"user": "hi", "AI": "hello"}])
+    response = Response()
+    result = asyncio.run(application.chat_endpoint(data, response))
+    assert result["session_id"] is None and "X-Session-Id" not in response.headers
+    assert application.session_store.stats()["size"] == size
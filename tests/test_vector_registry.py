@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+import rag_handler
+from rag_handler import VectorStoreRegistry
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    """An index directory with a version marker; load_vectordbs is faked and counts its calls."""
+    loads = []
+
+    def fake_load_vectordbs(base_dir, embeddings=None, **kwargs):
+        if (tmp_path / "index" / "broken").exists():
+            raise RuntimeError("corrupt collection")
+        loads.append(rag_handler.read_index_version(base_dir))
+        return {"unified": f"store {len(loads)}"}
+
+    monkeypatch.setattr(rag_handler, "load_vectordbs", fake_load_vectordbs)
+    monkeypatch.setattr(rag_handler, "load_lexical_index", lambda base_dir: None)
+    path = tmp_path / "index"
+    path.mkdir()
+    (path / rag_handler.INDEX_VERSION_FILE).write_text("v1")
+    return path, loads
+
+
+def registry_for(path, check_interval=0.0):
+    registry = VectorStoreRegistry(base_dir=str(path), check_interval=check_interval)
+    registry.embeddings = object()  # never reaches OpenAI
+    return registry
+
+
+def test_stores_are_opened_once(index_dir):
+    path, loads = index_dir
+    registry = registry_for(path, check_interval=3600)
+    first = registry.get()
+    assert registry.get() is first
+    assert loads == ["v1"]
+
+
+def test_a_new_index_version_is_picked_up(index_dir):
+    path, loads = index_dir
+    registry = registry_for(path)
+    registry.get()
+    assert registry.get() == {"unified": "store 1"}
+
+    (path / rag_handler.INDEX_VERSION_FILE).write_text("v2")
+    # Requests keep the current stores while the new version opens in the background
+    assert registry.get() == {"unified": "store 1"}
+    registry._reload_thread.join(5)
+    assert registry.get() == {"unified": "store 2"}
+    assert registry.index_version == "v2"
+    assert loads == ["v1", "v2"]
+
+
+def test_a_slow_reload_does_not_block_requests(index_dir, monkeypatch):
+    path, loads = index_dir
+    registry = registry_for(path)
+    stores = registry.get()
+    release = threading.Event()
+    load_vectordbs = rag_handler.load_vectordbs
+
+    def slow_load_vectordbs(base_dir, embeddings=None, **kwargs):
+        release.wait(5)
+        return load_vectordbs(base_dir, embeddings, **kwargs)
+
+    monkeypatch.setattr(rag_handler, "load_vectordbs", slow_load_vectordbs)
+    (path / rag_handler.INDEX_VERSION_FILE).write_text("v2")
+    started = time.monotonic()
+    for _ in range(3):
+        assert registry.get() is stores
+    assert time.monotonic() - started < 1
+    release.set()
+    registry._reload_thread.join(5)
+    # Only one reload ran for the three requests
+    assert loads == ["v1", "v2"]
+
+
+def test_a_missing_version_marker_keeps_the_loaded_stores(index_dir):
+    path, loads = index_dir
+    registry = registry_for(path)
+    registry.get()
+    (path / rag_handler.INDEX_VERSION_FILE).unlink()
+    assert registry.reload_if_changed() is False
+    assert loads == ["v1"]
+
+
+def test_a_failed_reload_keeps_serving_the_old_stores(index_dir):
+    path, loads = index_dir
+    registry = registry_for(path)
+    stores = registry.get()
+    (path / "broken").touch()
+    (path / rag_handler.INDEX_VERSION_FILE).write_text("v2")
+
+    assert registry.get() is stores
+    registry._reload_thread.join(5)
+    assert registry.get() is stores
+    assert registry.health()["last_error"] == "corrupt collection"
+    assert registry.index_version == "v1"
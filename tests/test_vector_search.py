@@ -0,0 +1,120 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_chroma import Chroma
+
+import rag_handler
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+QUERY = unit([1, 0, 0, 0])
+
+
+def chroma_store(path, rows):
+    """rows: (id, vector, text, metadata)."""
+    store = Chroma(persist_directory=str(path))
+    store._collection.add(
+        ids=[row[0] for row in rows],
+        embeddings=[unit(row[1]) for row in rows],
+        documents=[row[2] for row in rows],
+        metadatas=[row[3] for row in rows],
+    )
+    return store
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """Every query embeds to QUERY; counts the embedding calls."""
+    calls = []
+
+    async def fake_embed(user_query, embeddings=None):
+        calls.append(user_query)
+        return QUERY
+
+    monkeypatch.setattr(rag_handler, "embed_query", fake_embed)
+    return calls
+
+
+@pytest.fixture
+def per_type_stores(tmp_path):
+    return {
+        "txt": chroma_store(tmp_path / "txt", [
+            ("t1", [1, 0.1, 0, 0], "txt best", {"source_file": "a.txt"}),
+            ("t2", [0, 1, 0, 0], "txt far", {"source_file": "b.txt"}),
+        ]),
+        "pdf": chroma_store(tmp_path / "pdf", [
+            ("p1", [1, 0.3, 0, 0], "pdf second", {"source_file": "a.pdf"}),
+            ("p2", [1, 0.6, 0, 0], "pdf third", {"source_file": "b.pdf"}),
+        ]),
+        "docx": None,
+    }
+
+
+def search(stores, **kwargs):
+    return asyncio.run(rag_handler.vector_search("q", stores, **kwargs))
+
+
+def test_per_store_hits_merge_into_a_global_top_k(embedded, per_type_stores):
+    hits = search(per_type_stores, per_store_k=2, top_k=3)
+    assert [doc.page_content for doc, _ in hits] == ["txt best", "pdf second", "pdf third"]
+    assert [doc.metadata["store_name"] for doc, _ in hits] == ["txt", "pdf", "pdf"]
+    scores = [score for _, score in hits]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_no_loaded_store_returns_nothing_without_embedding(embedded):
+    assert search({"txt": None, "pdf": None}) == []
+    assert embedded == []
+
+
+def test_the_query_is_embedded_once_for_all_stores(embedded, per_type_stores, monkeypatch):
+    vectors = []
+    query_store = rag_handler.query_single_store_async
+
+    async def recording_query(store_name, vectordb, query_embedding, **kwargs):
+        vectors.append(query_embedding)
+        return await query_store(store_name, vectordb, query_embedding, **kwargs)
+
+    monkeypatch.setattr(rag_handler, "query_single_store_async", recording_query)
+    search(per_type_stores)
+    assert embedded == ["q"]
+    assert len(vectors) == 3 and all(vector is QUERY for vector in vectors)
+
+
+@pytest.fixture
+def unified_store(tmp_path):
+    return {rag_handler.UNIFIED_STORE_NAME: chroma_store(tmp_path / "unified", [
+        ("t1", [1, 0.1, 0, 0], "txt best", {"source_file": "a.txt", "file_type": "txt"}),
+        ("p1", [1, 0.3, 0, 0], "pdf second", {"source_file": "a.pdf", "file_type": "pdf"}),
+        ("p2", [1, 0.6, 0, 0], "pdf third", {"source_file": "b.pdf", "file_type": "pdf"}),
+    ])}
+
+
+def test_metadata_filter_shapes():
+    assert rag_handler.build_metadata_filter() is None
+    assert rag_handler.build_metadata_filter(["pdf"]) == {"file_type": {"$in": ["pdf"]}}
+    assert rag_handler.build_metadata_filter(["pdf"], ["a.pdf"]) == {
+        "$and": [{"file_type": {"$in": ["pdf"]}}, {"source_file": {"$in": ["a.pdf"]}}]
+    }
+
+
+def test_unified_collection_filters_by_file_type(embedded, unified_store):
+    hits = search(unified_store, file_types=["pdf"], top_k=3)
+    assert [doc.page_content for doc, _ in hits] == ["pdf second", "pdf third"]
+    # The unified collection reports the chunk's file type as its store
+    assert {doc.metadata["store_name"] for doc, _ in hits} == {"pdf"}
+
+
+def test_unified_collection_filters_by_source_file(embedded, unified_store):
+    hits = search(unified_store, file_types=["pdf"], source_files=["b.pdf"])
+    assert [doc.page_content for doc, _ in hits] == ["pdf third"]
+
+
+def test_per_type_stores_are_skipped_by_file_type(embedded, per_type_stores):
+    hits = search(per_type_stores, file_types=["txt"], top_k=3)
+    assert {doc.metadata["store_name"] for doc, _ in hits} == {"txt"}
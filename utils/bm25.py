@@ -0,0 +1,201 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import List, Dict, Optional, Tuple
+
+from langchain_core.documents import Document
+from utils.numpy_store import matches_filter
+
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from",
+    "how", "in", "is", "it", "of", "on", "or", "tell", "that", "the", "this", "to",
+    "was", "were", "what", "when", "where", "which", "who", "whom", "why", "with", "about", "me",
+}
+# Rows whose metadata is read per query when a filter has to be applied
+FILTER_BATCH_ROWS = 500
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE chunks (row INTEGER PRIMARY KEY, id TEXT, text TEXT, metadata TEXT, length INTEGER);
+CREATE TABLE postings (term TEXT, row INTEGER, tf INTEGER);
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word/number tokens without stopwords. Years like "1971" are kept as terms."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the split chunks, kept in a SQLite file.
+    Stores chunk text and metadata too, so lexical hits can be answered without the vector store.
+    A search reads only the postings of the query terms; nothing is loaded up front.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._lock = threading.Lock()
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        self.k1 = float(meta["k1"])
+        self.b = float(meta["b"])
+        self.count = int(meta["count"])
+        self.avg_length = float(meta["avg_length"])
+        self.term_count = int(meta["terms"])
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def build(cls, ids: List[str], texts: List[str], metadatas: List[Dict], k1=1.5, b=0.75,
+              path: Optional[str] = None) -> "BM25Index":
+        builder = BM25Builder(path, k1=k1, b=b)
+        builder.add(ids, texts, metadatas)
+        return builder.build()
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        # The file is only ever replaced by rename, never modified in place, so it can be opened immutable
+        conn = sqlite3.connect(f"file:{path}?immutable=1", uri=True, check_same_thread=False)
+        return cls(conn)
+
+    def idf(self, df: int) -> float:
+        return math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 10, filter: Optional[Dict] = None) -> List[Tuple[int, float, float]]:
+        """
+        Return (row, bm25_score, coverage) for the top-k chunks.
+        coverage is the idf-weighted share of the query terms that occur in the chunk (0-1).
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return []
+        marks = ",".join("?" * len(query_terms))
+        with self._lock:
+            df = dict(self._conn.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({marks})", tuple(query_terms)
+            ).fetchall())
+            if not df:
+                return []
+            postings = self._conn.execute(
+                "SELECT p.term, p.row, p.tf, c.length FROM postings p JOIN chunks c ON c.row = p.row "
+                f"WHERE p.term IN ({','.join('?' * len(df))})", tuple(df)
+            ).fetchall()
+
+        idf = {term: self.idf(n) for term, n in df.items()}
+        # Terms missing from the corpus count at maximum idf, so they lower coverage
+        missing_idf = self.idf(0)
+        total_idf = sum(idf.get(t, missing_idf) for t in query_terms)
+
+        scores = defaultdict(float)
+        matched_idf = defaultdict(float)
+        for term, row, tf, length in postings:
+            norm = self.k1 * (1 - self.b + self.b * length / (self.avg_length or 1.0))
+            scores[row] += idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            matched_idf[row] += idf[term]
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if filter:
+            ranked = self._filtered(ranked, filter, k)
+        return [(row, score, matched_idf[row] / total_idf) for row, score in ranked[:k]]
+
+    def _filtered(self, ranked: List[Tuple[int, float]], where: Dict, k: int) -> List[Tuple[int, float]]:
+        """The best-scoring rows that match `where`, reading metadata only until k are found."""
+        kept = []
+        for start in range(0, len(ranked), FILTER_BATCH_ROWS):
+            batch = ranked[start:start + FILTER_BATCH_ROWS]
+            with self._lock:
+                metadata = dict(self._conn.execute(
+                    f"SELECT row, metadata FROM chunks WHERE row IN ({','.join('?' * len(batch))})",
+                    tuple(row for row, _ in batch),
+                ).fetchall())
+            kept.extend((row, score) for row, score in batch if matches_filter(json.loads(metadata[row]), where))
+            if len(kept) >= k:
+                break
+        return kept
+
+    def document(self, row: int) -> Document:
+        with self._lock:
+            chunk_id, text, metadata = self._conn.execute(
+                "SELECT id, text, metadata FROM chunks WHERE row = ?", (row,)
+            ).fetchone()
+        return Document(page_content=text, metadata=json.loads(metadata), id=chunk_id)
+
+
+class BM25Builder:
+    """
+    Builds a BM25Index batch by batch. Chunks and postings go straight to a SQLite file, so only
+    the current batch is held in memory; build() adds the term statistics and publishes the file.
+    Without a path the index is built in memory (small indexes and tests).
+    """
+
+    def __init__(self, path: Optional[str] = None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.count = 0
+        self.total_length = 0
+        self.tmp_path = None
+        if path:
+            self.tmp_path = path + ".tmp"
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+        self._conn = sqlite3.connect(self.tmp_path or ":memory:", check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict]):
+        chunks, postings = [], []
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            row = self.count
+            terms = Counter(tokenize(text))
+            length = sum(terms.values())
+            chunks.append((row, chunk_id, text, json.dumps(metadata or {}), length))
+            postings.extend((term, row, tf) for term, tf in terms.items())
+            self.count += 1
+            self.total_length += length
+        self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", chunks)
+        self._conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+        self._conn.commit()
+
+    def discard(self):
+        """Drop the partial index without publishing it."""
+        self._conn.close()
+        if self.tmp_path and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def build(self) -> BM25Index:
+        conn = self._conn
+        # Sorted and aggregated by SQLite (spilling to disk as needed), not in Python
+        conn.execute("CREATE INDEX postings_term ON postings (term, row)")
+        conn.execute("CREATE TABLE terms (term TEXT PRIMARY KEY, df INTEGER) WITHOUT ROWID")
+        conn.execute("INSERT INTO terms SELECT term, COUNT(*) FROM postings GROUP BY term")
+        terms = conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("k1", str(self.k1)),
+            ("b", str(self.b)),
+            ("count", str(self.count)),
+            ("avg_length", str(self.total_length / self.count if self.count else 0.0)),
+            ("terms", str(terms)),
+        ])
+        conn.commit()
+        if not self.path:
+            return BM25Index(conn)
+
+        conn.close()
+        os.replace(self.tmp_path, self.path)
+        return BM25Index.load(self.path)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """Fuse several ranked id lists: score(id) = sum(1 / (k + rank))."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] += 1.0 / (k + rank)
+    return dict(fused)
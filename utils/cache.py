@@ -0,0 +1,299 @@
+import os
+import re
+import json
+import hashlib
+import time
+import sqlite3
+import inspect
+import functools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Small thread-safe LRU cache with a fixed maximum number of entries and an optional TTL (seconds)."""
+
+    def __init__(self, maxsize: int = 256, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def set_if_version(self, key, value: dict, expected_version: int) -> bool:
+        """
+        Optimistic concurrency for versioned dict values: set only if the stored value's "version"
+        is still `expected_version` (a missing or expired entry counts as version 0).
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            current = 0
+            if entry is not None and (entry[1] is None or entry[1] >= time.time()):
+                current = entry[0].get("version", 0)
+            if current != expected_version:
+                return False
+            self._set(key, value)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+class SQLiteCache:
+    """
+    LRU/TTL cache persisted in a local SQLite file so entries survive restarts.
+    Several caches can share one file through different namespaces. Values must be JSON-serializable.
+    """
+
+    def __init__(self, path: str, namespace: str, maxsize: int = 256, ttl: float = None):
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "namespace TEXT, key TEXT, value TEXT, expires_at REAL, last_access REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.commit()
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return default
+            self._conn.execute(
+                "UPDATE cache SET last_access = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+            self._conn.commit()
+
+    def _set(self, key, value):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value), expires_at, now),
+        )
+        # Drop expired rows, then the least recently used ones beyond maxsize
+        self._conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at < ?",
+            (self.namespace, now),
+        )
+        self._conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            "SELECT key FROM cache WHERE namespace = ? ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.maxsize),
+        )
+
+    def set_if_version(self, key, value: dict, expected_version: int) -> bool:
+        """
+        Optimistic concurrency for versioned dict values: set only if the stored value's "version"
+        is still `expected_version` (a missing or expired entry counts as version 0).
+        The check and the write share one IMMEDIATE transaction, so this holds across processes.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+                ).fetchone()
+                current = 0
+                if row is not None and (row[1] is None or row[1] >= time.time()):
+                    current = json.loads(row[0]).get("version", 0)
+                if current != expected_version:
+                    self._conn.rollback()
+                    return False
+                self._set(key, value)
+                self._conn.commit()
+                return True
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"size": len(self), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model, sha256 of the text), stored as float32 blobs in SQLite.
+    Identical chunks are never embedded twice, across re-runs, crashes and splitter changes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT, text_hash TEXT, vector BLOB, PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, hashes: list) -> dict:
+        """Return {text_hash: vector} for the hashes that are cached."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    (model, *batch),
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, items: dict):
+        """Store {text_hash: vector}."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items.items()],
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"size": len(self), "hits": self.hits, "misses": self.misses}
+
+
+# -------------------------
+# Query-keyed memoization
+# -------------------------
+_PUNCTUATION = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def normalize_query(text: str) -> str:
+    """Fold case, punctuation and whitespace so trivially different queries share a cache key."""
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+
+def make_query_cache(namespace: str, maxsize: int, ttl: float):
+    """
+    Build a cache for query-keyed results.
+    QUERY_CACHE_BACKEND=sqlite persists it to QUERY_CACHE_PATH, otherwise it is in-memory.
+    """
+    if os.getenv("QUERY_CACHE_BACKEND", "memory") == "sqlite":
+        path = os.getenv("QUERY_CACHE_PATH", "cache/query_cache.sqlite3")
+        return SQLiteCache(path, namespace, maxsize=maxsize, ttl=ttl)
+    return LRUCache(maxsize=maxsize, ttl=ttl)
+
+
+def memoize_query(cache):
+    """
+    Memoize a function whose first argument is the user query, keyed on the normalized query.
+    Works for both sync and async functions.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(query, *args, **kwargs):
+                key = normalize_query(query)
+                cached = cache.get(key, _MISSING)
+                if cached is not _MISSING:
+                    return cached
+                result = await func(query, *args, **kwargs)
+                cache.set(key, result)
+                return result
+            async_wrapper.cache = cache
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(query, *args, **kwargs):
+            key = normalize_query(query)
+            cached = cache.get(key, _MISSING)
+            if cached is not _MISSING:
+                return cached
+            result = func(query, *args, **kwargs)
+            cache.set(key, result)
+            return result
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,178 @@
+import os
+import asyncio
+import hashlib
+from typing import List, Optional, Tuple
+
+from utils.cache import LRUCache
+from utils.llm import ainvoke_with_timeout, chunk_text, count_tokens, get_chat_llm
+from utils.metrics import registry as metrics_registry, span
+
+
+# The last HISTORY_RECENT_TURNS turns are sent verbatim; older ones are folded into a rolling summary
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "6"))
+# Upper bound for the history sent with a request (summary + verbatim turns)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Turns are folded in blocks, so the summary is refreshed once every few turns instead of on every request
+HISTORY_FOLD_EVERY = int(os.getenv("HISTORY_FOLD_EVERY", "4"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+HISTORY_SUMMARY_INPUT_TOKENS = int(os.getenv("HISTORY_SUMMARY_INPUT_TOKENS", "6000"))
+HISTORY_SUMMARY_TIMEOUT_SECONDS = float(os.getenv("HISTORY_SUMMARY_TIMEOUT_SECONDS", "10"))
+
+# Rolling summaries keyed by a hash chain over the folded turns
+summary_cache = LRUCache(maxsize=int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "2048")), ttl=24 * 3600)
+metrics_registry.register_cache("history_summary", summary_cache)
+
+TOKEN_MODEL = "gpt-4o-mini"
+
+SUMMARY_PROMPT = """
+Summarize the earlier part of a conversation between a user and a Pakistan History chatbot.
+Keep names, dates, places, the topics asked about and any facts the user stated about themselves.
+Write at most {max_words} words of plain prose.
+
+Summary so far:
+{summary}
+
+New turns to fold in:
+{turns}
+"""
+
+
+def turn_text(turn: dict) -> str:
+    return f"User: {turn.get('user', '')}\nAssistant: {turn.get('AI', '')}"
+
+
+def turn_tokens(turn: dict) -> int:
+    return count_tokens(turn_text(turn), TOKEN_MODEL)
+
+
+def chain_keys(turns: List[dict]) -> List[str]:
+    """keys[i] identifies turns[:i + 1]; equal prefixes give equal keys across requests."""
+    keys, digest = [], ""
+    for turn in turns:
+        digest = hashlib.sha256((digest + "\0" + turn_text(turn)).encode("utf-8")).hexdigest()
+        keys.append(digest)
+    return keys
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the end of `text` within roughly `max_tokens` tokens."""
+    tokens = count_tokens(text, TOKEN_MODEL)
+    if tokens <= max_tokens:
+        return text
+    keep = max(1, len(text) * max_tokens // tokens)
+    return "…" + text[-keep:]
+
+
+def split_history(chat_history: list, budget: int = None) -> Tuple[List[dict], List[dict]]:
+    """
+    Split turns into (folded, recent): recent holds at most HISTORY_RECENT_TURNS turns (fold
+    boundaries aligned to HISTORY_FOLD_EVERY) and, with the summary reserve, fits in `budget`.
+    """
+    budget = budget or HISTORY_TOKEN_BUDGET
+    turns = [t for t in chat_history or [] if isinstance(t, dict)]
+    split = max(0, len(turns) - HISTORY_RECENT_TURNS)
+    if HISTORY_FOLD_EVERY > 1:
+        split -= split % HISTORY_FOLD_EVERY
+
+    sizes = [turn_tokens(t) for t in turns]
+    recent_tokens = sum(sizes[split:])
+    over_budget = False
+    while split < len(turns) - 1:
+        reserve = HISTORY_SUMMARY_TOKENS if split else 0
+        if recent_tokens + reserve <= budget:
+            break
+        recent_tokens -= sizes[split]
+        split += 1
+        over_budget = True
+    if over_budget and HISTORY_FOLD_EVERY > 1 and split % HISTORY_FOLD_EVERY:
+        # Keep the boundary on a block edge so the cached summary is reused by the next requests
+        split = min(len(turns) - 1, split + HISTORY_FOLD_EVERY - split % HISTORY_FOLD_EVERY)
+    return turns[:split], turns[split:]
+
+
+async def summarize_turns(turns: List[dict], timeout: float = None) -> Tuple[Optional[str], bool]:
+    """
+    Rolling summary of `turns`. Reuses the summary of the longest already-summarized prefix and only
+    folds in the turns after it. Returns (summary, cached); summary is None if the LLM call fails.
+    """
+    if not turns:
+        return None, False
+    keys = chain_keys(turns)
+    cached = summary_cache.get(keys[-1])
+    if cached is not None:
+        return cached, True
+
+    previous, start = "", 0
+    for i in range(len(keys) - 2, -1, -1):
+        hit = summary_cache.get(keys[i])
+        if hit is not None:
+            previous, start = hit, i + 1
+            break
+
+    new_turns = "\n\n".join(turn_text(t) for t in turns[start:])
+    prompt = SUMMARY_PROMPT.format(
+        max_words=int(HISTORY_SUMMARY_TOKENS * 0.75),
+        summary=previous or "(none)",
+        turns=truncate_to_tokens(new_turns, HISTORY_SUMMARY_INPUT_TOKENS),
+    )
+    try:
+        with span("history_summary"):
+            response = await ainvoke_with_timeout(
+                get_chat_llm(model="gpt-4o-mini", temperature=0), prompt, timeout or HISTORY_SUMMARY_TIMEOUT_SECONDS
+            )
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"History summary failed, dropping older turns: {e}")
+        return None, False
+
+    summary = truncate_to_tokens(chunk_text(response).strip(), HISTORY_SUMMARY_TOKENS)
+    summary_cache.set(keys[-1], summary)
+    return summary, False
+
+
+async def prepare_history(chat_history: list, budget: int = None) -> Tuple[Optional[str], List[dict], dict]:
+    """
+    Token-budgeted history for a request: (summary of older turns, recent turns verbatim, stats).
+    stats reports the tokens the full history would have cost and the tokens saved.
+    """
+    budget = budget or HISTORY_TOKEN_BUDGET
+    folded, recent = split_history(chat_history, budget)
+    summary, cached = await summarize_turns(folded)
+
+    if len(recent) == 1 and turn_tokens(recent[0]) > budget:
+        # A single oversized turn: keep the end of each side
+        half = max(1, budget // 2)
+        recent = [{
+            "user": truncate_to_tokens(recent[0].get("user", ""), half),
+            "AI": truncate_to_tokens(recent[0].get("AI", ""), half),
+        }]
+
+    full_tokens = sum(turn_tokens(t) for t in chat_history or [] if isinstance(t, dict))
+    sent_tokens = sum(turn_tokens(t) for t in recent) + (count_tokens(summary, TOKEN_MODEL) if summary else 0)
+    stats = {
+        "turns": len(folded) + len(recent),
+        "summarized_turns": len(folded),
+        "summary_cached": cached,
+        "history_tokens": full_tokens,
+        "sent_tokens": sent_tokens,
+        "tokens_saved": max(0, full_tokens - sent_tokens),
+    }
+    return summary, recent, stats
+
+
+def fit_messages(messages: list, budget: int = None) -> list:
+    """
+    Drop the oldest non-system messages until the conversation fits in `budget` tokens.
+    A no-LLM safety net for callers that pass raw message lists.
+    """
+    budget = budget or HISTORY_TOKEN_BUDGET
+    system = [m for m in messages if m.get("role") == "system"]
+    others = [m for m in messages if m.get("role") != "system"]
+    sizes = [count_tokens(m.get("content") or "", TOKEN_MODEL) for m in others]
+    total = sum(sizes)
+    start = 0
+    while start < len(others) - 1 and total > budget:
+        total -= sizes[start]
+        start += 1
+    return system + others[start:]
@@ -0,0 +1,192 @@
+import os
+import re
+import time
+import fcntl
+import shutil
+
+from chromadb.api.shared_system_client import SharedSystemClient
+
+
+# Published index versions live next to the index path: vectorstores -> vectorstores.v<timestamp>
+_VERSION_SUFFIX = re.compile(r"\.v\d{8}T\d{6}-[0-9a-f]+$")
+
+
+class IndexLock:
+    """
+    Exclusive, non-blocking lock on one index path (flock on <index>.lock),
+    held for the whole rebuild. Works across processes and within one process.
+    """
+
+    def __init__(self, base_dir: str):
+        self.path = os.path.abspath(base_dir).rstrip(os.sep) + ".lock"
+        self._fd = None
+
+    def acquire(self) -> bool:
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise RuntimeError(f"Another rebuild of this index is running ({self.path})")
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# Linux ioctl for a copy-on-write clone of a whole file (btrfs, XFS, overlayfs on those, ...)
+FICLONE = 0x40049409
+
+# Chroma updates its store files in place, so they must not share an inode with the live index.
+# Everything else in an index version is written to a temp file and renamed over.
+_IN_PLACE_STORE_MARKER = "chroma.sqlite3"
+
+
+def clone_file(src: str, dst: str) -> str:
+    """Copy-on-write clone of `src` where the filesystem supports it, otherwise a plain copy."""
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            pass
+        else:
+            shutil.copystat(src, dst)
+            return dst
+    return shutil.copy2(src, dst)
+
+
+def _version_copier(live_dir: str):
+    """
+    copytree copy_function for seeding a staging dir: files of Chroma stores are cloned, all other
+    files (only ever replaced by rename) are hard-linked, falling back to a clone across devices.
+    """
+    def copy(src: str, dst: str) -> str:
+        top = os.path.relpath(src, live_dir).split(os.sep)[0]
+        if not os.path.exists(os.path.join(live_dir, top, _IN_PLACE_STORE_MARKER)):
+            try:
+                os.link(src, dst)
+                return dst
+            except OSError:
+                pass
+        return clone_file(src, dst)
+
+    return copy
+
+
+def create_staging_dir(base_dir: str, copy_current: bool = True) -> str:
+    """
+    New version directory next to `base_dir`, seeded with a copy of the live index
+    so an incremental build only has to apply the changes. The copy links or clones
+    files instead of duplicating their bytes where it safely can.
+    """
+    base_dir = base_dir.rstrip(os.sep)
+    staging = f"{base_dir}.v{time.strftime('%Y%m%dT%H%M%S')}-{os.urandom(3).hex()}"
+    if copy_current and os.path.isdir(base_dir):
+        live_dir = os.path.realpath(base_dir)
+        shutil.copytree(live_dir, staging, symlinks=True, copy_function=_version_copier(live_dir))
+    else:
+        os.makedirs(staging)
+    return staging
+
+
+def publish_index_dir(staging: str, base_dir: str, keep: int = 2):
+    """
+    Make `staging` the live index by atomically repointing the `base_dir` symlink.
+    Readers that resolved the previous target keep using it until they reload.
+    A plain directory at `base_dir` (from before versioned builds) is moved aside once.
+    """
+    base_dir = base_dir.rstrip(os.sep)
+    if os.path.isdir(base_dir) and not os.path.islink(base_dir):
+        os.rename(base_dir, f"{base_dir}.v{time.strftime('%Y%m%dT%H%M%S')}-000000")
+
+    link_tmp = f"{base_dir}.link-{os.urandom(3).hex()}"
+    os.symlink(os.path.basename(staging), link_tmp)
+    os.replace(link_tmp, base_dir)
+    prune_index_dirs(base_dir, keep=keep)
+
+
+def prune_index_dirs(base_dir: str, keep: int = 2):
+    """
+    Delete all but the newest `keep` published versions. Never deletes the live version
+    or one a reader still holds a ReaderLease on (e.g. a server within its grace period).
+    """
+    base_dir = base_dir.rstrip(os.sep)
+    parent = os.path.dirname(os.path.abspath(base_dir))
+    name = os.path.basename(base_dir)
+    live = os.path.realpath(base_dir)
+    versions = sorted(
+        entry for entry in os.listdir(parent)
+        if entry.startswith(name + ".v") and _VERSION_SUFFIX.search(entry)
+    )
+    for entry in versions[:-keep] if keep else versions:
+        path = os.path.join(parent, entry)
+        if os.path.realpath(path) == live:
+            continue
+        lease = ReaderLease(path)
+        if not lease.acquire(exclusive=True):
+            print(f"Keeping index version {entry}: still in use")
+            continue
+        try:
+            shutil.rmtree(path, ignore_errors=True)
+            os.unlink(lease.path)
+        finally:
+            lease.release()
+
+
+class ReaderLease:
+    """
+    Shared flock on <version dir>.readers, held by each process serving from that version
+    until it has retired it. prune_index_dirs takes it exclusively before deleting.
+    """
+
+    def __init__(self, version_dir: str):
+        self.path = os.path.abspath(version_dir).rstrip(os.sep) + ".readers"
+        self._fd = None
+
+    def acquire(self, exclusive: bool = False) -> bool:
+        """Readers wait for a running prune to finish; the pruner never waits for readers."""
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB if exclusive else fcntl.LOCK_SH)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def discard_staging_dir(staging: str):
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def release_chroma_clients(base_dir: str):
+    """
+    Stop Chroma's cached clients for every store under `base_dir`.
+    Chroma keeps one client system per persist path for the process lifetime,
+    so a retired index version would otherwise stay in memory.
+    """
+    prefix = os.path.abspath(base_dir).rstrip(os.sep) + os.sep
+    for identifier in list(SharedSystemClient._identifier_to_system):
+        if os.path.abspath(identifier).startswith(prefix):
+            system = SharedSystemClient._identifier_to_system.pop(identifier, None)
+            SharedSystemClient._identifier_to_refcount.pop(identifier, None)
+            if system is not None:
+                system.stop()
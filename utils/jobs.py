@@ -0,0 +1,130 @@
+import uuid
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Optional
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested."""
+
+
+class Job:
+    """
+    State of one background job. The worker reports progress through update(),
+    which is also the cancellation point.
+    """
+
+    def __init__(self, kind: str, params: dict = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"  # queued -> running -> succeeded | failed | cancelled
+        self.phase = None
+        self.progress = {}
+        self.errors = {}
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self._started = None
+        self._finished = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, phase: str = None, **progress):
+        """Record progress; raises JobCancelled if cancel() was called."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        with self._lock:
+            if phase:
+                self.phase = phase
+            self.progress.update(progress)
+
+    def add_errors(self, errors: dict):
+        with self._lock:
+            self.errors.update(errors)
+
+    def cancel(self) -> bool:
+        if self.status in ("succeeded", "failed", "cancelled"):
+            return False
+        self._cancel.set()
+        return True
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            elapsed = None
+            if self._started is not None:
+                elapsed = round((time.monotonic() if self.finished_at is None else self._finished) - self._started, 3)
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "params": self.params,
+                "status": self.status,
+                "phase": self.phase,
+                "progress": dict(self.progress),
+                "errors": dict(self.errors),
+                "error": self.error,
+                "result": self.result,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed_seconds": elapsed,
+            }
+
+
+class JobRegistry:
+    """Runs jobs on daemon threads and keeps the last `max_history` of them for status queries."""
+
+    def __init__(self, max_history: int = 100):
+        self.max_history = max_history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, target: Callable[[Job], dict], params: dict = None,
+               on_finish: Optional[Callable[[Job], None]] = None) -> Job:
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_history:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest].finished_at is None:
+                    break
+                self._jobs.popitem(last=False)
+
+        threading.Thread(target=self._run, args=(job, target, on_finish), name=f"job-{job.id}", daemon=True).start()
+        return job
+
+    def _run(self, job: Job, target, on_finish):
+        job.status = "running"
+        job.started_at = datetime.now().isoformat()
+        job._started = time.monotonic()
+        try:
+            job.result = target(job)
+            job.status = "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+            print(f"Job {job.id} failed: {job.error}")
+        finally:
+            job._finished = time.monotonic()
+            job.finished_at = datetime.now().isoformat()
+            job.phase = job.status
+            if on_finish:
+                on_finish(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
@@ -0,0 +1,172 @@
+import os
+import json
+import asyncio
+import threading
+
+import httpx
+import tiktoken
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from utils.metrics import llm_metrics_callback
+
+load_dotenv()
+
+
+# Upper bound for a single LLM call; on expiry the call is cancelled and asyncio.TimeoutError is raised
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+# Point every client at a local OpenAI-compatible stand-in server, e.g. http://127.0.0.1:8001/v1
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or os.getenv("OPENAI_BASE_URL")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# Connection pool shared by all OpenAI clients in the process
+HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("OPENAI_HTTP_TIMEOUT_SECONDS", "60"))
+
+
+# -------------------------
+# Shared, pooled clients
+# -------------------------
+_clients = {}
+_clients_lock = threading.Lock()
+_http_clients = {}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def shared_http_clients():
+    """One sync and one async httpx client (keep-alive pool) for the whole process."""
+    with _clients_lock:
+        if not _http_clients:
+            _http_clients["sync"] = httpx.Client(limits=_limits(), timeout=HTTP_TIMEOUT_SECONDS)
+            _http_clients["async"] = httpx.AsyncClient(limits=_limits(), timeout=HTTP_TIMEOUT_SECONDS)
+        return _http_clients["sync"], _http_clients["async"]
+
+
+def _connection_kwargs() -> dict:
+    http_client, http_async_client = shared_http_clients()
+    kwargs = {"http_client": http_client, "http_async_client": http_async_client}
+    if LLM_BASE_URL:
+        kwargs["base_url"] = LLM_BASE_URL
+    return kwargs
+
+
+def get_chat_llm(model: str = None, temperature: float = None, tools: list = None) -> ChatOpenAI:
+    """
+    Cached ChatOpenAI per (model, temperature, tools) over the shared HTTP pool.
+    None leaves the library default in place.
+    """
+    key = ("chat", model, temperature, json.dumps(tools, sort_keys=True) if tools else None)
+    with _clients_lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+
+    kwargs = _connection_kwargs()
+    # Latency, token usage and errors of every call go to /metrics
+    kwargs["callbacks"] = [llm_metrics_callback]
+    if model is not None:
+        kwargs["model_name"] = model
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    if tools:
+        kwargs["model_kwargs"] = {"tools": tools}
+    client = ChatOpenAI(**kwargs)
+
+    with _clients_lock:
+        return _clients.setdefault(key, client)
+
+
+def get_embeddings(model: str = None) -> OpenAIEmbeddings:
+    """Cached OpenAIEmbeddings per model over the shared HTTP pool."""
+    model = model or EMBEDDING_MODEL
+    key = ("embeddings", model)
+    with _clients_lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+
+    kwargs = _connection_kwargs()
+    base_url = kwargs.pop("base_url", None)
+    if base_url:
+        kwargs["openai_api_base"] = base_url
+        # Local stand-ins have no tiktoken-compatible context checks (and tiktoken would need network)
+        kwargs["check_embedding_ctx_length"] = False
+    client = OpenAIEmbeddings(model=model, **kwargs)
+
+    with _clients_lock:
+        return _clients.setdefault(key, client)
+
+
+async def ainvoke_with_timeout(runnable, payload, timeout: float = None):
+    """Run runnable.ainvoke(payload) on the event loop, cancelling it after `timeout` seconds."""
+    return await asyncio.wait_for(runnable.ainvoke(payload), timeout or LLM_TIMEOUT_SECONDS)
+
+
+async def astream_with_timeout(runnable, payload, timeout: float = None):
+    """
+    Stream runnable.astream(payload). `timeout` bounds the wait for each chunk,
+    so a stalled stream is cancelled while a long but progressing answer is not.
+    """
+    stream = runnable.astream(payload).__aiter__()
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), timeout or LLM_TIMEOUT_SECONDS)
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        await stream.aclose()
+
+
+def chunk_text(chunk) -> str:
+    """Text of a streamed message chunk; Responses API chunks carry a list of content blocks."""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block.get("text", "") for block in content
+            if isinstance(block, dict) and block.get("type") == "text"
+        )
+    return ""
+
+
+# -------------------------
+# Token counting
+# -------------------------
+_encodings = {}
+
+
+def _encoding(model: str):
+    with _clients_lock:
+        if model in _encodings:
+            return _encodings[model]
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its tables on first use; offline hosts fall back to an estimate
+        print(f"tiktoken unavailable for {model}, estimating tokens: {e}")
+        encoding = None
+    with _clients_lock:
+        return _encodings.setdefault(model, encoding)
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """Token count of `text` for `model` (~4 characters per token when tiktoken is unavailable)."""
+    encoding = _encoding(model or "gpt-4o-mini")
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from utils.route_examples import ROUTE_EXAMPLES
+
+
+# -------------------------
+# Keyword / regex rules
+# -------------------------
+# Any of these escalates to the LLM router: the local tier never decides on sensitive-looking queries
+SENSITIVE_PATTERNS = re.compile(
+    r"\b(army|troops?|military|soldiers?|special forces|ssg|isi|intelligence|spy|spies|surveillance|"
+    r"weapons?|arms|nuclear|missiles?|bombs?|explosives?|terror\w*|classified|secret|confidential|"
+    r"operations?|deployed|deployment|attack|smuggl\w*|hack\w*|tap phones?|kill|assassinat\w*|"
+    r"poison\w*|chemical|biological|uranium|plutonium|enrich\w*|centrifuges?|coordinates|facilit(y|ies))\b",
+    re.IGNORECASE,
+)
+
+NEWS_PATTERNS = re.compile(
+    r"\b(news|latest|breaking|today|tonight|yesterday|this (week|month|year)|right now|currently|current|"
+    r"live|update[sd]?|recent(ly)?|ongoing|announce[sd]?|statement|press release|trending|20[2-9]\d)\b",
+    re.IGNORECASE,
+)
+
+# Topic cues. Years and generic words are not cues on their own ("... built in 1976" is not history)
+HISTORY_PATTERNS = re.compile(
+    r"\b(history|historical|founded|founder|independence|partition|pakistan movement|"
+    r"resolution|constitution|quaid|jinnah|liaquat|iqbal|sir syed|aligarh|mughal|indus valley|"
+    r"governor general|martial law|ayub|bhutto|zia|one unit|simla|tashkent)\b",
+    re.IGNORECASE,
+)
+
+# The rules tier only decides on these question shapes...
+HISTORY_PHRASING = re.compile(
+    r"^\s*((who|what|when|why|which)\s+(was|were|is|are|did|caused|led to|happened|founded|drafted|wrote|signed)|how\s+(did|was|were)|"
+    r"tell me about|explain|describe|summari[sz]e|(the\s+)?(history|significance|importance) of)\b",
+    re.IGNORECASE,
+)
+
+# ...and only when every remaining word is a stopword, a number, a known name, a topic cue or one
+# of these. Any other word (an unrecognized intent: "make", "coordinates", "live") escalates.
+HISTORY_WORDS = frozenset("""
+    a an the of in on at to for by with and or from as about into during after before between under
+    me his her its their this that these those it he she they who whom whose what when why which how
+    was were is are be been being did do does had has have first second last early main
+    role significance importance impact meaning origin origins cause causes caused reason reasons result
+    results led lead happened happen began begin ended end start started known called named
+    founded founding formed formation created creation established establishment adopted passed signed
+    drafted written declared became become built chosen elected appointed born died death life
+    contribution contributions achievements biography vision idea ideas ideology theory two nation
+    state country province provinces capital republic leader leaders president prime minister governor
+    general emperor king empire dynasty rule ruled reign era period age ancient civilisation civilization
+    issue culture heritage site sites language languages people agreement declaration treaty accord scheme
+    pact act movement resolution constitution independence partition history historical sir syed indus
+    valley martial law one unit
+""".split())
+
+# Gazetteer of names the rules tier recognizes. Capitalization alone is not enough: a capitalized
+# tail ("... And How To Synthesize Ricin") must still escalate.
+HISTORY_NAMES = frozenset("""
+    pakistan pakistani india indian british raj subcontinent bengal bangladesh punjab sindh balochistan
+    baluchistan khyber pakhtunkhwa kashmir lahore karachi islamabad rawalpindi dhaka peshawar quetta delhi
+    east west muslim muslims hindu islamic republic league congress quaid azam quaid-e-azam allama mohammad
+    muhammad ali jinnah fatima liaquat khan iqbal syed ahmad aligarh ayub yahya zulfikar bhutto benazir zia
+    ul haq mujib rahman gandhi nehru mountbatten radcliffe mughal mughals akbar babur aurangzeb shah jahan
+    mohenjo-daro mohenjo daro harappa taxila gandhara indus minto park objectives constituent assembly
+    national simla tashkent cabinet mission august march
+""".split())
+
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z'\-]*|\d+")
+
+HISTORY_DECISION = {"sensitive": False, "news": False, "domain": "history"}
+
+
+def has_escalation_cues(user_query: str) -> bool:
+    """Sensitive or news cues always go to the LLM router."""
+    return bool(SENSITIVE_PATTERNS.search(user_query) or NEWS_PATTERNS.search(user_query))
+
+
+def _is_history_word(word: str) -> bool:
+    word = word.lower()
+    if word.endswith("'s"):
+        word = word[:-2]
+    return (
+        word.isdigit() or word in HISTORY_WORDS or word in HISTORY_NAMES
+        or HISTORY_PATTERNS.fullmatch(word) is not None
+    )
+
+
+def rule_route(user_query: str) -> Optional[Dict]:
+    """
+    Return a history decision for an allowlisted history question made only of recognized words,
+    otherwise None (undecided: the centroid tier and then the sensitive check see it).
+    """
+    if has_escalation_cues(user_query) or not HISTORY_PATTERNS.search(user_query):
+        return None
+    phrasing = HISTORY_PHRASING.match(user_query)
+    if phrasing is None:
+        return None
+    if all(_is_history_word(word) for word in WORD_PATTERN.findall(user_query[phrasing.end():])):
+        return {**HISTORY_DECISION, "router": "rules"}
+    return None
+
+
+# -------------------------
+# Nearest-centroid classifier over example embeddings
+# -------------------------
+class CentroidClassifier:
+    """
+    One normalized centroid per label, built from embeddings of labeled example queries.
+    Centroids are cached on disk keyed by the example set, so they are embedded once.
+    """
+
+    def __init__(self, examples: Dict[str, List[str]] = None, cache_path: Optional[str] = None):
+        self.examples = examples or ROUTE_EXAMPLES
+        self.cache_path = cache_path
+        self.labels: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _fingerprint(self) -> str:
+        return hashlib.sha256(json.dumps(self.examples, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def fit(self, embed_documents: Callable[[List[str]], List[List[float]]]):
+        with self._lock:
+            if self.centroids is not None:
+                return
+            fingerprint = self._fingerprint()
+            if self.cache_path and os.path.exists(self.cache_path):
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                if cached.get("fingerprint") == fingerprint:
+                    self.labels = cached["labels"]
+                    self.centroids = np.asarray(cached["centroids"], dtype=np.float32)
+                    return
+
+            labels, centroids = [], []
+            for label, queries in self.examples.items():
+                vectors = np.asarray(embed_documents(queries), dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                centroid = vectors.mean(axis=0)
+                labels.append(label)
+                centroids.append(centroid / np.linalg.norm(centroid))
+            self.labels = labels
+            self.centroids = np.stack(centroids)
+
+            if self.cache_path:
+                os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+                with open(self.cache_path, "w", encoding="utf-8") as f:
+                    json.dump({"fingerprint": fingerprint, "labels": labels, "centroids": self.centroids.tolist()}, f)
+
+    def similarities(self, embedding) -> Dict[str, float]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        return dict(zip(self.labels, (self.centroids @ vector).tolist()))
+
+
+class LocalRouter:
+    """
+    Zero-network routing tier in front of the LLM router.
+    Answers only confidently-historical queries; everything else returns None and is escalated.
+    """
+
+    def __init__(self, classifier: CentroidClassifier, min_similarity=0.75, min_margin=0.03, sensitive_margin=0.05):
+        self.classifier = classifier
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.sensitive_margin = sensitive_margin
+
+    def route(self, user_query: str, embed_query: Optional[Callable] = None, embed_documents: Optional[Callable] = None) -> Optional[Dict]:
+        decision = rule_route(user_query)
+        if decision is not None:
+            return decision
+        if has_escalation_cues(user_query) or embed_query is None or embed_documents is None:
+            return None
+
+        try:
+            self.classifier.fit(embed_documents)
+            sims = self.classifier.similarities(embed_query(user_query))
+        except Exception as e:
+            print(f"Local router unavailable: {e}")
+            return None
+
+        history = sims.get("history", 0.0)
+        others = [v for label, v in sims.items() if label != "history"]
+        if (
+            history >= self.min_similarity
+            and history - max(others, default=0.0) >= self.min_margin
+            and history - sims.get("sensitive", 0.0) >= self.sensitive_margin
+        ):
+            return {**HISTORY_DECISION, "router": "centroid", "similarity": round(history, 4)}
+        return None
@@ -0,0 +1,257 @@
+import os
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# Adds a Server-Timing header (per-stage durations) to every response
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+# Latency buckets (seconds) from a cache hit up to a slow LLM call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values) if v != ""]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = 'le="%g"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+                labels = _format_labels(self.labelnames, key)
+                inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf_labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{labels} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._caches: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_cache(self, name: str, cache):
+        """Export a cache's own hits/misses counters (read at scrape time)."""
+        self._caches[name] = cache
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for kind in ("hits", "misses"):
+            lines.append(f"# HELP cache_{kind}_total Cache {kind} since process start")
+            lines.append(f"# TYPE cache_{kind}_total counter")
+            for name, cache in sorted(self._caches.items()):
+                lines.append(f'cache_{kind}_total{{cache="{name}"}} {getattr(cache, kind, 0)}')
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "chat_stage_seconds", "Duration of one stage of the chat pipeline", ("stage", "store")
+)
+stage_errors = registry.counter("chat_stage_errors_total", "Stages that raised, by exception type", ("stage", "error"))
+route_total = registry.counter("chat_route_total", "Answered chat turns by route", ("route",))
+request_seconds = registry.histogram(
+    "http_request_seconds", "HTTP request duration until the response body is complete",
+    ("handler", "method", "status")
+)
+llm_seconds = registry.histogram("llm_call_seconds", "Duration of one LLM call", ("model",))
+llm_tokens = registry.counter("llm_tokens_total", "LLM tokens used", ("model", "kind"))
+llm_errors = registry.counter("llm_errors_total", "LLM calls that failed", ("model",))
+
+
+# -------------------------
+# Timing spans
+# -------------------------
+# Spans of the current request, for the Server-Timing header (None outside a request)
+_request_spans: ContextVar[Optional[list]] = ContextVar("request_spans", default=None)
+
+
+@contextmanager
+def span(stage: str, store: str = ""):
+    """
+    Time a pipeline stage into chat_stage_seconds (and the request's Server-Timing spans).
+    Exceptions are counted in chat_stage_errors_total; cancelled work is not recorded.
+    """
+    started = time.perf_counter()
+    cancelled = False
+    try:
+        yield
+    except asyncio.CancelledError:
+        cancelled = True
+        raise
+    except Exception as e:
+        stage_errors.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        if not cancelled:
+            elapsed = time.perf_counter() - started
+            stage_seconds.observe(elapsed, stage=stage, store=store)
+            spans = _request_spans.get()
+            if spans is not None:
+                spans.append((f"{stage}-{store}" if store else stage, elapsed))
+
+
+def server_timing_header(spans: List[Tuple[str, float]], total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: times each HTTP request into http_request_seconds and, with
+    SERVER_TIMING_ENABLED, sends the stages finished before the response started
+    as a Server-Timing header (for streamed responses that is everything before the first byte).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        spans = []
+        token = _request_spans.set(spans)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    header = server_timing_header(spans, time.perf_counter() - started)
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"server-timing", header.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
+            endpoint = scope.get("endpoint")
+            request_seconds.observe(
+                time.perf_counter() - started,
+                handler=getattr(endpoint, "__name__", "none"),
+                method=scope.get("method", ""),
+                status=status["code"],
+            )
+
+
+# -------------------------
+# LLM calls
+# -------------------------
+class LLMMetricsCallback(BaseCallbackHandler):
+    """LangChain callback recording per-call latency, token usage and errors of chat models."""
+
+    def __init__(self):
+        self._runs: Dict[object, Tuple[str, float]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or "unknown"
+        if len(self._runs) > 10000:
+            self._runs.clear()  # runs that never reported an end (should not happen)
+        self._runs[run_id] = (model, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        model, started = self._runs.pop(run_id, ("unknown", None))
+        if started is not None:
+            llm_seconds.observe(time.perf_counter() - started, model=model)
+
+        usage = None
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        if usage:
+            input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        else:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens, output_tokens = token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+        if input_tokens:
+            llm_tokens.inc(input_tokens, model=model, kind="input")
+        if output_tokens:
+            llm_tokens.inc(output_tokens, model=model, kind="output")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        model, _ = self._runs.pop(run_id, ("unknown", None))
+        if not isinstance(error, asyncio.CancelledError):
+            llm_errors.inc(model=model)
+
+
+llm_metrics_callback = LLMMetricsCallback()
@@ -0,0 +1,348 @@
+import os
+import json
+import shutil
+import threading
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+# Rows scored per block, keeps the float32 temporary bounded for int8/float16 matrices
+SEARCH_BLOCK_ROWS = 65536
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLE_SIZE = 50000
+
+
+# -------------------------
+# Writing the Index
+# -------------------------
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _kmeans(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the (normalized) vectors. Returns centroids."""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > KMEANS_SAMPLE_SIZE:
+        sample = vectors[rng.choice(len(vectors), KMEANS_SAMPLE_SIZE, replace=False)]
+
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[assignments == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+class NumpyIndexWriter:
+    """
+    Writes an index batch by batch, so nothing that grows with the corpus is held in memory:
+    vectors are quantized straight into a memory-mapped .npy file sized for `count` rows, texts and
+    text offsets go to disk as they arrive, and ids/metadatas are spilled until finish().
+    The directory is written next to out_dir and swapped in by finish(), so readers never see a partial index.
+    """
+
+    def __init__(self, out_dir: str, count: int, dtype: str = "float16"):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        self.out_dir = out_dir
+        self.count = count
+        self.dtype = dtype
+        self.dim = None
+        self.rows = 0
+        self.tmp_dir = out_dir.rstrip("/\\") + ".tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+
+        self.vectors = None
+        self.scales = None
+        # Texts are stored back to back in one file and sliced through an offsets table
+        self.offsets = np.lib.format.open_memmap(
+            os.path.join(self.tmp_dir, "offsets.npy"), mode="w+", dtype=np.int64, shape=(count + 1,)
+        )
+        self._texts = open(os.path.join(self.tmp_dir, "texts.bin"), "wb")
+        # Ids and metadatas are spilled as JSON array items and joined into metadata.json by finish()
+        self._ids = open(os.path.join(self.tmp_dir, "ids.part"), "w", encoding="utf-8")
+        self._metadatas = open(os.path.join(self.tmp_dir, "metadatas.part"), "w", encoding="utf-8")
+
+    def _open_vectors(self, dim: int):
+        self.dim = dim
+        self.vectors = np.lib.format.open_memmap(
+            os.path.join(self.tmp_dir, "vectors.npy"), mode="w+",
+            dtype=np.int8 if self.dtype == "int8" else np.float16, shape=(self.count, dim),
+        )
+        if self.dtype == "int8":
+            self.scales = np.lib.format.open_memmap(
+                os.path.join(self.tmp_dir, "scales.npy"), mode="w+", dtype=np.float32, shape=(self.count,)
+            )
+
+    def add(self, ids: List[str], embeddings, texts: List[str], metadatas: List[Dict]):
+        batch = _normalize(np.asarray(embeddings, dtype=np.float32))
+        if self.vectors is None:
+            self._open_vectors(batch.shape[1])
+        start, end = self.rows, self.rows + len(batch)
+        if end > self.count:
+            raise ValueError(f"More than the declared {self.count} rows")
+
+        if self.dtype == "int8":
+            scales = np.abs(batch).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self.vectors[start:end] = np.round(batch / scales[:, None]).astype(np.int8)
+            self.scales[start:end] = scales
+        else:
+            self.vectors[start:end] = batch.astype(np.float16)
+
+        for row, text in enumerate(texts, start=start):
+            encoded = text.encode("utf-8")
+            self._texts.write(encoded)
+            self.offsets[row + 1] = self.offsets[row] + len(encoded)
+        for row, (chunk_id, metadata) in enumerate(zip(ids, metadatas), start=start):
+            separator = ", " if row else ""
+            self._ids.write(separator + json.dumps(chunk_id))
+            self._metadatas.write(separator + json.dumps(metadata or {}))
+        self.rows = end
+
+    def _write_metadata_table(self):
+        """metadata.json as {"ids": [...], "metadatas": [...]}, streamed from the spill files."""
+        parts = {}
+        for name, part in (("ids", self._ids), ("metadatas", self._metadatas)):
+            part.close()
+            parts[name] = part.name
+        with open(os.path.join(self.tmp_dir, "metadata.json"), "w", encoding="utf-8") as f:
+            for prefix, name in (('{"ids": [', "ids"), ('], "metadatas": [', "metadatas")):
+                f.write(prefix)
+                with open(parts[name], "r", encoding="utf-8") as part:
+                    shutil.copyfileobj(part, f)
+                os.remove(parts[name])
+            f.write("]}")
+
+    def _float_rows(self, rows) -> np.ndarray:
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[rows], dtype=np.float32)[:, None]
+        return block
+
+    def _write_ivf(self, nlist: int):
+        rng = np.random.default_rng(0)
+        sample_rows = np.arange(self.count)
+        if self.count > KMEANS_SAMPLE_SIZE:
+            sample_rows = np.sort(rng.choice(self.count, KMEANS_SAMPLE_SIZE, replace=False))
+        centroids = _kmeans(_normalize(self._float_rows(sample_rows)), nlist)
+
+        assignments = np.empty(self.count, dtype=np.int64)
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, self.count)
+            assignments[start:end] = np.argmax(self._float_rows(slice(start, end)) @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=nlist))
+        np.save(os.path.join(self.tmp_dir, "centroids.npy"), centroids)
+        np.save(os.path.join(self.tmp_dir, "ivf_order.npy"), order)
+        np.save(os.path.join(self.tmp_dir, "ivf_offsets.npy"), list_offsets)
+
+    def finish(self, nlist: int = 0) -> Dict:
+        if self.rows != self.count:
+            raise ValueError(f"Wrote {self.rows} of the declared {self.count} rows")
+        self._texts.close()
+        self.offsets.flush()
+        self.offsets = None
+        self._write_metadata_table()
+
+        nlist = min(nlist, self.count)
+        if nlist > 1:
+            self._write_ivf(nlist)
+        else:
+            nlist = 0
+        self.vectors.flush()
+        if self.scales is not None:
+            self.scales.flush()
+        self.vectors = self.scales = None
+
+        with open(os.path.join(self.tmp_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"count": self.count, "dim": self.dim, "dtype": self.dtype, "nlist": nlist}, f)
+
+        old_dir = self.out_dir.rstrip("/\\") + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.out_dir):
+            os.replace(self.out_dir, old_dir)
+        os.replace(self.tmp_dir, self.out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+        return {"path": self.out_dir, "chunks": self.count, "dim": self.dim, "dtype": self.dtype, "ivf_lists": nlist}
+
+
+def write_numpy_index(
+    out_dir: str,
+    ids: List[str],
+    embeddings,
+    texts: List[str],
+    metadatas: List[Dict],
+    dtype: str = "float16",
+    nlist: int = 0,
+):
+    """Write embeddings as a quantized matrix plus a compact text/metadata table, in one go."""
+    writer = NumpyIndexWriter(out_dir, len(ids), dtype=dtype)
+    writer.add(ids, embeddings, texts, metadatas)
+    return writer.finish(nlist=nlist)
+
+
+# -------------------------
+# Metadata Filters (subset of Chroma's `where` syntax)
+# -------------------------
+def matches_filter(metadata: Dict, where: Dict) -> bool:
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, c) for c in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+# -------------------------
+# Memory-mapped Vector Store
+# -------------------------
+class NumpyVectorStore:
+    """
+    Read-only vector store over a memory-mapped quantized matrix.
+    Exposes the subset of the Chroma interface used by rag_handler.
+    """
+
+    # Distances returned below are cosine distances (1 - cosine similarity)
+    distance_space = "cosine"
+
+    def __init__(self, path: str, nprobe: int = 8):
+        self.path = path
+        self.nprobe = nprobe
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            self.info = json.load(f)
+        with open(os.path.join(path, "metadata.json"), "r", encoding="utf-8") as f:
+            table = json.load(f)
+        self.ids = table["ids"]
+        self.metadatas = table["metadatas"]
+
+        # mmap_mode="r" shares the pages between worker processes through the OS page cache
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        texts_path = os.path.join(path, "texts.bin")
+        if os.path.getsize(texts_path):
+            self.texts = np.memmap(texts_path, dtype=np.uint8, mode="r")
+        else:
+            # numpy cannot memory-map an empty file
+            self.texts = np.zeros(0, dtype=np.uint8)
+        self.scales = None
+        if self.info["dtype"] == "int8":
+            self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+
+        self.centroids = None
+        if self.info.get("nlist"):
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.ivf_order = np.load(os.path.join(path, "ivf_order.npy"), mmap_mode="r")
+            self.ivf_offsets = np.load(os.path.join(path, "ivf_offsets.npy"))
+
+        self._filter_masks = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.info["count"]
+
+    def _text(self, row: int) -> str:
+        return bytes(self.texts[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8")
+
+    def _filter_mask(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True)
+        with self._lock:
+            if key not in self._filter_masks:
+                self._filter_masks[key] = np.fromiter(
+                    (matches_filter(m, where) for m in self.metadatas), dtype=bool, count=len(self.metadatas)
+                )
+            return self._filter_masks[key]
+
+    def _score_rows(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine scores of (q, d) queries against the given rows (or all rows), block by block."""
+        total = len(self) if rows is None else len(rows)
+        scores = np.empty((len(queries), total), dtype=np.float32)
+        for start in range(0, total, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, total)
+            index = slice(start, end) if rows is None else rows[start:end]
+            block = np.asarray(self.vectors[index], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self.scales is not None:
+                block_scores *= np.asarray(self.scales[index], dtype=np.float32)
+            scores[:, start:end] = block_scores
+        return scores
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """IVF: restrict the search to the rows of the nprobe closest partitions."""
+        if self.centroids is None:
+            return None
+        nprobe = min(self.nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.sort(np.concatenate([
+            np.asarray(self.ivf_order[self.ivf_offsets[c]:self.ivf_offsets[c + 1]]) for c in lists
+        ]))
+
+    def search(self, queries, k: int = 3, filter: Optional[Dict] = None) -> List[List[Tuple[int, float]]]:
+        """Batched top-k cosine search. Returns [(row, similarity), ...] per query."""
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        mask = self._filter_mask(filter)
+        results = []
+
+        # Exhaustive search scores every query in one pass; IVF probes per query
+        shared_scores = self._score_rows(queries) if self.centroids is None else None
+        for qi, query in enumerate(queries):
+            if shared_scores is not None:
+                rows = np.arange(len(self))
+                scores = shared_scores[qi]
+            else:
+                rows = self._candidate_rows(query)
+                scores = self._score_rows(query[None, :], rows)[0]
+
+            if mask is not None:
+                keep = mask[rows]
+                rows, scores = rows[keep], scores[keep]
+            if len(scores) == 0:
+                results.append([])
+                continue
+
+            top_n = min(k, len(scores))
+            top = np.argpartition(-scores, top_n - 1)[:top_n]
+            top = top[np.argsort(-scores[top])]
+            results.append([(int(rows[i]), float(scores[i])) for i in top])
+        return results
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding, k: int = 3, filter: Optional[Dict] = None, **kwargs
+    ) -> List[Tuple[Document, float]]:
+        """Chroma-compatible: returns (doc, cosine distance) pairs."""
+        hits = self.search(embedding, k=k, filter=filter)[0]
+        return [
+            (Document(page_content=self._text(row), metadata=dict(self.metadatas[row]), id=self.ids[row]), 1.0 - score)
+            for row, score in hits
+        ]
+
+    def similarity_search_by_vector(self, embedding, k: int = 3, filter: Optional[Dict] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter)]
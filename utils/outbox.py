@@ -0,0 +1,276 @@
+import os
+import time
+import uuid
+import random
+import sqlite3
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from typing import List, Optional, Tuple
+
+
+OUTBOX_DB_PATH = os.getenv("OUTBOX_DB_PATH", "cache/outbox.sqlite3")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "10"))
+# An idle SMTP connection is closed after this long and reopened on the next send
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+
+# Messages that arrive within this window of each other are sent as one digest
+OUTBOX_BATCH_WINDOW_SECONDS = float(os.getenv("OUTBOX_BATCH_WINDOW_SECONDS", "2"))
+OUTBOX_DIGEST_MAX = int(os.getenv("OUTBOX_DIGEST_MAX", "50"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "5"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "900"))
+OUTBOX_KEEP_SENT_SECONDS = float(os.getenv("OUTBOX_KEEP_SENT_SECONDS", str(7 * 24 * 3600)))
+# A claimed message whose sender has not finished within this long (it died) is claimed again
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+
+
+class Outbox:
+    """
+    Durable email outbox: enqueue() writes the message to SQLite and returns at once;
+    a background thread delivers pending messages over one reused SMTP connection,
+    retrying with exponential backoff. Bursts are combined into a digest email.
+    Message status: pending -> sending -> sent | dead.
+    Several processes may share one outbox file: each batch is claimed atomically under a
+    unique claim token, and a claim whose lease expired is picked up by the next sender.
+    """
+
+    def __init__(self, path: str = None, sender: str = None, recipient: str = None, password: str = None,
+                 host: str = None, port: int = None, starttls: bool = None):
+        self.path = path or OUTBOX_DB_PATH
+        self.sender = sender
+        self.recipient = recipient
+        self.password = password
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self.starttls = SMTP_STARTTLS if starttls is None else starttls
+        self.sent = 0
+        self.digests = 0
+        self.failures = 0
+        self._smtp = None
+        self._smtp_used = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, subject TEXT, body TEXT, status TEXT, attempts INTEGER, "
+            "created_at REAL, next_attempt_at REAL, sent_at REAL, last_error TEXT, claim TEXT, claimed_at REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        for column, kind in (("claim", "TEXT"), ("claimed_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+        self._conn.commit()
+
+    # -------------------------------------------------------------
+    # Queue
+    # -------------------------------------------------------------
+    def enqueue(self, subject: str, body: str) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (subject, body, status, attempts, created_at, next_attempt_at) "
+                "VALUES (?, ?, 'pending', 0, ?, ?)",
+                (subject, body, now, now),
+            )
+            self._conn.commit()
+        self._wake.set()
+        return cursor.lastrowid
+
+    def _claim_due(self) -> Tuple[str, List[tuple]]:
+        """
+        Claim up to OUTBOX_DIGEST_MAX due messages in one UPDATE ... RETURNING, so two senders
+        never get the same row. Returns (claim token, rows).
+        """
+        claim = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE outbox SET status = 'sending', claim = ?, claimed_at = ? WHERE id IN ("
+                "SELECT id FROM outbox WHERE (status = 'pending' AND next_attempt_at <= ?) "
+                "OR (status = 'sending' AND claimed_at < ?) ORDER BY id LIMIT ?) "
+                "RETURNING id, subject, body, attempts, created_at",
+                (claim, now, now, now - OUTBOX_LEASE_SECONDS, OUTBOX_DIGEST_MAX),
+            ).fetchall()
+            self._conn.commit()
+        return claim, sorted(rows)
+
+    def _mark_sent(self, claim: str, ids: List[int]):
+        """Rows whose claim was taken over (our lease expired) belong to the new claimant and are left alone."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL, claim = NULL "
+                "WHERE id = ? AND claim = ?",
+                [(now, i, claim) for i in ids],
+            )
+            self._conn.execute(
+                "DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?", (now - OUTBOX_KEEP_SENT_SECONDS,)
+            )
+            self._conn.commit()
+
+    def _mark_failed(self, claim: str, rows: List[tuple], error: str):
+        now = time.time()
+        updates = []
+        for row_id, _, _, attempts, _ in rows:
+            attempts += 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                print(f"Outbox message {row_id} dropped after {attempts} attempts: {error}")
+                updates.append(("dead", attempts, now, error, row_id, claim))
+            else:
+                delay = min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+                updates.append(("pending", attempts, now + delay * random.uniform(0.8, 1.2), error, row_id, claim))
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, claim = NULL "
+                "WHERE id = ? AND claim = ?",
+                updates,
+            )
+            self._conn.commit()
+
+    def _next_due_in(self) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(due) FROM ("
+                "SELECT MIN(next_attempt_at) AS due FROM outbox WHERE status = 'pending' "
+                "UNION ALL SELECT MIN(claimed_at) + ? FROM outbox WHERE status = 'sending')",
+                (OUTBOX_LEASE_SECONDS,),
+            ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    # -------------------------------------------------------------
+    # SMTP
+    # -------------------------------------------------------------
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None:
+            if time.monotonic() - self._smtp_used < SMTP_IDLE_SECONDS:
+                try:
+                    if self._smtp.noop()[0] == 250:
+                        return self._smtp
+                except Exception:
+                    pass
+            self._close()
+
+        server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT_SECONDS)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.password:
+                server.login(self.sender, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._smtp = server
+        return server
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+    def _build_message(self, rows: List[tuple]) -> MIMEText:
+        if len(rows) == 1:
+            subject, body = rows[0][1], rows[0][2]
+        else:
+            subject = f"{rows[0][1]} ({len(rows)} notifications)"
+            body = "\n\n----------------------------------------\n\n".join(r[2] for r in rows)
+        msg = MIMEText(body)
+        msg["Subject"] = subject
+        msg["From"] = self.sender
+        msg["To"] = self.recipient
+        return msg
+
+    def _deliver(self, claim: str, rows: List[tuple]):
+        if not self.sender or not self.recipient or not self.password:
+            # Nowhere to send: keep the old behaviour of logging the notification
+            print("⚠ Missing email credentials. Logging instead of sending.")
+            for row in rows:
+                print(row[2])
+            self._mark_sent(claim, [r[0] for r in rows])
+            return
+
+        try:
+            self._connection().send_message(self._build_message(rows))
+            self._smtp_used = time.monotonic()
+        except Exception as e:
+            self._close()
+            self.failures += 1
+            print(f"Outbox delivery of {len(rows)} message(s) failed: {e}")
+            self._mark_failed(claim, rows, f"{type(e).__name__}: {e}")
+            return
+
+        self._mark_sent(claim, [r[0] for r in rows])
+        self.sent += len(rows)
+        if len(rows) > 1:
+            self.digests += 1
+        print(f"✓ Outbox sent {len(rows)} message(s)")
+
+    def flush(self):
+        """Deliver everything that is due now (called by the sender thread)."""
+        while not self._stop.is_set():
+            claim, rows = self._claim_due()
+            if not rows:
+                return
+            self._deliver(claim, rows)
+            if self._smtp is None:
+                return  # delivery failed; the rows wait for their backoff
+
+    # -------------------------------------------------------------
+    # Sender thread
+    # -------------------------------------------------------------
+    def _run(self):
+        while not self._stop.is_set():
+            due_in = self._next_due_in()
+            timeout = OUTBOX_POLL_SECONDS if due_in is None else min(OUTBOX_POLL_SECONDS, due_in)
+            if timeout > 0 and self._wake.wait(timeout):
+                # Give a burst a moment to arrive so it goes out as one digest
+                self._stop.wait(OUTBOX_BATCH_WINDOW_SECONDS)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Outbox sender error: {e}")
+            if self._smtp is not None and time.monotonic() - self._smtp_used >= SMTP_IDLE_SECONDS:
+                self._close()
+        self._close()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {
+            "pending": counts.get("pending", 0) + counts.get("sending", 0),
+            "dead": counts.get("dead", 0),
+            "sent": self.sent,
+            "digests": self.digests,
+            "failures": self.failures,
+            "running": self._thread is not None and self._thread.is_alive(),
+        }
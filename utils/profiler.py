@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from typing import Optional
+
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_INTERVAL_SECONDS = float(os.getenv("PROFILER_INTERVAL_SECONDS", "0.01"))
+PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "64"))
+# Distinct stacks kept; beyond this new stacks are counted under "(other)"
+PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", "20000"))
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler that can be switched on and off at runtime.
+    A daemon thread snapshots every thread's stack each `interval` seconds and counts
+    identical stacks; collapsed() returns them in the flamegraph.pl / speedscope format.
+    """
+
+    def __init__(self):
+        self.interval = PROFILER_INTERVAL_SECONDS
+        self.samples = 0
+        self.started_at = None
+        self._stacks = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: Optional[float] = None):
+        if interval:
+            self.interval = interval
+        if self.running:
+            return
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.started_at = time.time() if self.running else None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILER_MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                sampled.append(";".join(reversed(stack)))
+            with self._lock:
+                self.samples += 1
+                for stack in sampled:
+                    if stack in self._stacks or len(self._stacks) < PROFILER_MAX_STACKS:
+                        self._stacks[stack] += 1
+                    else:
+                        self._stacks["(other)"] += 1
+
+    def collapsed(self) -> str:
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common()) + "\n"
+
+    def report(self, limit: int = 20) -> dict:
+        """Status plus the hottest leaf frames (self time) and the most common full stacks."""
+        with self._lock:
+            leaves = Counter()
+            for stack, count in self._stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            return {
+                "running": self.running,
+                "interval_seconds": self.interval,
+                "samples": self.samples,
+                "started_at": self.started_at,
+                "top_frames": [{"frame": f, "samples": c} for f, c in leaves.most_common(limit)],
+                "top_stacks": [{"stack": s, "samples": c} for s, c in self._stacks.most_common(limit)],
+            }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,134 @@
+import time
+import asyncio
+from typing import Awaitable, Callable, Optional, Tuple
+
+from utils.cache import make_query_cache, normalize_query
+
+
+class TimeBucketedCache:
+    """
+    Cache for expensive query-keyed answers (web search / news), keyed by the normalized query plus
+    a freshness bucket (time // fresh_seconds), so everyone asking within one bucket shares an answer.
+
+    - fresh: an entry from the current bucket is served as is
+    - stale: an entry from an earlier bucket, still within `ttl`, is served at once while a
+      background call refreshes it
+    - miss: concurrent identical misses share one upstream call (single flight)
+
+    Storage is the usual query cache (LRU, in memory or SQLite), so results must be JSON-serializable.
+    """
+
+    def __init__(self, namespace: str, fresh_seconds: float, ttl: float, maxsize: int = 2048):
+        self.namespace = namespace
+        self.fresh_seconds = fresh_seconds
+        self.ttl = max(ttl, fresh_seconds)
+        self._store = make_query_cache(f"response:{namespace}", maxsize=maxsize, ttl=self.ttl)
+        self._inflight = {}  # key -> {"task", "waiters"}
+        self._background = set()
+        self.hits = 0  # fresh and stale
+        self.stale_hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.revalidations = 0
+
+    def _bucket(self, now: float = None) -> int:
+        return int((now or time.time()) // self.fresh_seconds)
+
+    def lookup(self, query: str) -> Tuple[Optional[dict], bool]:
+        """Return (result, fresh) for the newest entry still within the TTL, or (None, False)."""
+        normalized = normalize_query(query)
+        current = self._bucket()
+        oldest = self._bucket(time.time() - self.ttl)
+        for bucket in range(current, oldest - 1, -1):
+            entry = self._store.get(f"{bucket}:{normalized}")
+            if entry is not None:
+                return entry, bucket == current
+        return None, False
+
+    def store(self, query: str, result: dict):
+        self._store.set(f"{self._bucket()}:{normalize_query(query)}", result)
+
+    def serve_cached(self, query: str, fetch: Callable[[], Awaitable[dict]],
+                     cacheable: Callable[[dict], bool] = None) -> Optional[dict]:
+        """
+        The cached result for `query` if there is one (a stale one is refreshed in the background
+        with `fetch()`), else None and the miss is counted; the caller then produces and store()s it.
+        """
+        cached, fresh = self.lookup(query)
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if not fresh:
+            self.stale_hits += 1
+            self._revalidate(query, fetch, cacheable)
+        return {**cached, "cached": True}
+
+    async def get_or_fetch(self, query: str, fetch: Callable[[], Awaitable[dict]],
+                           cacheable: Callable[[dict], bool] = None) -> dict:
+        """
+        Cached result for `query`, calling `fetch()` on a miss (or in the background when stale).
+        Results rejected by `cacheable` (e.g. error messages) are returned but not stored.
+        """
+        cached = self.serve_cached(query, fetch, cacheable)
+        if cached is not None:
+            return cached
+        return dict(await self._join(query, fetch, cacheable))
+
+    def _revalidate(self, query, fetch, cacheable):
+        key = normalize_query(query)
+        if key in self._inflight:
+            return
+        self.revalidations += 1
+        task = self._start(key, query, fetch, cacheable)
+        # Nobody awaits a refresh; keep a reference and swallow its errors
+        self._background.add(task)
+        task.add_done_callback(lambda t: (self._background.discard(t), t.cancelled() or t.exception()))
+
+    def _start(self, key, query, fetch, cacheable) -> asyncio.Task:
+        async def fill():
+            try:
+                result = await fetch()
+                if cacheable is None or cacheable(result):
+                    self.store(query, result)
+                return result
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.create_task(fill())
+        self._inflight[key] = {"task": task, "waiters": 0}
+        return task
+
+    async def _join(self, query, fetch, cacheable) -> dict:
+        key = normalize_query(query)
+        flight = self._inflight.get(key)
+        if flight is None:
+            self._start(key, query, fetch, cacheable)
+            flight = self._inflight[key]
+        else:
+            self.collapsed += 1
+
+        flight["waiters"] += 1
+        try:
+            # Shielded so one caller going away does not cancel the call for the others
+            return await asyncio.shield(flight["task"])
+        except asyncio.CancelledError:
+            if flight["waiters"] == 1 and not flight["task"].done():
+                flight["task"].cancel()  # the last interested caller is gone
+            raise
+        finally:
+            flight["waiters"] -= 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._store),
+            "fresh_seconds": self.fresh_seconds,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "revalidations": self.revalidations,
+            "in_flight": len(self._inflight),
+        }
+
@@ -0,0 +1,158 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from utils.cache import normalize_query
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on query embeddings.
+    A lookup hits when the cosine similarity to a cached query is above `threshold`.
+    Entries stored without an embedding are only found by lookup_exact() on the normalized query.
+    Bounded by entry count and approximate memory, with LRU + TTL eviction.
+    Entries are tied to an index version and dropped when the index is rebuilt.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=1000, max_bytes=32 * 1024 * 1024, ttl=86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (vector or None, query, value, created_at, size)
+        self._by_query = {}  # normalized query -> key
+        self._matrix = None
+        self._keys = []
+        self._bytes = 0
+        self._next_key = 0
+        self._index_version = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # -------------------------
+    # Internal helpers (caller holds the lock)
+    # -------------------------
+    def _check_version(self, index_version):
+        if index_version != self._index_version:
+            if self._entries:
+                self.invalidations += 1
+                print(f"Semantic cache cleared (index version {self._index_version} -> {index_version})")
+            self._entries.clear()
+            self._by_query.clear()
+            self._bytes = 0
+            self._matrix = None
+            self._index_version = index_version
+
+    def _remove(self, key):
+        _, query, _, _, size = self._entries.pop(key)
+        if self._by_query.get(normalize_query(query)) == key:
+            del self._by_query[normalize_query(query)]
+        self._bytes -= size
+        self._matrix = None
+
+    def _purge_expired(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry[3] > self.ttl]
+        for key in expired:
+            self._remove(key)
+            self.expirations += 1
+
+    def _stacked(self):
+        if self._matrix is None:
+            self._keys = [k for k, entry in self._entries.items() if entry[0] is not None]
+            self._matrix = np.stack([self._entries[k][0] for k in self._keys]) if self._keys else None
+        return self._matrix
+
+    # -------------------------
+    # Public API
+    # -------------------------
+    def lookup(self, embedding, index_version=None) -> Optional[dict]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+
+        with self._lock:
+            self._check_version(index_version)
+            self._purge_expired(time.time())
+            matrix = self._stacked()
+            if matrix is None:
+                self.misses += 1
+                return None
+
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key = self._keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][2]
+
+    def lookup_exact(self, query: str, index_version=None) -> Optional[dict]:
+        """Hit only on the same normalized query; needs no embedding."""
+        with self._lock:
+            self._check_version(index_version)
+            self._purge_expired(time.time())
+            key = self._by_query.get(normalize_query(query))
+            if key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][2]
+
+    def store(self, embedding, query: str, value: dict, index_version=None):
+        """Cache `value` for `query`; with embedding=None it is only reachable through lookup_exact()."""
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        size = (vector.nbytes if vector is not None else 0) + len(query) + len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._check_version(index_version)
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (vector, query, value, time.time(), size)
+            previous = self._by_query.get(normalize_query(query))
+            if previous is not None:
+                self._remove(previous)
+            self._by_query[normalize_query(query)] = key
+            self._bytes += size
+            self._matrix = None
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_query.clear()
+            self._bytes = 0
+            self._matrix = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "index_version": self._index_version,
+        }
@@ -0,0 +1,183 @@
+import os
+import uuid
+import time
+from enum import Enum
+from typing import List, Optional
+
+from utils.cache import LRUCache, SQLiteCache
+
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | sqlite
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "cache/sessions.sqlite3")
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+# Past this many turns the oldest half is dropped at once (the history manager summarizes older turns anyway)
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "100"))
+
+
+class ChatState(str, Enum):
+    IDLE = "IDLE"  # no turn yet
+    ACTIVE = "ACTIVE"
+    AWAITING_CONTACT = "AWAITING_CONTACT"  # a sensitive query was asked; waiting for name + email
+
+
+class ChatEvent(str, Enum):
+    ANSWERED = "ANSWERED"  # a RAG, web or news answer
+    SENSITIVE_QUERY = "SENSITIVE_QUERY"  # the user was asked for contact details
+    CONTACT_RECEIVED = "CONTACT_RECEIVED"  # the details arrived and the admin is notified
+
+
+# The per-session state machine: (state, event) -> next state. Anything else is invalid.
+# Other questions are still answered while contact details are pending; only the details end the wait.
+TRANSITIONS = {
+    (ChatState.IDLE, ChatEvent.ANSWERED): ChatState.ACTIVE,
+    (ChatState.IDLE, ChatEvent.SENSITIVE_QUERY): ChatState.AWAITING_CONTACT,
+    (ChatState.ACTIVE, ChatEvent.ANSWERED): ChatState.ACTIVE,
+    (ChatState.ACTIVE, ChatEvent.SENSITIVE_QUERY): ChatState.AWAITING_CONTACT,
+    (ChatState.AWAITING_CONTACT, ChatEvent.ANSWERED): ChatState.AWAITING_CONTACT,
+    (ChatState.AWAITING_CONTACT, ChatEvent.SENSITIVE_QUERY): ChatState.AWAITING_CONTACT,
+    (ChatState.AWAITING_CONTACT, ChatEvent.CONTACT_RECEIVED): ChatState.ACTIVE,
+}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+class SessionConflict(Exception):
+    """The session kept changing under a request (another request saved it first, every retry)."""
+
+
+class Session:
+    """Server-side conversation: turns as {"user", "AI"} dicts plus the explicit chat state."""
+
+    def __init__(self, session_id: str = None, history: List[dict] = None, state: ChatState = ChatState.IDLE,
+                 pending_query: Optional[str] = None, created_at: float = None, version: int = 0,
+                 transient: bool = False):
+        self.id = session_id or uuid.uuid4().hex
+        self.history = history or []
+        self.state = ChatState(state)
+        self.pending_query = pending_query
+        self.created_at = created_at or time.time()
+        self.version = version  # bumped on every save; saves compare-and-set on it
+        self.transient = transient  # rebuilt from the client's chat_history each request; never stored
+
+    def transition(self, event: ChatEvent, pending_query: Optional[str] = None):
+        """Apply `event`; SENSITIVE_QUERY records `pending_query` as the query awaiting contact details."""
+        event = ChatEvent(event)
+        state = TRANSITIONS.get((self.state, event))
+        if state is None:
+            raise InvalidTransition(f"Invalid session transition {self.state.value} --{event.value}-->")
+        self.state = state
+        if event == ChatEvent.SENSITIVE_QUERY:
+            self.pending_query = pending_query
+        elif state != ChatState.AWAITING_CONTACT:
+            self.pending_query = None
+
+    def add_turn(self, user: str, ai: str):
+        self.history.append({"user": user, "AI": ai})
+        if len(self.history) > SESSION_MAX_TURNS:
+            self.history = self.history[-(SESSION_MAX_TURNS // 2):]
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "history": [dict(turn) for turn in self.history],
+            "state": self.state.value,
+            "pending_query": self.pending_query,
+            "created_at": self.created_at,
+            "version": self.version,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        state = data.get("state", ChatState.IDLE)
+        if state == ChatState.IDLE and data.get("history"):
+            state = ChatState.ACTIVE  # saved before the ACTIVE state existed
+        # Copied: the in-memory cache hands out the stored dict itself, and turns added here must not be
+        # visible to other requests before (or unless) this session is saved
+        history = [dict(turn) for turn in data.get("history") or []]
+        return cls(data["id"], history, state, data.get("pending_query"), data.get("created_at"),
+                   data.get("version", 0))
+
+    @classmethod
+    def from_client_history(cls, chat_history: list, sensitive_prompt: str) -> "Session":
+        """
+        Transient session for clients that still send chat_history instead of a session id.
+        The pending-contact state is recovered from the last AI message once, here.
+        The client keeps the conversation, so the session is not persisted.
+        """
+        history = [dict(t) for t in chat_history or [] if isinstance(t, dict)]
+        session = cls(history=history, state=ChatState.ACTIVE if history else ChatState.IDLE, transient=True)
+        last = session.history[-1] if session.history else {}
+        if last.get("AI") == sensitive_prompt:
+            session.transition(ChatEvent.SENSITIVE_QUERY, pending_query=last.get("user"))
+        return session
+
+
+class SessionStore:
+    """
+    Sessions in an LRU/TTL cache: in-memory by default, or SQLite (SESSION_BACKEND=sqlite)
+    so they survive restarts and can be shared by several workers on one host.
+    """
+
+    def __init__(self, backend: str = None, path: str = None, maxsize: int = None, ttl: float = None):
+        backend = backend or SESSION_BACKEND
+        maxsize = maxsize or SESSION_MAX_SESSIONS
+        ttl = ttl or SESSION_TTL_SECONDS
+        if backend == "sqlite":
+            self._cache = SQLiteCache(path or SESSION_DB_PATH, "sessions", maxsize=maxsize, ttl=ttl)
+        else:
+            self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.backend = backend
+
+    def load(self, session_id: Optional[str]) -> Session:
+        """Return the stored session, or a new one (with a fresh id) if it is unknown or expired."""
+        data = self._cache.get(session_id) if session_id else None
+        if data is None:
+            return Session()
+        return Session.from_dict(data)
+
+    def save(self, session: Session) -> bool:
+        """
+        Compare-and-set: store the session only if nobody saved it since it was loaded.
+        Returns False on a conflict; on success the session's version is bumped.
+        """
+        data = session.to_dict()
+        data["version"] = session.version + 1
+        # Stored as a plain dict copy so both backends behave the same
+        if not self._cache.set_if_version(session.id, data, session.version):
+            return False
+        session.version += 1
+        return True
+
+    def record_turn(self, session: Session, user: str, ai: str, event: ChatEvent,
+                    pending_query: Optional[str] = None, attempts: int = 3) -> Session:
+        """
+        Apply one turn (event + history entry) and save it. If a concurrent request on the same
+        session saved first, the turn is re-applied on top of the stored version and saved again;
+        an event that no longer applies there (e.g. the contact was already received) only adds the turn.
+        Transient sessions are updated in place but not saved.
+        """
+        if session.transient:
+            session.transition(event, pending_query)
+            session.add_turn(user, ai)
+            return session
+        for attempt in range(attempts):
+            try:
+                session.transition(event, pending_query)
+            except InvalidTransition:
+                if not attempt:
+                    raise
+            session.add_turn(user, ai)
+            if self.save(session):
+                return session
+            data = self._cache.get(session.id)
+            session = Session.from_dict(data) if data is not None else Session(session.id)
+        raise SessionConflict(session.id)
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, **self._cache.stats()}
+
+
+session_store = SessionStore()
@@ -1,6 +1,89 @@
+import os
 import re
-from langchain_openai import ChatOpenAI
+import asyncio
 from utils.prompt import SYSTEM_PROMPT
+from utils.llm import ainvoke_with_timeout, astream_with_timeout, chunk_text, get_chat_llm
+from utils.metrics import registry as metrics_registry, span
+from utils.response_cache import TimeBucketedCache
+
+# General web answers age slowly: fresh for hours, served stale (and refreshed) for up to a day
+WEB_CACHE_FRESH_SECONDS = float(os.getenv("WEB_CACHE_FRESH_SECONDS", "21600"))
+WEB_CACHE_TTL_SECONDS = float(os.getenv("WEB_CACHE_TTL_SECONDS", "86400"))
+WEB_CACHE_SIZE = int(os.getenv("WEB_CACHE_SIZE", "2048"))
+web_response_cache = TimeBucketedCache("web", WEB_CACHE_FRESH_SECONDS, WEB_CACHE_TTL_SECONDS, WEB_CACHE_SIZE)
+metrics_registry.register_cache("web_response", web_response_cache)
+
+# Answers that mean the search did not work; worth retrying rather than caching
+NO_RESULT_ANSWERS = {"No relevant information found.", "Could not parse search results."}
+
+
+def web_error(answer: str, type_: str = "Web Search Error"):
+    return {
+        "answer": answer,
+        "source": [],
+        "type": type_
+    }
+
+
+def web_search_llm():
+    return get_chat_llm(model="gpt-4o-mini", temperature=0, tools=[{"type": "web_search_preview"}])
+
+
+def web_prompt(user_query: str) -> str:
+    return f"""
+            {SYSTEM_PROMPT}
+            The user asked: "{user_query}".
+            Search for real-time news related to Pakistan only.
+            The answer should be short and concise.
+            and the source link should be separated in brackets and must be mentioned all at the end .
+            Summarize the results clearly.
+            """
+
+
+def parse_web_answer(answer_obj):
+    # --------------------------
+    # Parse response content safely
+    # --------------------------
+    try:
+        # Protect against missing or unexpected structure
+        if not hasattr(answer_obj, "content") or not isinstance(answer_obj.content, list):
+            print("⚠ Unexpected LLM response format.")
+            return web_error("No valid search results returned.", "Web Search")
+
+        answer_text = ""
+        for block in answer_obj.content:
+            if isinstance(block, dict) and block.get("type") == "text":
+                answer_text += block.get("text", "")
+
+        answer_text = answer_text.strip()
+
+        if answer_text == "":
+            print("Empty response from model.")
+            answer_text = "No relevant information found."
+    except Exception as e:
+        print(f"Failed to parse LLM response: {e}")
+        answer_text = "Could not parse search results."
+
+    print("Answer:", answer_text)
+
+    # --------------------------
+    # Extract URLs safely
+    # --------------------------
+    try:
+        urls = re.findall(r'\((https?://[^\s)]+)\)', answer_text)
+    except Exception as e:
+        print(f"URL extraction failed: {e}")
+        urls = []
+
+    return {
+        "answer": answer_text,
+        "source": urls if urls else ["Web / Search"],
+        "type": "Web Search"
+    }
+
+
+def is_cacheable_web_answer(result: dict) -> bool:
+    return result.get("type") == "Web Search" and bool(result.get("source")) and result.get("answer") not in NO_RESULT_ANSWERS
 
 
 def query_web(user_query: str):
@@ -11,38 +94,19 @@ def query_web(user_query: str):
         # LLM Initialization
         # --------------------------
         try:
-            llm = ChatOpenAI(
-                model_name="gpt-4o-mini",
-                temperature=0,
-                model_kwargs={"tools": [{"type": "web_search_preview"}]}
-            )
+            llm = web_search_llm()
         except Exception as e:
             print(f"LLM initialization failed: {e}")
-            return {
-                "answer": "Failed to initialize model.",
-                "source": [],
-                "type": "Web Search Error"
-            }
+            return web_error("Failed to initialize model.")
 
         # --------------------------
         # Build prompt safely
         # --------------------------
         try:
-            prompt = f"""
-            {SYSTEM_PROMPT}
-            The user asked: "{user_query}".
-            Search for real-time news related to Pakistan only.
-            The answer should be short and concise.
-            and the source link should be separated in brackets and must be mentioned all at the end .
-            Summarize the results clearly.
-            """
+            prompt = web_prompt(user_query)
         except Exception as e:
             print(f"Failed to build prompt: {e}")
-            return {
-                "answer": "Could not prepare search prompt.",
-                "source": [],
-                "type": "Web Search Error"
-            }
+            return web_error("Could not prepare search prompt.")
 
         # --------------------------
         # Call the LLM
@@ -51,61 +115,93 @@ def query_web(user_query: str):
             answer_obj = llm.invoke(prompt)
         except Exception as e:
             print(f"Web search failed: {e}")
-            return {
-                "answer": "Web search failed. Try again later.",
-                "source": [],
-                "type": "Web Search Error"
-            }
+            return web_error("Web search failed. Try again later.")
+
+        return parse_web_answer(answer_obj)
+
+    except Exception as e:
+        # Final fallback (never let the backend crash)
+        print(f"Unexpected error in query_web(): {e}")
+        return web_error("An unexpected error occurred during web search.")
+
+
+async def query_web_async(user_query: str, timeout: float = None):
+    """Async variant of query_web, served from web_response_cache when the same question was searched recently."""
+    return await web_response_cache.get_or_fetch(
+        user_query, lambda: fetch_web_async(user_query, timeout), is_cacheable_web_answer
+    )
+
+
+async def fetch_web_async(user_query: str, timeout: float = None):
+    """Uncached web search; the LLM call is cancelled after `timeout` seconds."""
+    try:
+        print("Hello from query_web")
 
-        # --------------------------
-        # Parse response content safely
-        # --------------------------
         try:
-            # Protect against missing or unexpected structure
-            if not hasattr(answer_obj, "content") or not isinstance(answer_obj.content, list):
-                print("⚠ Unexpected LLM response format.")
-                return {
-                    "answer": "No valid search results returned.",
-                    "source": [],
-                    "type": "Web Search"
-                }
-
-            answer_text = ""
-            for block in answer_obj.content:
-                if isinstance(block, dict) and block.get("type") == "text":
-                    answer_text += block.get("text", "")
-
-            answer_text = answer_text.strip()
-
-            if answer_text == "":
-                print("Empty response from model.")
-                answer_text = "No relevant information found."
+            llm = web_search_llm()
+            prompt = web_prompt(user_query)
         except Exception as e:
-            print(f"Failed to parse LLM response: {e}")
-            answer_text = "Could not parse search results."
-
-        print("Answer:", answer_text)
+            print(f"Failed to prepare web search: {e}")
+            return web_error("Failed to initialize model.")
 
-        # --------------------------
-        # Extract URLs safely
-        # --------------------------
         try:
-            urls = re.findall(r'\((https?://[^\s)]+)\)', answer_text)
+            with span("web_search"):
+                answer_obj = await ainvoke_with_timeout(llm, prompt, timeout)
+        except asyncio.TimeoutError:
+            print("Web search timed out.")
+            return web_error("Web search timed out. Try again later.")
         except Exception as e:
-            print(f"URL extraction failed: {e}")
-            urls = []
+            print(f"Web search failed: {e}")
+            return web_error("Web search failed. Try again later.")
 
-        return {
-            "answer": answer_text,
-            "source": urls if urls else ["Web / Search"],
-            "type": "Web Search"
-        }
+        return parse_web_answer(answer_obj)
 
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         # Final fallback (never let the backend crash)
-        print(f"Unexpected error in query_web(): {e}")
-        return {
-            "answer": "An unexpected error occurred during web search.",
-            "source": [],
-            "type": "Web Search Error"
-        }
+        print(f"Unexpected error in query_web_async(): {e}")
+        return web_error("An unexpected error occurred during web search.")
+
+
+async def astream_web(user_query: str):
+    """
+    Stream the web search answer text as it is generated. Errors are streamed as a message.
+    A cached answer is sent whole; a fresh, complete one is cached on the way out.
+    """
+    cached = web_response_cache.serve_cached(user_query, lambda: fetch_web_async(user_query), is_cacheable_web_answer)
+    if cached is not None:
+        print("Serving cached web search answer")
+        yield cached["answer"]
+        return
+
+    print("Streaming from query_web")
+    produced = False
+    parts = []
+    try:
+        with span("web_search"):
+            async for chunk in astream_with_timeout(web_search_llm(), web_prompt(user_query)):
+                text = chunk_text(chunk)
+                if text:
+                    produced = True
+                    parts.append(text)
+                    yield text
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Web search stream failed: {e}")
+        if not produced:
+            yield "Web search failed. Try again later."
+        return
+
+    if not produced:
+        yield "No relevant information found."
+        return
+
+    answer_text = "".join(parts).strip()
+    urls = re.findall(r'\((https?://[^\s)]+)\)', answer_text)
+    web_response_cache.store(user_query, {
+        "answer": answer_text,
+        "source": urls if urls else ["Web / Search"],
+        "type": "Web Search"
+    })